@@ -0,0 +1,64 @@
+import json
+
+import click
+
+from src.services.image_hash_index import MAX_DISTANCE, ImageHashIndex
+from src.services.shards import build_shards, list_images
+
+DEFAULT_SOURCES = [
+    '../web-scraper/dataset/web-category',
+    '../web-scraper/dataset/web-elements',
+]
+
+
+@click.command()
+@click.argument('sources', nargs=-1)
+@click.option('--output-folder', default='datasets/shards', help='Output folder of the shards')
+@click.option('--labels', default='../web-scraper/config/labels.json', help='Label classes of the dataset')
+@click.option('--imgsz', default=640, type=int, help='Size of the letterboxed images')
+@click.option('--shard-size', default=512, type=int, help='Number of images per shard')
+@click.option('--val-ratio', default=0.2, type=float, help='Part of the pages kept for validation')
+@click.option('--seed', default=0, type=int, help='Seed of the train/val split')
+@click.option('--workers', default=None, type=int, help='Number of decoding processes')
+@click.option('--dedupe', default=False, is_flag=True, help='Leave out exact and near-duplicate images')
+@click.option('--index', 'index_path', default='datasets/hash-index.sqlite', help='Hash index used by --dedupe')
+@click.option('--max-distance', default=MAX_DISTANCE, type=int, help='Max differing dHash bits of near-duplicates')
+def main(sources: tuple[str],
+         output_folder: str,
+         labels: str,
+         imgsz: int,
+         shard_size: int,
+         val_ratio: float,
+         seed: int,
+         workers: int | None,
+         dedupe: bool,
+         index_path: str,
+         max_distance: int):
+    sources = list(sources) or DEFAULT_SOURCES
+
+    exclude = set()
+    if dedupe:
+        index = ImageHashIndex(index_path)
+        index.update(list_images(sources), workers)
+        exclude = index.get_redundant_images(max_distance)
+        index.close()
+        print(f"{len(exclude)} duplicate images left out")
+
+    with open(labels, 'r') as f:
+        names = list(json.load(f).keys())
+
+    build_shards(
+        sources,
+        output_folder,
+        names,
+        imgsz=imgsz,
+        shard_size=shard_size,
+        val_ratio=val_ratio,
+        seed=seed,
+        workers=workers,
+        exclude=exclude,
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+import click
+
+from src.services.image_hash_index import MAX_DISTANCE, ImageHashIndex
+from src.services.shards import list_images
+
+DEFAULT_SOURCES = [
+    '../web-scraper/dataset',
+]
+
+
+@click.command()
+@click.argument('sources', nargs=-1)
+@click.option('--index', 'index_path', default='datasets/hash-index.sqlite', help='Hash index of the dataset')
+@click.option('--max-distance', default=MAX_DISTANCE, type=int, help='Max differing dHash bits of near-duplicates')
+@click.option('--link', default=False, is_flag=True, help='Replace exact duplicates by hardlinks')
+@click.option('--workers', default=None, type=int, help='Number of hashing processes')
+def main(sources: tuple[str], index_path: str, max_distance: int, link: bool, workers: int | None):
+    images = list_images(list(sources) or DEFAULT_SOURCES)
+
+    index = ImageHashIndex(index_path)
+    print(f"Indexing {len(images)} images...")
+    print(f" > {index.update(images, workers)} new or modified images hashed")
+
+    exact = index.get_exact_duplicates()
+    print(f"{len(exact)} groups of exact duplicates ({sum(len(group) - 1 for group in exact)} copies)")
+
+    near = index.get_near_duplicates(max_distance)
+    print(f"{len(near)} groups of near-duplicates ({sum(len(group) - 1 for group in near)} redundant images):")
+    for group in near:
+        print(f" > {group[0]}")
+        for path in group[1:]:
+            print(f"   ~ {path}")
+
+    if link:
+        freed = index.link_exact_duplicates()
+        print(f"Exact duplicates linked, {freed / 1024 / 1024:.1f} MB freed.")
+
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+import os
+import time
+
+import click
+
+from src.services.onnx_detector import CONFIDENCE_THRESHOLD, OnnxDetector, to_yolo_lines
+from src.services.page_source import open_page
+from src.services.tiled_inference import BATCH_SIZE, TILE_OVERLAP, TILE_SIZE, detect_page
+
+
+@click.command()
+@click.argument('pages', nargs=-1, required=True)
+@click.option('--model', default='yolov8n.onnx', help='ONNX model exported by ultralytics')
+@click.option('--conf', default=CONFIDENCE_THRESHOLD, type=float, help='Min confidence of the detections')
+@click.option('--threads', default=None, type=int, help='ONNX Runtime threads')
+@click.option('--tile-size', default=TILE_SIZE, type=int, help='Side of the tiles cut from the page, in pixels')
+@click.option('--overlap', default=TILE_OVERLAP, type=float, help='Part of each tile shared with its neighbours')
+@click.option('--batch-size', default=BATCH_SIZE, type=int, help='Tiles per batch')
+def main(pages: tuple[str],
+         model: str,
+         conf: float,
+         threads: int | None,
+         tile_size: int,
+         overlap: float,
+         batch_size: int):
+    """Label full-page screenshots (PNG, .npy, or the tiles of a page) with tiled inference."""
+
+    detector = OnnxDetector(model, conf=conf, threads=threads)
+
+    for path in pages:
+        start = time.perf_counter()
+
+        page = open_page(path)
+        detections = detect_page(detector, page, tile_size, overlap, batch_size)
+        page.close()
+
+        label_file = f"{os.path.splitext(path)[0]}.txt"
+        with open(label_file, 'w') as f:
+            f.write('\n'.join(to_yolo_lines(detections, page.width, page.height)))
+
+        print(f" > {path} ({page.width}x{page.height}): {len(detections)} elements "
+              f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
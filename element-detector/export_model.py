@@ -0,0 +1,121 @@
+import json
+import os
+import shutil
+
+import click
+from ultralytics import YOLO
+
+from src.services.onnx_quantization import (BENCHMARK_RUNS, CALIBRATION_IMAGES, VARIANTS, get_input, measure_speed,
+                                            quantize_model, sample_calibration_tiles)
+from src.services.shard_dataset import ShardValidator
+
+CALIBRATION_SOURCES = ['../web-scraper/dataset/web-category']
+
+# Images used to time the models
+SPEED_IMAGES = 16
+
+
+@click.group()
+def main():
+    pass
+
+
+@main.command()
+@click.option('--weights', default='runs/detect/train/weights/best.pt', help='Trained model')
+@click.option('--output-folder', default='models', help='Folder of the exported models')
+@click.option('--imgsz', default=640, type=int, help='Fixed input size of the models')
+@click.option('--batch', default=1, type=int, help='Fixed batch size of the models (mAP is only measured at 1)')
+@click.option('--variant', 'variants', default=VARIANTS, multiple=True, type=click.Choice(VARIANTS),
+              help='Variants to export')
+@click.option('--calibration', 'calibration_sources', default=CALIBRATION_SOURCES, multiple=True,
+              help='Screenshot folders sampled to calibrate int8-static')
+@click.option('--calibration-images', default=CALIBRATION_IMAGES, type=int, help='Screenshots used to calibrate')
+@click.option('--seed', default=0, type=int, help='Seed of the calibration sample')
+def export(weights: str,
+           output_folder: str,
+           imgsz: int,
+           batch: int,
+           variants: tuple[str],
+           calibration_sources: tuple[str],
+           calibration_images: int,
+           seed: int):
+    """Export the FP32 model with a fixed input shape, and its quantized variants."""
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    # a fixed shape lets ONNX Runtime plan its memory and pick its kernels once
+    exported = YOLO(weights).export(format='onnx', imgsz=imgsz, batch=batch, dynamic=False, simplify=True)
+    model_path = os.path.join(output_folder, os.path.basename(exported))
+    shutil.move(exported, model_path)
+    print(f"Model exported to {model_path}")
+
+    tiles = None
+    if 'int8-static' in variants:
+        tiles = sample_calibration_tiles(list(calibration_sources), calibration_images, seed)
+        print(f"Calibrating on {len(tiles)} tiles...")
+
+    for variant in variants:
+        if variant == 'fp32':
+            continue
+
+        path = quantize_model(model_path, output_folder, variant, tiles)
+        print(f"{variant} model saved to {path}")
+
+
+@main.command()
+@click.argument('models', nargs=-1, required=True)
+@click.option('--data', default='datasets/shards/data.yaml', help='data.yaml generated by build_shards.py')
+@click.option('--threads', default=None, type=int, help='ONNX Runtime threads')
+@click.option('--runs', default=BENCHMARK_RUNS, type=int, help='Timed runs per model')
+@click.option('--images', 'image_sources', default=CALIBRATION_SOURCES, multiple=True,
+              help='Screenshot folders the timed tiles are cut from')
+@click.option('--report', default=None, help='Also write the measures to this JSON file')
+def compare(models: tuple[str],
+            data: str,
+            threads: int | None,
+            runs: int,
+            image_sources: tuple[str],
+            report: str | None):
+    """Measure the mAP and the CPU speed of exported models, side by side."""
+
+    tiles = sample_calibration_tiles(list(image_sources), SPEED_IMAGES)
+    results = []
+
+    for model in models:
+        _, batch, imgsz = get_input(model)
+        print(f"Evaluating {model}...")
+
+        result = {
+            "model": model,
+            "size_mb": os.path.getsize(model) / 1024 ** 2,
+            "map50": None,
+            "map50_95": None,
+        }
+
+        # ultralytics validates non PyTorch models one image at a time
+        if batch == 1:
+            metrics = YOLO(model, task='detect').val(validator=ShardValidator, data=data, imgsz=imgsz, batch=1,
+                                                     plots=False)
+            result['map50'], result['map50_95'] = float(metrics.box.map50), float(metrics.box.map)
+
+        result.update(measure_speed(model, tiles, threads, runs))
+        results.append(result)
+
+    print(f"{'model':<40} {'MB':>6} {'mAP50':>6} {'mAP50-95':>8} {'p50 ms':>7} {'p90 ms':>7} {'img/s':>6}")
+    for result in results:
+        map50 = f"{result['map50']:.3f}" if result['map50'] is not None else '-'
+        map50_95 = f"{result['map50_95']:.3f}" if result['map50_95'] is not None else '-'
+        print(
+            f"{os.path.basename(result['model']):<40} {result['size_mb']:>6.1f} {map50:>6} {map50_95:>8} "
+            f"{result['p50_ms']:>7.1f} {result['p90_ms']:>7.1f} {result['images_per_sec']:>6.1f}"
+        )
+
+    if report:
+        with open(report, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Report saved to {report}")
+
+
+if __name__ == '__main__':
+    main()
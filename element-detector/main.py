@@ -8,4 +8,4 @@ model = YOLO("yolov8n.pt")  # load a pretrained model (recommended for training)
 model.train(data="coco128.yaml", epochs=3)  # train the model
 metrics = model.val()  # evaluate model performance on the validation set
 results = model("https://ultralytics.com/images/bus.jpg")  # predict on an image
-path = model.export(format="onnx")  # export the model to ONNX format
\ No newline at end of file
+path = model.export(format="onnx", dynamic=True)  # export the model to ONNX format
\ No newline at end of file
@@ -0,0 +1,171 @@
+import io
+import json
+import os
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import click
+import numpy as np
+from PIL import Image
+
+from src.services.micro_batcher import MAX_BATCH, MAX_LATENCY_MS, PREPROCESS_WORKERS, MicroBatcher
+from src.services.onnx_detector import CONFIDENCE_THRESHOLD, OnnxDetector, to_yolo_lines
+from src.services.shards import list_images
+
+# Images in flight in directory mode, to bound the memory of preprocessed tensors
+MAX_PENDING_BATCHES = 4
+
+REPORT_EVERY = 100
+
+
+def print_stats(batcher: MicroBatcher):
+    stats = batcher.get_stats()
+    print(
+        f" > {stats['images']} images, {stats['images_per_sec']:.1f} img/s, "
+        f"p50 {stats['p50_ms']:.0f} ms, p99 {stats['p99_ms']:.0f} ms, "
+        f"mean batch {stats['mean_batch_size']:.1f}"
+    )
+
+
+def to_json(detections: np.ndarray, names: dict) -> list[dict]:
+    return [
+        {
+            "class": int(cls),
+            "name": names.get(int(cls), str(int(cls))),
+            "confidence": round(float(conf), 4),
+            "box": [round(float(value), 1) for value in (x1, y1, x2, y2)],
+        }
+        for x1, y1, x2, y2, conf, cls in detections
+    ]
+
+
+@click.group()
+@click.option('--model', default='yolov8n.onnx', help='ONNX model exported by ultralytics')
+@click.option('--conf', default=CONFIDENCE_THRESHOLD, type=float, help='Min confidence of the detections')
+@click.option('--threads', default=None, type=int, help='ONNX Runtime threads')
+@click.option('--max-batch', default=MAX_BATCH, type=int, help='Max images per batch')
+@click.option('--max-latency', default=MAX_LATENCY_MS, type=float, help='Max ms waiting for a batch to fill')
+@click.option('--preprocess-workers', default=PREPROCESS_WORKERS, type=int, help='Decoding threads')
+@click.pass_context
+def main(ctx: click.Context,
+         model: str,
+         conf: float,
+         threads: int | None,
+         max_batch: int,
+         max_latency: float,
+         preprocess_workers: int):
+    print(f"Loading {model}...")
+    detector = OnnxDetector(model, conf=conf, threads=threads)
+    ctx.obj = MicroBatcher(detector, max_batch, max_latency, preprocess_workers)
+
+
+@main.command()
+@click.argument('input_folder')
+@click.option('--output-folder', default=None, help='Folder of the YOLO labels (next to the images by default)')
+@click.pass_obj
+def directory(batcher: MicroBatcher, input_folder: str, output_folder: str | None):
+    """Label every image of a folder."""
+
+    images = list_images([input_folder])
+    print(f"Labeling {len(images)} images...")
+
+    pending = threading.BoundedSemaphore(batcher.max_batch * MAX_PENDING_BATCHES)
+    futures = []
+
+    for image in images:
+        pending.acquire()
+        future = batcher.submit(image)
+        future.add_done_callback(lambda _: pending.release())
+        futures.append((image, future))
+
+    for i, (image, future) in enumerate(futures):
+        try:
+            detections = future.result()
+        except Exception as e:
+            print(f"Cannot label {image}: {e}")
+            continue
+
+        with Image.open(image) as opened:
+            width, height = opened.size
+
+        label_folder = output_folder or os.path.dirname(image)
+        if not os.path.exists(label_folder):
+            os.makedirs(label_folder)
+
+        label_file = os.path.join(label_folder, f"{os.path.splitext(os.path.basename(image))[0]}.txt")
+        with open(label_file, 'w') as f:
+            f.write('\n'.join(to_yolo_lines(detections, width, height)))
+
+        if (i + 1) % REPORT_EVERY == 0:
+            print_stats(batcher)
+
+    batcher.close()
+    print_stats(batcher)
+
+
+@main.command()
+@click.option('--host', default='127.0.0.1', help='Listening address')
+@click.option('--port', default=8000, type=int, help='Listening port')
+@click.pass_obj
+def http(batcher: MicroBatcher, host: str, port: int):
+    """Serve POST /detect (image body, JSON detections) and GET /stats."""
+
+    names = batcher.detector.names
+
+    class Handler(BaseHTTPRequestHandler):
+        def send_json(self, status: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != '/stats':
+                return self.send_json(404, {"error": "not found"})
+
+            self.send_json(200, batcher.get_stats())
+
+        def do_POST(self):
+            if self.path != '/detect':
+                return self.send_json(404, {"error": "not found"})
+
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            try:
+                image = Image.open(io.BytesIO(body))
+                image.load()
+            except Exception as e:
+                return self.send_json(400, {"error": f"invalid image: {e}"})
+
+            try:
+                detections = batcher.submit(image).result()
+            except Exception as e:
+                return self.send_json(500, {"error": str(e)})
+
+            self.send_json(200, {"detections": to_json(detections, names)})
+
+        def log_message(self, format, *args):
+            # one line per request would drown the stats
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Listening on http://{host}:{port}")
+
+    # shutdown() waits for serve_forever to return, so it cannot run in the handler itself
+    signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=server.shutdown).start())
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        batcher.close()
+        print_stats(batcher)
+
+
+if __name__ == '__main__':
+    main()
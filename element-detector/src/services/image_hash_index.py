@@ -0,0 +1,228 @@
+import hashlib
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+# dHash of HASH_SIZE x HASH_SIZE bits, packed into an uint64
+HASH_SIZE = 8
+
+# Max number of differing dHash bits for two images to be near-duplicates
+MAX_DISTANCE = 4
+
+# Max number of image pairs compared at once when searching near-duplicates,
+# about 8 bytes of memory each
+COMPARE_PAIRS = 1 << 22
+
+# popcount of every byte value, for NumPy < 2 without np.bitwise_count
+BIT_COUNTS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(axis=1, dtype=np.uint8)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    sha256 TEXT NOT NULL,
+    dhash INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_sha256 ON images (sha256);
+"""
+
+
+def get_thumbnail(path: str) -> tuple[np.ndarray, str, int, int]:
+    """Return the grayscale (HASH_SIZE+1) x HASH_SIZE thumbnail and the sha256 of the file."""
+
+    with open(path, 'rb') as f:
+        sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    with Image.open(path) as image:
+        width, height = image.size
+
+        # shrinking by an integer factor first is much cheaper on 4K captures
+        factor = min(width // (HASH_SIZE * 8), height // (HASH_SIZE * 8))
+        if factor > 1:
+            image = image.reduce(factor)
+
+        thumbnail = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.BOX)
+
+    return np.asarray(thumbnail, dtype=np.int16), sha256, width, height
+
+
+def get_dhashes(thumbnails: np.ndarray) -> np.ndarray:
+    """Compute the dHash of a batch of (n, HASH_SIZE, HASH_SIZE+1) thumbnails at once."""
+
+    bits = thumbnails[:, :, 1:] > thumbnails[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+
+    return packed.view('>u8').ravel().astype(np.int64)
+
+
+def get_distances(hashes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """Hamming distances between two lists of dHashes, as a (len(hashes), len(others)) matrix."""
+
+    # unsigned: bitwise_count counts the bits of the absolute value of signed integers
+    xor = (hashes[:, np.newaxis] ^ others[np.newaxis, :]).view(np.uint64)
+
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(xor)
+
+    # at most 64 bits differ, the sum fits an uint8
+    return BIT_COUNTS[xor.view(np.uint8).reshape(*xor.shape, 8)].sum(axis=2, dtype=np.uint8)
+
+
+class ImageHashIndex:
+    """Persistent content and perceptual hash of every image of the dataset.
+
+    Files are only hashed again when their size or modification time changed.
+    """
+
+    def __init__(self, path: str):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+
+    def update(self, images: list[str], workers: int | None = None) -> int:
+        """Hash the new and modified images, forget the deleted ones. Return the number hashed."""
+
+        known = {
+            path: (size, mtime_ns)
+            for path, size, mtime_ns in self.connection.execute("SELECT path, size, mtime_ns FROM images")
+        }
+
+        stale = []
+        for image in images:
+            stat = os.stat(image)
+            if known.get(image) != (stat.st_size, stat.st_mtime_ns):
+                stale.append((image, stat))
+
+        removed = [path for path in known if not os.path.exists(path)]
+        with self.connection:
+            self.connection.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in removed])
+
+        if not stale:
+            return 0
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(get_thumbnail, [image for image, _ in stale], chunksize=8))
+
+        dhashes = get_dhashes(np.stack([thumbnail for thumbnail, _, _, _ in results]))
+
+        with self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO images (path, size, mtime_ns, sha256, dhash, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (image, stat.st_size, stat.st_mtime_ns, sha256, int(dhash), width, height)
+                    for (image, stat), (_, sha256, width, height), dhash in zip(stale, results, dhashes)
+                ],
+            )
+
+        return len(stale)
+
+    def get_exact_duplicates(self) -> list[list[str]]:
+        """Return the groups of byte-identical images, each sorted by path."""
+
+        groups: dict[str, list[str]] = dict()
+        for path, sha256 in self.connection.execute("SELECT path, sha256 FROM images ORDER BY path"):
+            groups.setdefault(sha256, []).append(path)
+
+        return [paths for paths in groups.values() if len(paths) > 1]
+
+    def get_near_duplicates(self, max_distance: int = MAX_DISTANCE) -> list[list[str]]:
+        """Return the groups of images whose dHashes differ by at most max_distance bits.
+
+        Only images of the same size are compared: the same page captured at
+        another resolution is not a duplicate. Byte-identical copies count as
+        a single image, groups are sorted by path.
+        """
+
+        rows = self.connection.execute(
+            "SELECT path, sha256, dhash, width, height FROM images ORDER BY path"
+        ).fetchall()
+
+        by_size: dict[tuple[int, int], dict[str, tuple[str, int]]] = dict()
+        for path, sha256, dhash, width, height in rows:
+            by_size.setdefault((width, height), dict()).setdefault(sha256, (path, dhash))
+
+        groups = []
+        for contents in by_size.values():
+            paths = [path for path, _ in contents.values()]
+            hashes = np.array([dhash for _, dhash in contents.values()], dtype=np.int64)
+
+            # union-find over the pairs close enough
+            parents = list(range(len(paths)))
+
+            def find(i: int) -> int:
+                while parents[i] != i:
+                    parents[i] = parents[parents[i]]
+                    i = parents[i]
+                return i
+
+            # fewer rows per chunk as the group grows, so that memory stays bounded
+            chunk = max(1, COMPARE_PAIRS // len(hashes))
+
+            for start in range(0, len(hashes), chunk):
+                distances = get_distances(hashes[start:start + chunk], hashes)
+
+                for i, j in zip(*np.nonzero(distances <= max_distance)):
+                    i += start
+                    if i < j:
+                        parents[find(j)] = find(i)
+
+            clusters: dict[int, list[str]] = dict()
+            for i, path in enumerate(paths):
+                clusters.setdefault(find(i), []).append(path)
+
+            groups += [sorted(cluster) for cluster in clusters.values() if len(cluster) > 1]
+
+        return sorted(groups)
+
+    def get_redundant_images(self, max_distance: int = MAX_DISTANCE) -> set[str]:
+        """Return every image but the first of each exact or near-duplicate group."""
+
+        redundant = set()
+        for group in self.get_exact_duplicates():
+            redundant.update(group[1:])
+
+        for group in self.get_near_duplicates(max_distance):
+            redundant.update(group[1:])
+
+        return redundant
+
+    def link_exact_duplicates(self) -> int:
+        """Replace the copies of each byte-identical group by hardlinks to its first file.
+
+        Return the number of bytes freed.
+        """
+
+        freed = 0
+
+        for original, *copies in self.get_exact_duplicates():
+            original_stat = os.stat(original)
+
+            for copy in copies:
+                if os.path.samefile(original, copy):
+                    continue
+
+                # linked next to the copy then renamed, so the copy is never missing
+                os.link(original, f"{copy}.link")
+                os.replace(f"{copy}.link", copy)
+                freed += original_stat.st_size
+
+                with self.connection:
+                    self.connection.execute(
+                        "UPDATE images SET size = ?, mtime_ns = ? WHERE path = ?",
+                        (original_stat.st_size, original_stat.st_mtime_ns, copy),
+                    )
+
+        return freed
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,29 @@
+import numpy as np
+from PIL import Image
+
+PAD_COLOR = (114, 114, 114)
+
+
+def letterbox(image: Image.Image, imgsz: int) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Resize the image to fit in an imgsz square, keeping its aspect ratio, and pad it.
+
+    Same convention as ultralytics (centered, gray padding). Returns the RGB
+    array, the resize ratio and the (left, top) padding.
+    """
+
+    width, height = image.size
+    ratio = min(imgsz / width, imgsz / height)
+    new_width, new_height = max(1, round(width * ratio)), max(1, round(height * ratio))
+
+    image = image.convert('RGB')
+    if (new_width, new_height) != (width, height):
+        image = image.resize((new_width, new_height), Image.BILINEAR)
+
+    left = round((imgsz - new_width) / 2 - 0.1)
+    top = round((imgsz - new_height) / 2 - 0.1)
+
+    canvas = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+    canvas[:] = PAD_COLOR
+    canvas[top:top + new_height, left:left + new_width] = np.asarray(image)
+
+    return canvas, ratio, (left, top)
@@ -0,0 +1,147 @@
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from src.services.onnx_detector import OnnxDetector
+
+MAX_BATCH = 8
+MAX_LATENCY_MS = 20
+PREPROCESS_WORKERS = 4
+
+# Latencies kept for the percentiles, the most recent ones
+STATS_WINDOW = 10000
+
+
+class MicroBatcher:
+    """Group the images submitted from any thread into batches for the detector.
+
+    Images are decoded and letterboxed in a thread pool. A batch is run as
+    soon as it holds max_batch images, or max_latency_ms after its first
+    image arrived, whichever comes first.
+    """
+
+    def __init__(self,
+                 detector: OnnxDetector,
+                 max_batch: int = MAX_BATCH,
+                 max_latency_ms: float = MAX_LATENCY_MS,
+                 preprocess_workers: int = PREPROCESS_WORKERS):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+
+        self.preprocessing = ThreadPoolExecutor(max_workers=preprocess_workers)
+        self.ready = queue.Queue()
+
+        self.lock = threading.Lock()
+        self.latencies: deque[float] = deque(maxlen=STATS_WINDOW)
+        self.images = 0
+        self.batches = 0
+        self.started_at = time.perf_counter()
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def submit(self, image: str | Image.Image) -> Future:
+        """Queue an image (or the path of an image), the future resolves to its detections."""
+
+        future = Future()
+        submitted_at = time.perf_counter()
+
+        self.preprocessing.submit(self.preprocess, image, future, submitted_at)
+        return future
+
+    def preprocess(self, image: str | Image.Image, future: Future, submitted_at: float):
+        try:
+            if isinstance(image, str):
+                with Image.open(image) as opened:
+                    tensor, ratio, pad = self.detector.preprocess(opened)
+            else:
+                tensor, ratio, pad = self.detector.preprocess(image)
+        except Exception as e:
+            future.set_exception(e)
+            return
+
+        self.ready.put((tensor, ratio, pad, future, submitted_at))
+
+    def run(self):
+        while self.running:
+            try:
+                batch = [self.ready.get(timeout=0.1)]
+            except queue.Empty:
+                continue
+
+            deadline = time.perf_counter() + self.max_latency
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+
+                try:
+                    batch.append(self.ready.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self.run_batch(batch)
+
+    def run_batch(self, batch: list[tuple]):
+        tensors, ratios, pads, futures, submitted = zip(*batch)
+
+        try:
+            detections = self.detector.predict(list(tensors), list(ratios), list(pads))
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        done_at = time.perf_counter()
+        with self.lock:
+            self.latencies.extend(done_at - submitted_at for submitted_at in submitted)
+            self.images += len(batch)
+            self.batches += 1
+
+        for future, detection in zip(futures, detections):
+            future.set_result(detection)
+
+    def get_stats(self) -> dict:
+        """Throughput since the batcher started (or was reset), latency percentiles of the last STATS_WINDOW images."""
+
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            images, batches = self.images, self.batches
+
+        elapsed = time.perf_counter() - self.started_at
+
+        return {
+            "images": images,
+            "batches": batches,
+            "mean_batch_size": images / batches if batches else 0.0,
+            "images_per_sec": images / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+    def reset_stats(self):
+        with self.lock:
+            self.latencies.clear()
+            self.images = 0
+            self.batches = 0
+            self.started_at = time.perf_counter()
+
+    def close(self):
+        self.preprocessing.shutdown(wait=True)
+        self.running = False
+        self.thread.join()
+
+        # images queued before closing are still run
+        batch = []
+        while not self.ready.empty():
+            batch.append(self.ready.get())
+            if len(batch) == self.max_batch or self.ready.empty():
+                self.run_batch(batch)
+                batch = []
@@ -0,0 +1,166 @@
+import ast
+
+import numpy as np
+import onnxruntime
+from PIL import Image
+
+from src.services.letterbox import letterbox
+
+CONFIDENCE_THRESHOLD = 0.25
+IOU_THRESHOLD = 0.45
+MAX_DETECTIONS = 300
+
+
+def nms(boxes: np.ndarray,
+        scores: np.ndarray,
+        iou_threshold: float = IOU_THRESHOLD,
+        over_smaller: bool = False) -> np.ndarray:
+    """Return the indexes of the boxes (x1, y1, x2, y2) kept by non-maximum suppression.
+
+    With over_smaller, the overlap is divided by the area of the smaller box
+    instead of the union, so that a box cut in part is suppressed by the whole one.
+    """
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+
+    while len(order) > 0:
+        i = order[0]
+        keep.append(i)
+
+        x1 = np.maximum(boxes[i, 0], boxes[order[1:], 0])
+        y1 = np.maximum(boxes[i, 1], boxes[order[1:], 1])
+        x2 = np.minimum(boxes[i, 2], boxes[order[1:], 2])
+        y2 = np.minimum(boxes[i, 3], boxes[order[1:], 3])
+
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+        if over_smaller:
+            iou = intersection / (np.minimum(areas[i], areas[order[1:]]) + 1e-9)
+        else:
+            iou = intersection / (areas[i] + areas[order[1:]] - intersection + 1e-9)
+
+        order = order[1:][iou <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes: np.ndarray,
+                scores: np.ndarray,
+                classes: np.ndarray,
+                iou_threshold: float = IOU_THRESHOLD,
+                over_smaller: bool = False) -> np.ndarray:
+    """NMS per class: boxes of different classes are moved apart so that they never overlap."""
+
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    offsets = classes[:, np.newaxis] * (boxes.max() + 1)
+    return nms(boxes + offsets, scores, iou_threshold, over_smaller)
+
+
+def to_yolo_lines(detections: np.ndarray, width: int, height: int) -> list[str]:
+    """Convert detections to YOLO label lines for an image of the given size."""
+    return [
+        f"{int(cls)} "
+        f"{(x1 + x2) / 2 / width:.6f} "
+        f"{(y1 + y2) / 2 / height:.6f} "
+        f"{(x2 - x1) / width:.6f} "
+        f"{(y2 - y1) / height:.6f}"
+        for x1, y1, x2, y2, _, cls in detections
+    ]
+
+
+def preprocess_image(image: Image.Image, imgsz: int) -> tuple[np.ndarray, float, tuple[int, int]]:
+    """Letterbox the image into the CHW float tensor expected by the model."""
+
+    pixels, ratio, pad = letterbox(image, imgsz)
+    tensor = np.ascontiguousarray(pixels.transpose(2, 0, 1), dtype=np.float32) / 255
+
+    return tensor, ratio, pad
+
+
+class OnnxDetector:
+    """YOLOv8 model exported to ONNX, run on CPU with ONNX Runtime.
+
+    Export the model with dynamic=True to run whole batches in one call,
+    models with a fixed batch size are run in chunks of that size.
+    Detections are arrays of (x1, y1, x2, y2, confidence, class) rows, in
+    pixels of the original image.
+    """
+
+    def __init__(self,
+                 model_path: str,
+                 conf: float = CONFIDENCE_THRESHOLD,
+                 iou: float = IOU_THRESHOLD,
+                 threads: int | None = None):
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        self.input = self.session.get_inputs()[0]
+        self.conf = conf
+        self.iou = iou
+
+        batch, _, height, _ = self.input.shape
+        self.batch_size = batch if isinstance(batch, int) else None
+        self.imgsz = height if isinstance(height, int) else 640
+
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata['names']) if 'names' in metadata else dict()
+
+    def preprocess(self, image: Image.Image) -> tuple[np.ndarray, float, tuple[int, int]]:
+        return preprocess_image(image, self.imgsz)
+
+    def predict(self, tensors: list[np.ndarray], ratios: list[float], pads: list[tuple[int, int]]) -> list[np.ndarray]:
+        """Run the model on preprocessed images and return the detections of each one."""
+
+        batch = np.stack(tensors)
+
+        if self.batch_size is None:
+            outputs = self.session.run(None, {self.input.name: batch})[0]
+        else:
+            # a fixed batch size only takes full batches: the last one is padded with zeros
+            missing = -len(batch) % self.batch_size
+            padded = np.concatenate([batch, np.zeros((missing, *batch.shape[1:]), dtype=batch.dtype)])
+
+            outputs = np.concatenate([
+                self.session.run(None, {self.input.name: padded[i:i + self.batch_size]})[0]
+                for i in range(0, len(padded), self.batch_size)
+            ])[:len(batch)]
+
+        return [
+            self.postprocess(output, ratio, pad)
+            for output, ratio, pad in zip(outputs, ratios, pads)
+        ]
+
+    def postprocess(self, output: np.ndarray, ratio: float, pad: tuple[int, int]) -> np.ndarray:
+        # (4 + classes, anchors) -> one row per anchor
+        output = output.T
+        scores = output[:, 4:]
+
+        classes = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), classes]
+
+        mask = confidences > self.conf
+        output, classes, confidences = output[mask], classes[mask], confidences[mask]
+
+        cx, cy, w, h = output[:, 0], output[:, 1], output[:, 2], output[:, 3]
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+        keep = batched_nms(boxes, confidences, classes, self.iou)[:MAX_DETECTIONS]
+        boxes, classes, confidences = boxes[keep], classes[keep], confidences[keep]
+
+        # back to the pixels of the original image
+        boxes[:, [0, 2]] -= pad[0]
+        boxes[:, [1, 3]] -= pad[1]
+        boxes /= ratio
+
+        return np.concatenate([boxes, confidences[:, np.newaxis], classes[:, np.newaxis]], axis=1)
+
+    def detect(self, images: list[Image.Image]) -> list[np.ndarray]:
+        """Preprocess and run a batch of images."""
+
+        tensors, ratios, pads = zip(*[self.preprocess(image) for image in images])
+        return self.predict(list(tensors), list(ratios), list(pads))
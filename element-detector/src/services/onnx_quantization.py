@@ -0,0 +1,177 @@
+import os
+import random
+import re
+import time
+
+import numpy as np
+import onnx
+import onnxruntime
+from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType,
+                                      quantize_dynamic, quantize_static)
+from onnxruntime.quantization.shape_inference import quant_pre_process
+from PIL import Image
+
+from src.services.onnx_detector import preprocess_image
+from src.services.shards import list_images
+from src.services.tiled_inference import TILE_SIZE, get_tile_positions
+
+VARIANTS = ('fp32', 'int8-dynamic', 'int8-static')
+
+CALIBRATION_IMAGES = 128
+
+# Runs measured after the warmup ones, for the latency percentiles
+BENCHMARK_RUNS = 50
+WARMUP_RUNS = 5
+
+# Node names of the ultralytics exports: /model.{layer}/...
+LAYER_NAME = re.compile(r'^/model\.(\d+)/')
+
+
+def sample_calibration_tiles(sources: list[str], count: int = CALIBRATION_IMAGES, seed: int = 0) -> list[Image.Image]:
+    """Pick count screenshots of the sources and cut a random tile of each, as tiled inference sees them.
+
+    Pages are much taller than the model input: letterboxing a whole page
+    would calibrate on text a few pixels high.
+    """
+
+    rng = random.Random(seed)
+    paths = list_images(sources)
+    paths = rng.sample(paths, min(count, len(paths)))
+
+    tiles = []
+    for path in paths:
+        with Image.open(path) as image:
+            width, height = min(TILE_SIZE, image.width), min(TILE_SIZE, image.height)
+            x = rng.choice(get_tile_positions(image.width, width, 0))
+            y = rng.choice(get_tile_positions(image.height, height, 0))
+            tiles.append(image.crop((x, y, x + width, y + height)).convert('RGB'))
+
+    return tiles
+
+
+class TileCalibrationReader(CalibrationDataReader):
+    """Feed the calibration tiles to the quantizer, in batches of the model input size."""
+
+    def __init__(self, tiles: list[Image.Image], input_name: str, imgsz: int, batch_size: int):
+        tensors = [preprocess_image(tile, imgsz)[0] for tile in tiles]
+
+        # a fixed batch size needs full batches
+        tensors = tensors[:len(tensors) - len(tensors) % batch_size] or tensors[:batch_size]
+
+        self.batches = iter([
+            {input_name: np.stack(tensors[i:i + batch_size])}
+            for i in range(0, len(tensors), batch_size)
+        ])
+
+    def get_next(self) -> dict | None:
+        return next(self.batches, None)
+
+
+def get_input(model_path: str) -> tuple[str, int, int]:
+    """Name, batch size and image size of the (fixed shape) model input."""
+
+    model = onnx.load(model_path, load_external_data=False)
+    dims = model.graph.input[0].type.tensor_type.shape.dim
+    batch, size = dims[0].dim_value, dims[2].dim_value
+
+    if not batch or not size:
+        raise ValueError(f"{model_path} has a dynamic input shape, export it with a fixed batch and imgsz")
+
+    return model.graph.input[0].name, batch, size
+
+
+def get_head_nodes(model_path: str) -> list[str]:
+    """Nodes of the detection head that decode the boxes, after its last convolutions.
+
+    The DFL softmax and the anchor arithmetic work on box coordinates of up
+    to imgsz: at 8 bits they lose most of the localisation accuracy, for a
+    negligible share of the compute, so they are left in float.
+    """
+
+    model = onnx.load(model_path, load_external_data=False)
+    layers = [int(match.group(1)) for node in model.graph.node if (match := LAYER_NAME.match(node.name))]
+    if not layers:
+        return []
+
+    head = f"/model.{max(layers)}/"
+    return [node.name for node in model.graph.node if node.name.startswith(head) and node.op_type != 'Conv']
+
+
+def quantize_model(model_path: str, output_folder: str, variant: str, tiles: list[Image.Image] | None = None) -> str:
+    """Write the variant of the FP32 model to output_folder and return its path.
+
+    int8-dynamic quantizes the weights only and the activations on the fly,
+    int8-static uses scales calibrated on tiles (QDQ, per channel weights).
+    """
+
+    output = os.path.join(output_folder, f"{os.path.splitext(os.path.basename(model_path))[0]}-{variant}.onnx")
+
+    if variant == 'fp32':
+        return model_path
+
+    # shape inference and constant folding, recommended before quantizing
+    prepared = os.path.join(output_folder, 'prepared.onnx')
+    quant_pre_process(model_path, prepared, skip_symbolic_shape=True)
+
+    try:
+        if variant == 'int8-dynamic':
+            # ConvInteger only has a kernel for uint8 weights on CPU
+            quantize_dynamic(prepared, output, weight_type=QuantType.QUInt8)
+        elif variant == 'int8-static':
+            if not tiles:
+                raise ValueError("int8-static needs calibration tiles")
+
+            input_name, batch_size, imgsz = get_input(model_path)
+            quantize_static(
+                prepared,
+                output,
+                TileCalibrationReader(tiles, input_name, imgsz, batch_size),
+                quant_format=QuantFormat.QDQ,
+                activation_type=QuantType.QUInt8,
+                weight_type=QuantType.QInt8,
+                per_channel=True,
+                calibrate_method=CalibrationMethod.MinMax,
+                nodes_to_exclude=get_head_nodes(prepared),
+            )
+        else:
+            raise ValueError(f"Unknown variant {variant}, available: {', '.join(VARIANTS)}")
+    finally:
+        os.remove(prepared)
+
+    return output
+
+
+def measure_speed(model_path: str,
+                  tiles: list[Image.Image],
+                  threads: int | None = None,
+                  runs: int = BENCHMARK_RUNS) -> dict:
+    """Time the model on CPU, one input batch per run.
+
+    Returns the p50/p90 latency of a run in ms and the throughput in images
+    per second, preprocessing excluded.
+    """
+
+    options = onnxruntime.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+
+    session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+    input_name, batch_size, imgsz = get_input(model_path)
+
+    tensors = [preprocess_image(tile, imgsz)[0] for tile in tiles[:batch_size]]
+    batch = np.stack((tensors * batch_size)[:batch_size])
+
+    for _ in range(WARMUP_RUNS):
+        session.run(None, {input_name: batch})
+
+    latencies = []
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        session.run(None, {input_name: batch})
+        latencies.append(time.perf_counter() - started_at)
+
+    return {
+        "p50_ms": float(np.percentile(latencies, 50)) * 1000,
+        "p90_ms": float(np.percentile(latencies, 90)) * 1000,
+        "images_per_sec": batch_size * len(latencies) / sum(latencies),
+    }
@@ -0,0 +1,232 @@
+import glob
+import io
+import os
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Compressed bytes read from the file at once
+READ_SIZE = 1 << 16
+
+# Channels of each PNG color type: gray, rgb, palette, gray+alpha, rgba
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+class PageSource:
+    """Full-page screenshot read as horizontal bands of RGB rows, top to bottom.
+
+    Sources only keep the rows still needed in memory, bands must be
+    requested with a top that never goes back up.
+    """
+
+    width: int
+    height: int
+
+    def get_rows(self, top: int, bottom: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class ArrayPageSource(PageSource):
+    """Page already in a (height, width, 3) uint8 array."""
+
+    def __init__(self, pixels: np.ndarray):
+        self.pixels = pixels
+        self.height, self.width = pixels.shape[:2]
+
+    def get_rows(self, top: int, bottom: int) -> np.ndarray:
+        return self.pixels[top:bottom]
+
+
+class NpyPageSource(ArrayPageSource):
+    """Page saved with NumPy, memory-mapped."""
+
+    def __init__(self, path: str):
+        super().__init__(np.load(path, mmap_mode='r'))
+
+
+class TilesPageSource(PageSource):
+    """Page cut in fixed-height tiles by the web-scraper (screenshot-000.png, screenshot-001.png...).
+
+    Only the tiles overlapping the requested band are decoded.
+    """
+
+    def __init__(self, paths: list[str]):
+        self.paths = paths
+        self.offsets = []
+        self.height = 0
+
+        for path in paths:
+            with Image.open(path) as tile:
+                self.width = tile.width
+                self.offsets.append(self.height)
+                self.height += tile.height
+
+        self.tiles: dict[int, np.ndarray] = dict()
+
+    def get_rows(self, top: int, bottom: int) -> np.ndarray:
+        band = []
+
+        for i, offset in enumerate(self.offsets):
+            end = self.offsets[i + 1] if i + 1 < len(self.offsets) else self.height
+
+            if end <= top:
+                self.tiles.pop(i, None)
+                continue
+            if offset >= bottom:
+                break
+
+            if i not in self.tiles:
+                with Image.open(self.paths[i]) as tile:
+                    self.tiles[i] = np.asarray(tile.convert('RGB'))
+
+            band.append(self.tiles[i][max(top, offset) - offset:min(bottom, end) - offset])
+
+        return np.concatenate(band)
+
+
+class PngPageSource(PageSource):
+    """PNG decoded progressively, without ever holding the whole page in memory.
+
+    The scanlines are inflated as a stream. Each band is unfiltered by Pillow
+    as a small PNG, built from the filtered scanlines of the band preceded by
+    the last decoded row, which the Up/Average/Paeth filters refer to.
+    Interlaced or non 8-bit PNGs cannot be streamed and are decoded at once.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, 'rb')
+        if self.file.read(8) != PNG_SIGNATURE:
+            raise ValueError(f"{path} is not a PNG file")
+
+        self.header = b''
+        self.palette_chunks = []
+        self.idat_remaining = 0
+
+        # reads the chunks up to the image data
+        while True:
+            length, chunk_type = struct.unpack('>I4s', self.file.read(8))
+
+            if chunk_type == b'IDAT':
+                self.idat_remaining = length
+                break
+
+            data = self.file.read(length)
+            self.file.read(4)
+
+            if chunk_type == b'IHDR':
+                self.header = data
+            elif chunk_type in (b'PLTE', b'tRNS'):
+                self.palette_chunks.append((chunk_type, data))
+            elif chunk_type == b'IEND':
+                raise ValueError(f"{path} has no image data")
+
+        self.width, self.height, bit_depth, color_type, _, _, interlace = struct.unpack('>IIBBBBB', self.header)
+        self.row_bytes = self.width * PNG_CHANNELS[color_type] + 1
+
+        self.pixels = None
+        if interlace or bit_depth != 8:
+            self.file.close()
+            with Image.open(path) as image:
+                self.pixels = np.asarray(image.convert('RGB'))
+
+        self.decompressor = zlib.decompressobj()
+        self.pending = bytearray()
+        self.previous_row = bytes(self.row_bytes - 1)
+
+        # decoded rows kept from buffer_top, for the overlap of the next band
+        self.buffer = np.empty((0, self.width, 3), dtype=np.uint8)
+        self.buffer_top = 0
+
+    def get_rows(self, top: int, bottom: int) -> np.ndarray:
+        if self.pixels is not None:
+            return self.pixels[top:bottom]
+
+        if top < self.buffer_top:
+            raise ValueError(f"row {top} was already released")
+
+        bottom = min(bottom, self.height)
+        decoded = self.buffer_top + len(self.buffer)
+
+        if bottom > decoded:
+            self.buffer = np.concatenate([self.buffer, self.decode_rows(bottom - decoded)])
+
+        self.buffer = self.buffer[top - self.buffer_top:]
+        self.buffer_top = top
+
+        return self.buffer[:bottom - top]
+
+    def read_scanlines(self, count: int) -> bytes:
+        """Inflate the next filtered scanlines of the image."""
+
+        size = count * self.row_bytes
+
+        while len(self.pending) < size:
+            if self.idat_remaining == 0:
+                self.file.read(4)
+                length, chunk_type = struct.unpack('>I4s', self.file.read(8))
+
+                if chunk_type != b'IDAT':
+                    raise ValueError("truncated PNG image data")
+                self.idat_remaining = length
+
+            data = self.file.read(min(READ_SIZE, self.idat_remaining))
+            self.idat_remaining -= len(data)
+            self.pending += self.decompressor.decompress(data)
+
+        scanlines = bytes(self.pending[:size])
+        del self.pending[:size]
+
+        return scanlines
+
+    def decode_rows(self, count: int) -> np.ndarray:
+        scanlines = self.read_scanlines(count)
+
+        # the previous row, unfiltered, becomes the first row of the band
+        chunks = [
+            (b'IHDR', struct.pack('>II', self.width, count + 1) + self.header[8:]),
+            *self.palette_chunks,
+            (b'IDAT', zlib.compress(b'\x00' + self.previous_row + scanlines, 0)),
+            (b'IEND', b''),
+        ]
+
+        band = io.BytesIO(PNG_SIGNATURE + b''.join(
+            struct.pack('>I', len(data)) + chunk_type + data
+            + struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF)
+            for chunk_type, data in chunks
+        ))
+
+        with Image.open(band) as image:
+            image.load()
+            self.previous_row = image.crop((0, count, self.width, count + 1)).tobytes()
+            return np.asarray(image.convert('RGB'))[1:]
+
+    def close(self):
+        self.file.close()
+
+
+def open_page(path: str) -> PageSource:
+    """Open a page saved as .npy, as PNG, or as the tiles of a PNG (page-000.png, page-001.png...)."""
+
+    if path.endswith('.npy'):
+        return NpyPageSource(path)
+
+    if not os.path.exists(path):
+        root, extension = os.path.splitext(path)
+        tiles = sorted(glob.glob(f"{glob.escape(root)}-[0-9][0-9][0-9]{extension}"))
+
+        if tiles:
+            return TilesPageSource(tiles)
+
+    if path.lower().endswith('.png'):
+        return PngPageSource(path)
+
+    # other formats cannot be decoded by parts
+    with Image.open(path) as image:
+        return ArrayPageSource(np.asarray(image.convert('RGB')))
@@ -0,0 +1,103 @@
+import os
+from copy import copy
+
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from src.services.shards import ShardIndex
+
+
+class ShardDataset(YOLODataset):
+    """YOLO dataset reading the letterboxed images and labels of built shards.
+
+    Nothing is decoded during training: images are views of the memory-mapped
+    shards and labels come from the shard index. Images are already at their
+    final size, so their original shape is the shard image size.
+    """
+
+    def __init__(self, *args, data=None, **kwargs):
+        self.shards = ShardIndex(os.path.join(data['path'], data['shards']))
+        super().__init__(*args, data=data, **kwargs)
+
+    def get_img_files(self, img_path):
+        with open(img_path, 'r') as f:
+            im_files = [line.strip() for line in f if line.strip()]
+
+        if self.fraction < 1:
+            im_files = im_files[:round(len(im_files) * self.fraction)]
+
+        return im_files
+
+    def get_labels(self):
+        size = self.shards.imgsz
+        labels = []
+
+        for im_file in self.im_files:
+            label = self.shards.get_labels(im_file)
+            labels.append({
+                'im_file': im_file,
+                'shape': (size, size),
+                'cls': label[:, 0:1],
+                'bboxes': label[:, 1:],
+                'segments': [],
+                'keypoints': None,
+                'normalized': True,
+                'bbox_format': 'xywh',
+            })
+
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        image = self.shards.get_image(self.im_files[i])
+
+        # mosaic picks its other images in the buffer, like BaseDataset.load_image fills it.
+        # Views of the shards cost no memory, so self.ims is left empty.
+        if self.augment:
+            self.buffer.append(i)
+            if len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+
+        return image, image.shape[:2], image.shape[:2]
+
+    def cache_images_to_disk(self, i):
+        # shards are already on disk, ready to be loaded
+        pass
+
+
+def build_shard_dataset(cfg, img_path, batch, data, mode='train', rect=False, stride=32) -> ShardDataset:
+    """Same as ultralytics build_yolo_dataset, with a ShardDataset."""
+
+    return ShardDataset(
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == 'train',
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        cache=cfg.cache or None,
+        single_cls=cfg.single_cls or False,
+        stride=int(stride),
+        pad=0.0 if mode == 'train' else 0.5,
+        prefix=colorstr(f'{mode}: '),
+        classes=cfg.classes,
+        data=data,
+        fraction=cfg.fraction if mode == 'train' else 1.0,
+    )
+
+
+class ShardValidator(DetectionValidator):
+    def build_dataset(self, img_path, mode='val', batch=None):
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode, stride=self.stride)
+
+
+class ShardTrainer(DetectionTrainer):
+    def build_dataset(self, img_path, mode='train', batch=None):
+        stride = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        return build_shard_dataset(self.args, img_path, batch, self.data, mode=mode, rect=mode == 'val', stride=stride)
+
+    def get_validator(self):
+        self.loss_names = 'box_loss', 'cls_loss', 'dfl_loss'
+        return ShardValidator(self.test_loader, save_dir=self.save_dir, args=copy(self.args), _callbacks=self.callbacks)
+
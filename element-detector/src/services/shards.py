@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from src.services.letterbox import letterbox
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp')
+
+# Screenshots are named {url_slug}-{width}x{height}-{resolution}.png
+RESOLUTION_SUFFIX = re.compile(r'-\d+x\d+-[^-]+$')
+
+
+def list_images(sources: list[str]) -> list[str]:
+    """List every image of the source folders, in a stable order."""
+
+    images = []
+    for source in sources:
+        for root, _, files in os.walk(source):
+            for file in files:
+                if file.lower().endswith(IMAGE_EXTENSIONS):
+                    images.append(os.path.normpath(os.path.join(root, file)))
+
+    return sorted(images)
+
+
+def get_page_key(path: str) -> str:
+    """Identify the captured page, so that all its resolutions land in the same split."""
+    return RESOLUTION_SUFFIX.sub('', os.path.splitext(os.path.basename(path))[0])
+
+
+def get_split(path: str, val_ratio: float, seed: int = 0) -> str:
+    """Assign the image to train or val from a hash of its page, reproducible across builds."""
+
+    digest = hashlib.sha1(f"{seed}:{get_page_key(path)}".encode()).digest()
+    fraction = int.from_bytes(digest[:8], 'big') / 2 ** 64
+
+    return 'val' if fraction < val_ratio else 'train'
+
+
+def read_labels(path: str) -> list[list[float]]:
+    """Read the YOLO label file next to the image, if any."""
+
+    label_file = f"{os.path.splitext(path)[0]}.txt"
+    if not os.path.exists(label_file):
+        return []
+
+    with open(label_file, 'r') as f:
+        return [[float(value) for value in line.split()] for line in f if line.strip()]
+
+
+def prepare_image(args: tuple[str, int]) -> tuple[np.ndarray, dict]:
+    """Decode and letterbox one image, and move its labels into the letterboxed frame."""
+
+    path, imgsz = args
+
+    with Image.open(path) as image:
+        width, height = image.size
+        pixels, ratio, (left, top) = letterbox(image, imgsz)
+
+    labels = []
+    for cls, cx, cy, w, h in read_labels(path):
+        labels.append([
+            int(cls),
+            (cx * width * ratio + left) / imgsz,
+            (cy * height * ratio + top) / imgsz,
+            w * width * ratio / imgsz,
+            h * height * ratio / imgsz,
+        ])
+
+    meta = {
+        "source": path,
+        "shape": [height, width],
+        "ratio": ratio,
+        "pad": [left, top],
+        "labels": labels,
+    }
+
+    # stored as BGR, like cv2.imread, which the ultralytics pipeline expects
+    return pixels[..., ::-1], meta
+
+
+def build_shards(sources: list[str],
+                 output_folder: str,
+                 names: list[str],
+                 imgsz: int = 640,
+                 shard_size: int = 512,
+                 val_ratio: float = 0.2,
+                 seed: int = 0,
+                 workers: int | None = None,
+                 exclude: set[str] | None = None) -> dict:
+    """Letterbox every image of the sources into memory-mappable .npy shards.
+
+    Writes shard-NNN.npy files of shape (n, imgsz, imgsz, 3), an index.json
+    describing every image, the train.txt/val.txt splits and a data.yaml for
+    ultralytics. Images listed in exclude are skipped.
+    """
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    images = [image for image in list_images(sources) if not exclude or image not in exclude]
+    print(f"Building shards of {len(images)} images at {imgsz}px...")
+
+    index = {
+        "imgsz": imgsz,
+        "names": names,
+        "shards": [],
+        "images": [],
+    }
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(prepare_image, [(image, imgsz) for image in images], chunksize=8)
+
+        shard = None
+        for i, (pixels, meta) in enumerate(results):
+            offset = i % shard_size
+
+            if offset == 0:
+                if shard is not None:
+                    shard.flush()
+
+                shard_file = f"shard-{len(index['shards']):03d}.npy"
+                shard = np.lib.format.open_memmap(
+                    os.path.join(output_folder, shard_file),
+                    mode='w+',
+                    dtype=np.uint8,
+                    shape=(min(shard_size, len(images) - i), imgsz, imgsz, 3),
+                )
+                index['shards'].append(shard_file)
+                print(f" > {shard_file}")
+
+            shard[offset] = pixels
+
+            meta['shard'] = len(index['shards']) - 1
+            meta['offset'] = offset
+            meta['split'] = get_split(meta['source'], val_ratio, seed)
+            index['images'].append(meta)
+
+        if shard is not None:
+            shard.flush()
+
+    with open(os.path.join(output_folder, 'index.json'), 'w') as f:
+        json.dump(index, f)
+
+    for split in ('train', 'val'):
+        with open(os.path.join(output_folder, f"{split}.txt"), 'w') as f:
+            f.write('\n'.join(image['source'] for image in index['images'] if image['split'] == split))
+
+    write_data_yaml(output_folder, names)
+
+    nb_val = sum(1 for image in index['images'] if image['split'] == 'val')
+    print(f"Shards successfully built: {len(images) - nb_val} train, {nb_val} val images.")
+
+    return index
+
+
+def write_data_yaml(output_folder: str, names: list[str]):
+    with open(os.path.join(output_folder, 'data.yaml'), 'w') as f:
+        f.write(f"path: {os.path.abspath(output_folder)}\n")
+        f.write("train: train.txt\n")
+        f.write("val: val.txt\n")
+        f.write("shards: index.json\n")
+        f.write("names:\n")
+        for i, name in enumerate(names):
+            f.write(f"  {i}: {name}\n")
+
+
+class ShardIndex:
+    """Read access to the images of built shards, without copying them."""
+
+    def __init__(self, path: str):
+        self.folder = os.path.dirname(path)
+
+        with open(path, 'r') as f:
+            index = json.load(f)
+
+        self.imgsz = index['imgsz']
+        self.names = index['names']
+        self.shard_files = index['shards']
+        self.entries = {image['source']: image for image in index['images']}
+        self.shards: dict[int, np.ndarray] = dict()
+
+    def get_image(self, source: str) -> np.ndarray:
+        """Return the letterboxed BGR image as a read-only view of its memory-mapped shard."""
+
+        entry = self.entries[source]
+
+        # opened lazily, each dataloader worker maps the shards on its own
+        if entry['shard'] not in self.shards:
+            self.shards[entry['shard']] = np.load(
+                os.path.join(self.folder, self.shard_files[entry['shard']]),
+                mmap_mode='r',
+            )
+
+        return self.shards[entry['shard']][entry['offset']]
+
+    def get_labels(self, source: str) -> np.ndarray:
+        """Return the labels of the image as a (n, 5) array of class, cx, cy, w, h."""
+        return np.array(self.entries[source]['labels'], dtype=np.float32).reshape(-1, 5)
@@ -0,0 +1,119 @@
+import numpy as np
+from PIL import Image
+
+from src.services.onnx_detector import OnnxDetector, batched_nms
+from src.services.page_source import PageSource
+
+# Side of the square tiles cut from the page, in page pixels
+TILE_SIZE = 1280
+
+# Part of each tile shared with its neighbours
+TILE_OVERLAP = 0.2
+
+BATCH_SIZE = 8
+
+# Boxes this close to an inner edge of their tile are cut by the seam
+SEAM_EDGE_PX = 2
+
+# A cut box mostly covered by a box of the same class from another tile is dropped
+SEAM_OVERLAP = 0.6
+
+
+def get_tile_positions(length: int, tile_size: int, overlap: float) -> list[int]:
+    """Return the start of each tile along one axis, the last tile ending on the page edge."""
+
+    if length <= tile_size:
+        return [0]
+
+    step = max(1, int(tile_size * (1 - overlap)))
+    positions = list(range(0, length - tile_size, step))
+
+    return positions + [length - tile_size]
+
+
+def detect_page(detector: OnnxDetector,
+                page: PageSource,
+                tile_size: int = TILE_SIZE,
+                overlap: float = TILE_OVERLAP,
+                batch_size: int = BATCH_SIZE) -> np.ndarray:
+    """Detect the elements of a page taller or wider than the model input, tile by tile.
+
+    The page is read band by band, each band cut into overlapping tiles run
+    in batches. Boxes are moved back to page coordinates and merged across
+    the seams. Returns (x1, y1, x2, y2, confidence, class) rows in page pixels.
+    """
+
+    tile_width, tile_height = min(tile_size, page.width), min(tile_size, page.height)
+    columns = get_tile_positions(page.width, tile_width, overlap)
+
+    detections = []
+    pending = []
+
+    def run_pending():
+        results = detector.detect([tile for tile, _, _, _ in pending])
+
+        for (_, x, y, edges), result in zip(pending, results):
+            result[:, [0, 2]] = result[:, [0, 2]].clip(0, tile_width)
+            result[:, [1, 3]] = result[:, [1, 3]].clip(0, tile_height)
+
+            cut = np.zeros(len(result), dtype=bool)
+            for axis, low, high in edges:
+                if low:
+                    cut |= result[:, axis] <= SEAM_EDGE_PX
+                if high:
+                    cut |= result[:, axis + 2] >= (tile_width, tile_height)[axis] - SEAM_EDGE_PX
+
+            result[:, [0, 2]] += x
+            result[:, [1, 3]] += y
+            detections.append(np.concatenate([result, cut[:, np.newaxis]], axis=1))
+
+        pending.clear()
+
+    for top in get_tile_positions(page.height, tile_height, overlap):
+        band = page.get_rows(top, top + tile_height)
+
+        for left in columns:
+            tile = Image.fromarray(np.ascontiguousarray(band[:, left:left + tile_width]))
+
+            # inner edges of the tile, where it meets its neighbours
+            edges = [
+                (0, left > 0, left + tile_width < page.width),
+                (1, top > 0, top + tile_height < page.height),
+            ]
+            pending.append((tile, left, top, edges))
+
+            if len(pending) == batch_size:
+                run_pending()
+
+    if pending:
+        run_pending()
+
+    return merge_tile_detections(np.concatenate(detections), detector.iou)
+
+
+def merge_tile_detections(detections: np.ndarray, iou: float) -> np.ndarray:
+    """Merge the detections of overlapping tiles.
+
+    The same element seen by two tiles is removed by NMS. Elements cut by a
+    seam are only partly seen by one of the tiles: that part is dropped when
+    a box of the same class from the other tile mostly covers it.
+    """
+
+    boxes, confidences, classes, cut = detections[:, :4], detections[:, 4], detections[:, 5], detections[:, 6] > 0
+
+    keep = batched_nms(boxes, confidences, classes, iou)
+    boxes, confidences, classes, cut = boxes[keep], confidences[keep], classes[keep], cut[keep]
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    dropped = np.zeros(len(boxes), dtype=bool)
+
+    for i in np.nonzero(cut)[0]:
+        others = (classes == classes[i]) & (areas > areas[i]) & ~dropped
+
+        width = np.minimum(boxes[i, 2], boxes[others, 2]) - np.maximum(boxes[i, 0], boxes[others, 0])
+        height = np.minimum(boxes[i, 3], boxes[others, 3]) - np.maximum(boxes[i, 1], boxes[others, 1])
+        covered = width.clip(0) * height.clip(0) / max(areas[i], 1e-9)
+
+        dropped[i] = (covered >= SEAM_OVERLAP).any()
+
+    return np.concatenate([boxes, confidences[:, np.newaxis], classes[:, np.newaxis]], axis=1)[~dropped]
@@ -0,0 +1,34 @@
+import json
+import os
+
+import click
+from ultralytics import YOLO
+
+from src.services.shard_dataset import ShardTrainer
+
+
+@click.command()
+@click.option('--data', default='datasets/shards/data.yaml', help='data.yaml generated by build_shards.py')
+@click.option('--model', default='yolov8n.pt', help='Model to start from')
+@click.option('--epochs', default=100, type=int, help='Number of epochs')
+@click.option('--batch', default=16, type=int, help='Batch size')
+@click.option('--workers', default=8, type=int, help='Number of dataloader workers')
+@click.option('--cache', default=False, is_flag=True, help='Also keep the shard images in RAM')
+def main(data: str, model: str, epochs: int, batch: int, workers: int, cache: bool):
+    # imgsz comes from the shards, images are already letterboxed to it
+    with open(os.path.join(os.path.dirname(data), 'index.json'), 'r') as f:
+        imgsz = json.load(f)['imgsz']
+
+    YOLO(model).train(
+        data=data,
+        trainer=ShardTrainer,
+        imgsz=imgsz,
+        epochs=epochs,
+        batch=batch,
+        workers=workers,
+        cache='ram' if cache else False,
+    )
+
+
+if __name__ == '__main__':
+    main()
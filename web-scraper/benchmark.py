@@ -0,0 +1,301 @@
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import click
+from PIL import Image
+from selenium import webdriver
+
+import screenshot
+from src.models.Resolution import Resolution
+from src.services import web_camera
+from src.services.device_emulation import clear_emulation, emulate_resolution
+from src.services.fixture_site import FIXTURE_PAGES, FixtureSite
+from src.services.resource_blocking import (DEFAULT_PROFILE, apply_blocking, enable_network_log, get_network_stats,
+                                            load_blocking_profile, reset_network_stats)
+
+DETECTOR_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'element-detector')
+
+PROFILES = {resolution['name']: resolution for resolution in screenshot.MOBILE_RESOLUTIONS}
+DEFAULT_PROFILES = ['720p', '4K', 'iPhone SE']
+
+# How each variant captures a page, writing its output in the current folder
+VARIANTS = {
+    'stitch': lambda driver, resolution, url, parallax: screenshot.take_screenshot(
+        driver, resolution, url, True, parallax),
+    'register': lambda driver, resolution, url, parallax: screenshot.take_screenshot(
+        driver, resolution, url, True, parallax, register=True),
+    'stream': lambda driver, resolution, url, parallax: screenshot.take_screenshot(
+        driver, resolution, url, True, parallax, register=True, stream=True),
+    'cdp-fullpage': lambda driver, resolution, url, parallax: screenshot.take_screenshot(
+        driver, resolution, url, True, parallax, engine='cdp-fullpage'),
+    'camera': lambda driver, resolution, url, parallax: web_camera.take_screenshots(
+        driver, url, 'screenshots', [resolution], fullscreen=True),
+    'camera-cdp': lambda driver, resolution, url, parallax: web_camera.take_screenshots(
+        driver, url, 'screenshots', [resolution], fullscreen=True, engine='cdp-fullpage'),
+}
+
+# Interval between two memory samples
+RSS_SAMPLE_S = 0.01
+
+
+class PeakRssSampler:
+    """Track the peak resident memory of this process (not of Chrome) while a stage runs."""
+
+    def __init__(self):
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+    def get_rss(self) -> int:
+        try:
+            with open('/proc/self/statm', 'r') as f:
+                return int(f.read().split()[1]) * self.page_size
+        except OSError:
+            # lifetime peak only, where /proc is not available
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, self.get_rss())
+            time.sleep(RSS_SAMPLE_S)
+
+    def __enter__(self) -> 'PeakRssSampler':
+        self.peak = self.get_rss()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, self.get_rss())
+
+
+def count_frames(driver: webdriver.Chrome) -> dict:
+    """Count the screenshots taken by the driver, whatever the capture path."""
+
+    counter = {"frames": 0}
+
+    def counted(method, is_frame=lambda *args: True):
+        def wrapper(*args, **kwargs):
+            if is_frame(*args):
+                counter['frames'] += 1
+            return method(*args, **kwargs)
+        return wrapper
+
+    # save_screenshot goes through get_screenshot_as_png, counting it too would count its frames twice
+    driver.get_screenshot_as_png = counted(driver.get_screenshot_as_png)
+    driver.execute_cdp_cmd = counted(driver.execute_cdp_cmd, lambda cmd, *args: cmd == 'Page.captureScreenshot')
+
+    return counter
+
+
+def list_outputs(folder: str) -> dict[str, int]:
+    if not os.path.exists(folder):
+        return dict()
+
+    return {
+        os.path.join(folder, file): os.path.getsize(os.path.join(folder, file))
+        for file in os.listdir(folder)
+        if file.endswith('.png')
+    }
+
+
+def run_detector(detector, paths: list[str]) -> dict:
+    from src.services.page_source import open_page
+    from src.services.tiled_inference import detect_page
+
+    start = time.perf_counter()
+    with PeakRssSampler() as rss:
+        detections = 0
+        for path in paths:
+            page = open_page(path)
+            detections += len(detect_page(detector, page))
+            page.close()
+
+    return {
+        "wall_s": round(time.perf_counter() - start, 3),
+        "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+        "detections": detections,
+    }
+
+
+def get_version() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'describe', '--always', '--dirty'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(previous_path: str, current: dict):
+    """Print the wall time, memory and size changes against a previous report."""
+
+    with open(previous_path, 'r') as f:
+        previous = {
+            (result['page'], result['profile'], result['variant']): result
+            for result in json.load(f)['results']
+        }
+
+    print(f"Compared to {previous_path}:")
+    for result in current['results']:
+        before = previous.get((result['page'], result['profile'], result['variant']))
+        if before is None or 'error' in result or 'error' in before:
+            continue
+
+        changes = []
+        for key in ('wall_s', 'peak_rss_mb', 'output_bytes', 'frames'):
+            if before.get(key):
+                changes.append(f"{key} {(result[key] - before[key]) / before[key] * 100:+.0f}%")
+
+        print(f" > {result['page']:<9} {result['profile']:<10} {result['variant']:<13} {', '.join(changes)}")
+
+
+@click.command()
+@click.option('--output', default='var/benchmark.json', help='JSON report')
+@click.option('--page', 'pages', multiple=True, type=click.Choice(list(FIXTURE_PAGES)), help='Fixture pages (all by default)')
+@click.option('--profile', 'profiles', multiple=True, type=click.Choice(list(PROFILES)), help='Resolution profiles')
+@click.option('--variant', 'variants', multiple=True, type=click.Choice(list(VARIANTS)), help='Capture variants (all by default)')
+@click.option('--model', default=None, help='Also run the tiled detector of element-detector with this ONNX model')
+@click.option('--compare', 'previous', default=None, help='Previous JSON report to compare with')
+@click.option('--blocking', default=DEFAULT_PROFILE, help='Profile of config/blocking.json applied to the browser')
+@click.option('--keep-outputs', default=False, is_flag=True, help='Keep the screenshots in var/benchmark/')
+def main(output: str,
+         pages: tuple[str],
+         profiles: tuple[str],
+         variants: tuple[str],
+         model: str | None,
+         previous: str | None,
+         blocking: str,
+         keep_outputs: bool):
+    """Benchmark the capture engines, and the detector, on the local fixture pages."""
+
+    pages = pages or tuple(FIXTURE_PAGES)
+    profiles = profiles or tuple(DEFAULT_PROFILES)
+    variants = variants or tuple(VARIANTS)
+
+    detector = None
+    if model is not None:
+        sys.path.append(DETECTOR_FOLDER)
+        from src.services.onnx_detector import OnnxDetector
+        detector = OnnxDetector(model)
+
+    output = os.path.abspath(output)
+    previous = os.path.abspath(previous) if previous else None
+    root = os.getcwd()
+    work_folder = tempfile.mkdtemp(prefix='benchmark-')
+
+    options = webdriver.ChromeOptions()
+    options.add_argument(f'--user-data-dir={os.path.join(work_folder, "chrome")}')
+    options.add_argument('--headless')
+    enable_network_log(options)
+
+    print("Initializing Chrome driver...")
+    driver = webdriver.Chrome(options=options)
+    frames = count_frames(driver)
+
+    block_patterns = load_blocking_profile(blocking)
+    if block_patterns:
+        apply_blocking(driver, block_patterns)
+
+    report = {
+        "version": get_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "blocking": blocking,
+        "results": [],
+    }
+
+    try:
+        with FixtureSite() as site:
+            for profile in profiles:
+                resolution = Resolution(PROFILES[profile])
+
+                for page in pages:
+                    for variant in variants:
+                        run_folder = os.path.join(work_folder, f"{page}-{profile}-{variant}".replace(' ', '_'))
+                        # screenshot.py saves to screenshots/ of the working directory
+                        os.makedirs(os.path.join(run_folder, 'screenshots'))
+                        os.chdir(run_folder)
+
+                        # web_camera sizes the window itself
+                        if variant.startswith('camera'):
+                            clear_emulation(driver)
+                            driver.set_window_size(resolution['width'], resolution['height'])
+                        else:
+                            emulate_resolution(driver, resolution)
+
+                        result = {"page": page, "profile": profile, "variant": variant}
+                        print(f"Benchmarking {page} / {profile} / {variant}...")
+
+                        frames['frames'] = 0
+                        reset_network_stats(driver)
+                        start = time.perf_counter()
+                        try:
+                            with PeakRssSampler() as rss:
+                                VARIANTS[variant](driver, resolution, site.get_url(page), page == 'parallax')
+                        except Exception as e:
+                            result['error'] = str(e)
+                        finally:
+                            os.chdir(root)
+
+                        outputs = list_outputs(os.path.join(run_folder, 'screenshots'))
+                        result.update({
+                            "wall_s": round(time.perf_counter() - start, 3),
+                            "frames": frames['frames'],
+                            "peak_rss_mb": round(rss.peak / 1024 / 1024, 1),
+                            "output_bytes": sum(outputs.values()),
+                            "outputs": len(outputs),
+                        })
+
+                        network = get_network_stats(driver)
+                        if network is not None:
+                            result.update({
+                                "requests": network['requests'],
+                                "blocked": network['blocked'],
+                                "transferred_bytes": network['bytes'],
+                            })
+
+                        if outputs:
+                            with Image.open(next(iter(outputs))) as image:
+                                result['width'], result['height'] = image.size
+
+                        if detector is not None and outputs:
+                            result['detector'] = run_detector(detector, list(outputs))
+
+                        report['results'].append(result)
+                        print(f" > {result['wall_s']:.2f}s, {result['frames']} frames, "
+                              f"{result['peak_rss_mb']} MB peak, {result['output_bytes'] / 1024:.0f} KB")
+    finally:
+        driver.quit()
+
+        if keep_outputs:
+            shutil.copytree(work_folder, os.path.join(root, 'var', 'benchmark'), dirs_exist_ok=True,
+                            ignore=shutil.ignore_patterns('chrome'))
+        shutil.rmtree(work_folder, ignore_errors=True)
+
+    if not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark report saved to {output}")
+
+    if previous is not None:
+        compare(previous, report)
+
+
+if __name__ == '__main__':
+    main()
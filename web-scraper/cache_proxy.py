@@ -0,0 +1,31 @@
+import signal
+import threading
+
+import click
+
+from src.services.http_cache import CACHE_FOLDER, CACHE_MODES, CachingProxy
+
+
+@click.command()
+@click.option('--folder', default=CACHE_FOLDER, help='Response store shared by every run')
+@click.option('--mode', default='cache', type=click.Choice(CACHE_MODES), help='cache, record or offline replay')
+@click.option('--host', default='127.0.0.1', help='Listening address')
+@click.option('--port', default=8899, type=int, help='Listening port')
+@click.option('--max-age', default=None, type=float, help='Fetch again the responses older than N seconds (cache mode)')
+def main(folder: str, mode: str, host: str, port: int, max_age: float | None):
+    """Run the HTTP cache proxy shared by the browsers of several capture runs (--proxy host:port)."""
+
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *args: stopped.set())
+
+    with CachingProxy(folder, mode, host, port, max_age) as proxy:
+        try:
+            stopped.wait()
+        except KeyboardInterrupt:
+            pass
+
+        proxy.print_summary()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import click
+from selenium import webdriver
+
+from src.services.capture_pipeline import MAX_BATCH, MAX_LATENCY_MS, QUEUE_SIZE, CapturePipeline
+from src.services.chrome_driver import copy_profile
+from src.services.page_readiness import READY_TIMEOUT_S, print_readiness_summary, reset_readiness_summary
+
+# element-detector shares the src namespace, its services are imported from there
+DETECTOR_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'element-detector')
+
+
+def get_chrome_options(width: int, height: int, user_data_dir: str) -> webdriver.ChromeOptions:
+    options = webdriver.ChromeOptions()
+    options.add_argument(f'--user-data-dir={user_data_dir}')
+    options.add_argument('--profile-directory=Default')
+    options.add_argument(f"--window-size={width},{height}")
+    options.add_argument('--headless')
+    return options
+
+
+@click.command()
+@click.argument('urls_file', type=click.Path(exists=True))
+@click.option('--model', default='../element-detector/yolov8n.onnx', help='ONNX model exported by ultralytics')
+@click.option('--output', default='var/monitor.jsonl', help='JSON lines file receiving the detections')
+@click.option('--browsers', default=1, type=int, help='Number of parallel Chrome instances')
+@click.option('--queue-size', default=QUEUE_SIZE, type=int, help='Frames waiting for detection before capture pauses')
+@click.option('--max-batch', default=MAX_BATCH, type=int, help='Max frames per detection batch')
+@click.option('--max-latency', default=MAX_LATENCY_MS, type=float, help='Max ms waiting for a batch to fill')
+@click.option('--width', default=1280, type=int, help='Window width')
+@click.option('--height', default=720, type=int, help='Window height')
+@click.option('--fullscreen', default=False, is_flag=True, help='Capture the whole page instead of the viewport')
+@click.option('--ready-timeout', default=READY_TIMEOUT_S, type=float, help='Max seconds to wait for a page to be ready')
+@click.option('--save-folder', default=None, help='Also save the frames as PNG in this folder')
+@click.option('--interval', default=0, type=float, help='Capture the URLs again every N seconds (once by default)')
+def main(urls_file: str,
+         model: str,
+         output: str,
+         browsers: int,
+         queue_size: int,
+         max_batch: int,
+         max_latency: float,
+         width: int,
+         height: int,
+         fullscreen: bool,
+         ready_timeout: float,
+         save_folder: str | None,
+         interval: float):
+    """Monitor the pages of a URL list: capture them and detect their elements without writing any file."""
+
+    sys.path.append(DETECTOR_FOLDER)
+    from src.services.onnx_detector import OnnxDetector
+
+    with open(urls_file, 'r') as f:
+        urls = [line.strip() for line in f if line.strip()]
+
+    print(f"Loading {model}...")
+    detector = OnnxDetector(model)
+
+    def create_driver(browser_id: int) -> webdriver.Chrome:
+        user_data_dir = copy_profile('.google-chrome', f"var/monitor-{browser_id}")
+        return webdriver.Chrome(options=get_chrome_options(width, height, user_data_dir))
+
+    pipeline = CapturePipeline(
+        create_driver,
+        detector.detect,
+        nb_browsers=browsers,
+        queue_size=queue_size,
+        max_batch=max_batch,
+        max_latency_ms=max_latency,
+        fullscreen=fullscreen,
+        ready_timeout=ready_timeout,
+        save_folder=save_folder,
+    )
+
+    if os.path.dirname(output) and not os.path.exists(os.path.dirname(output)):
+        os.makedirs(os.path.dirname(output))
+
+    with open(output, 'a') as f:
+        def on_result(result: dict):
+            result['detections'] = [
+                {
+                    "class": int(cls),
+                    "name": detector.names.get(int(cls), str(int(cls))),
+                    "confidence": round(float(conf), 4),
+                    "box": [round(float(value), 1) for value in (x1, y1, x2, y2)],
+                }
+                for x1, y1, x2, y2, conf, cls in result['detections']
+            ]
+            result['time'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            print(f" > {result['url']}: {len(result['detections'])} elements in {result['latency_ms']:.0f} ms")
+
+        try:
+            while True:
+                started_at = time.perf_counter()
+                asyncio.run(pipeline.run(urls, on_result))
+
+                stats = pipeline.get_stats()
+                print(
+                    f"{stats['detected']} pages detected, {stats['failed']} failed, "
+                    f"p50 {stats['p50_ms']:.0f} ms, p99 {stats['p99_ms']:.0f} ms, "
+                    f"mean batch {stats['mean_batch_size']:.1f}, capture paused {stats['queue_full']} times"
+                )
+
+                # totals of this pass only, they would otherwise grow for as long as the monitor runs
+                print_readiness_summary()
+                reset_readiness_summary()
+                pipeline.reset_stats()
+
+                if not interval:
+                    break
+                time.sleep(max(0.0, interval - (time.perf_counter() - started_at)))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            pipeline.close()
+
+
+if __name__ == '__main__':
+    main()
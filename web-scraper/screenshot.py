@@ -1,7 +1,7 @@
+import io
 import math
 import os
 import shutil
-import time
 
 import click
 import selenium
@@ -10,6 +10,19 @@ from selenium import webdriver
 from selenium.common import WebDriverException
 
 from src.models.Resolution import Resolution
+from src.services.capture_engine import CAPTURE_ENGINES, capture_full_page
+from src.services.chrome_driver import is_browser_alive
+from src.services.device_emulation import emulate_resolution
+from src.services.dom_labels import collect_boxes, load_label_classes, to_yolo_lines, write_class_map, write_labels
+from src.services.frame_registration import find_fixed_bands, find_vertical_offset, get_row_hashes
+from src.services.http_cache import CACHE_MODES, CachingProxy, use_proxy
+from src.services.image_encoder import (ENCODER_WORKERS, JPEG_QUALITY, OUTPUT_FORMATS, PNG_COMPRESS_LEVEL, ImageEncoder,
+                                        save_image)
+from src.services.metrics import (close_metrics, configure_metrics, increment, print_metrics_summary,
+                                  set_metrics_context, span, timed, write_prometheus)
+from src.services.page_readiness import READY_TIMEOUT_S, print_readiness_summary, wait_for_page_ready
+from src.services.resampling import to_css_pixels
+from src.services.strip_writer import CanvasWriter, StripWriter, open_strip_writer
 
 MOBILE_RESOLUTIONS = [
     Resolution(name='iPhone SE', width=375, height=667, pixel_ratio=2, is_touch=True),
@@ -28,17 +41,178 @@ MOBILE_RESOLUTIONS = [
     Resolution(name='8K', width=7680, height=4320, pixel_ratio=1),
 ]
 
+RESOLUTIONS_BY_NAME = {resolution['name']: resolution for resolution in MOBILE_RESOLUTIONS}
+
 CHUNK_SIZE_PX = 300
 DEAD_ZONE_PX = 100
 
+# zlib level of the intermediate frames of --debug, read back right away
+DEBUG_COMPRESS_LEVEL = 1
+
+# Rows kept in common between two registered frames to measure their offset
+REGISTRATION_OVERLAP_PX = 100
+MAX_FRAMES = 200
+
 
 @click.command()
-@click.argument('url', type=str, required=True)
+@click.argument('url', type=str, required=False)
+@click.option('--urls-file', default=None, help='Capture every URL of this file (one per line), without prompting')
+@click.option('--resolution', 'resolution_names', multiple=True, type=click.Choice(list(RESOLUTIONS_BY_NAME)),
+              help='Resolution to capture, by name (repeatable), without prompting')
+@click.option('--attach', default=None, help='Reuse a running Chrome started with --remote-debugging-port (host:port)')
 @click.option('--skip', default=False, is_flag=True)
 @click.option('--parallax', default=False, is_flag=True)
-def main(url: str, skip: bool, parallax: bool):
-    """Script to take a screenshot of a URL using Selenium with Chrome."""
+@click.option('--debug', default=False, is_flag=True, help='Keep intermediate frames on disk (var/)')
+@click.option('--engine', default='stitch', type=click.Choice(CAPTURE_ENGINES), help='Full page capture engine')
+@click.option('--ready-timeout', default=READY_TIMEOUT_S, type=float, help='Max seconds to wait for a page to be ready')
+@click.option('--emulate', default=False, is_flag=True, help='Emulate the device through DevTools instead of at launch')
+@click.option('--register', default=False, is_flag=True, help='Measure the offset between frames instead of a fixed geometry')
+@click.option('--scroll-step', default=None, type=int, help='Scroll step in px with --register (default: adaptive)')
+@click.option('--stream', default=False, is_flag=True, help='Encode the PNG while scrolling, with bounded memory (with --register)')
+@click.option('--tile-height', default=None, type=int, help='Save the page as tiles of this height, with bounded memory (with --register)')
+@click.option('--max-height', default=None, type=int, help='Cap the screenshot height in px')
+@click.option('--labels', default=False, is_flag=True, help='Write YOLO labels of the page elements next to the screenshot')
+@click.option('--keep-native', default=False, is_flag=True, help='Keep the device pixels of HiDPI screens (training data)')
+@click.option('--format', 'output_format', default='png', type=click.Choice(list(OUTPUT_FORMATS)),
+              help='Screenshot format: png, lossless webp, jpeg or raw npy array for the detector')
+@click.option('--compress-level', default=PNG_COMPRESS_LEVEL, type=click.IntRange(0, 9), help='PNG zlib level')
+@click.option('--quality', default=JPEG_QUALITY, type=click.IntRange(1, 100), help='JPEG quality')
+@click.option('--encoder-workers', default=ENCODER_WORKERS, type=int, help='Threads encoding the screenshots')
+@click.option('--http-cache', default=None, type=click.Choice(CACHE_MODES),
+              help='Serve the page from the local response cache (replay: offline, from a recording only)')
+@click.option('--proxy', default=None, help='Use a running cache_proxy.py (host:port) instead')
+@click.option('--metrics', 'metrics_path', default=None, help='Write the timing of every stage to this JSON lines file')
+@click.option('--prometheus', 'prometheus_path', default=None, help='Dump stage histograms and counters in Prometheus format')
+def main(url: str | None,
+         urls_file: str | None,
+         resolution_names: tuple[str],
+         attach: str | None,
+         skip: bool,
+         parallax: bool,
+         debug: bool,
+         engine: str,
+         ready_timeout: float,
+         emulate: bool,
+         register: bool,
+         scroll_step: int | None,
+         stream: bool,
+         tile_height: int | None,
+         max_height: int | None,
+         labels: bool,
+         keep_native: bool,
+         output_format: str,
+         compress_level: int,
+         quality: int,
+         encoder_workers: int,
+         http_cache: str | None,
+         proxy: str | None,
+         metrics_path: str | None,
+         prometheus_path: str | None):
+    """Script to take a screenshot of a URL using Selenium with Chrome.
+
+    With --urls-file or --resolution, every URL is captured at every
+    resolution without prompting, reusing one browser (or the one given by
+    --attach) and switching resolutions through device emulation.
+    """
+
+    urls = [url] if url else []
+    if urls_file is not None:
+        urls += read_urls(urls_file)
+
+    if not urls:
+        raise click.UsageError("Give a URL or --urls-file.")
+
+    if (stream or tile_height) and not register:
+        raise click.UsageError("--stream and --tile-height write the page from the registered stitcher, add --register.")
+
+    if metrics_path or prometheus_path:
+        configure_metrics(metrics_path)
+
+    batch = urls_file is not None or len(resolution_names) > 0
+    if batch:
+        # nobody is there to answer prompts, and one browser serves every resolution
+        resolutions = [RESOLUTIONS_BY_NAME[name] for name in resolution_names] or [MOBILE_RESOLUTIONS[4]]
+        skip = True
+        emulate = emulate or len(resolutions) > 1
+    else:
+        resolutions = [select_resolution()]
+
+    # an attached browser was launched without the device settings
+    emulate = emulate or attach is not None
+
+    label_classes = None
+    if labels:
+        label_classes = load_label_classes()
+        write_class_map('screenshots', label_classes)
+
+    cache_proxy = None
+    if http_cache is not None:
+        cache_proxy = CachingProxy(mode=http_cache).start()
+        proxy = cache_proxy.get_address()
+
+    # screenshots are encoded while the browser moves on to the next page
+    encoder = ImageEncoder(output_format, compress_level, quality, encoder_workers)
+
+    driver = create_driver(resolutions[0], emulate, attach, proxy)
+
+    browser_lost = False
 
+    try:
+        for resolution in resolutions:
+            if browser_lost:
+                break
+
+            # Switch width, height, pixel ratio and touch on the live tab
+            if emulate:
+                emulate_resolution(driver, resolution)
+
+            for i, page_url in enumerate(urls):
+                if batch:
+                    print(f"[{resolution['name']}] {i + 1}/{len(urls)}")
+
+                try:
+                    take_screenshot(driver, resolution, page_url, skip, parallax, debug, engine, ready_timeout,
+                                    register, scroll_step, stream, tile_height, max_height, label_classes,
+                                    encoder, keep_native)
+                except Exception as e:
+                    print(f"An error occurred: {e}")
+                    increment('failures')
+
+                    # a crashed browser is replaced, the next URLs keep going
+                    if not is_browser_alive(driver):
+                        # an attached browser cannot be relaunched from here
+                        if attach is not None:
+                            print(f"The browser attached on {attach} is gone, stopping at {resolution['name']} "
+                                  f"{i + 1}/{len(urls)}. Restart it and run again.")
+                            browser_lost = True
+                            break
+
+                        close_driver(driver, attach)
+                        driver = create_driver(resolution, emulate, attach, proxy)
+                        if emulate:
+                            emulate_resolution(driver, resolution)
+    finally:
+        close_driver(driver, attach)
+        encoder.close()
+
+        if cache_proxy is not None:
+            cache_proxy.print_summary()
+            cache_proxy.close()
+
+    print_readiness_summary()
+    print_metrics_summary()
+
+    if prometheus_path:
+        write_prometheus(prometheus_path)
+    close_metrics()
+
+
+def read_urls(urls_file: str) -> list[str]:
+    with open(urls_file, 'r') as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith('#')]
+
+
+def select_resolution() -> Resolution:
     # find the resolution of the device
     resolution = MOBILE_RESOLUTIONS[4]
 
@@ -56,15 +230,37 @@ def main(url: str, skip: bool, parallax: bool):
         else:
             raise Exception("Invalid choice, using default resolution.")
 
+    return resolution
+
+
+def create_driver(resolution: Resolution,
+                  emulate: bool,
+                  attach: str | None = None,
+                  proxy: str | None = None) -> webdriver.Chrome:
+    """Launch Chrome for the resolution, or attach to a running one (host:port of its debugging port).
+
+    The proxy (host:port of the HTTP cache) only applies to launched browsers.
+    """
+
+    options = webdriver.ChromeOptions()
+
+    if attach is not None:
+        # the running browser keeps its own profile, window and flags
+        print(f"Attaching to Chrome on {attach}...")
+        options.add_experimental_option('debuggerAddress', attach)
+        return webdriver.Chrome(options=options)
+
     # Load the user profile to avoid cookie popups
     # (you need to accept the cookies manually the first time)
     # (you can use config/categories/homepage to find all websites)
-    options = webdriver.ChromeOptions()
     options.add_argument('--user-data-dir=.google-chrome')
     options.add_argument('--profile-directory=.google-profile')
     options.add_argument(f"--window-size={resolution['width']},{resolution['height']}")
 
-    if 'is_touch' in resolution and resolution['is_touch']:
+    if proxy is not None:
+        use_proxy(options, proxy)
+
+    if not emulate and 'is_touch' in resolution and resolution['is_touch']:
         options.add_experimental_option(
             "mobileEmulation",
             {
@@ -81,32 +277,59 @@ def main(url: str, skip: bool, parallax: bool):
 
     # Initialize the Chrome driver
     print("Initializing Chrome driver...")
-    driver = webdriver.Chrome(options=options)
-
-    # read each file in the folder dataset/categories
-    # for each file, take a screenshot of the urls in the file
-    # save the screenshot in the folder dataset/{category_name}/
-    try:
-        take_screenshot(driver, resolution, url, skip, parallax)
-    except Exception as e:
-        print(f"An error occurred: {e}")
-    finally:
-        # Close the browser
-        driver.quit()
+    return webdriver.Chrome(options=options)
 
 
-def resize_screenshot(input_file: str, resolution: Resolution):
-    im = Image.open(input_file)
-    im = im.resize((resolution['width'], resolution['height']), Image.ADAPTIVE)
-    im.save(input_file)
+def close_driver(driver: webdriver.Chrome, attach: str | None = None):
+    try:
+        if attach is None:
+            # Close the browser
+            driver.quit()
+        else:
+            # leave the attached browser running for the next run, only stop chromedriver
+            driver.service.stop()
+    except WebDriverException:
+        pass
 
 
 def take_screenshot(driver: webdriver.Chrome,
                     resolution: Resolution,
                     url: str,
                     skip: bool,
-                    parallax: bool):
-    """Take a screenshot of the specified URL using the specified driver."""
+                    parallax: bool,
+                    debug: bool = False,
+                    engine: str = 'stitch',
+                    ready_timeout: float = READY_TIMEOUT_S,
+                    register: bool = False,
+                    scroll_step: int | None = None,
+                    stream: bool = False,
+                    tile_height: int | None = None,
+                    max_height: int | None = None,
+                    label_classes: dict[str, str] | None = None,
+                    encoder: ImageEncoder | None = None,
+                    keep_native: bool = False):
+    """Take a screenshot of the specified URL using the specified driver.
+
+    With the stitch engine, frames are kept in memory and pasted straight into
+    the final canvas, unless debug is set, in which case every frame is written
+    to var/. With register, the offset between frames is measured instead of
+    assuming the fixed CHUNK_SIZE_PX/DEAD_ZONE_PX geometry. The cdp-fullpage
+    engine renders the whole page in one capture and falls back to stitching
+    when the page is too tall.
+
+    With stream or tile_height, the registered stitcher writes the page to
+    the PNG (or tiles) while scrolling, so memory is bounded by a few frames.
+    max_height caps the height of the screenshot.
+
+    With label_classes, the YOLO labels of the page elements are written next
+    to the screenshot.
+
+    With an encoder, the screenshot is encoded in its format in the
+    background, otherwise it is written as PNG before returning.
+
+    Frames are stitched in device pixels and the page is resampled to CSS
+    pixels once, at the end. With keep_native, it stays in device pixels.
+    """
 
     # Create a slug from the URL to use as a filename
     url_slug = (url
@@ -114,24 +337,24 @@ def take_screenshot(driver: webdriver.Chrome,
                 .replace("http://", "")
                 .replace("/", "_"))
 
+    set_metrics_context(url=url, resolution=resolution['name'])
+
     # Load the specified URL
     try:
         print(f"Loading URL {url}...")
         driver.set_page_load_timeout(20)
-        driver.get(url)
+        with span('load'):
+            driver.get(url)
     except selenium.common.exceptions.TimeoutException:
         print(f"TimeoutException for URL {url}...")
         return
 
     # Wait for the page to load
-    if parallax:
-        time.sleep(3)
-    else:
-        time.sleep(1)
+    wait_for_page_ready(driver, url, 'load', ready_timeout, baseline=3 if parallax else 1)
 
     # Create the output folder if it does not exist
     cache_folder = f"var/{url_slug}"
-    if not os.path.exists(cache_folder):
+    if debug and not os.path.exists(cache_folder):
         os.makedirs(cache_folder)
 
     # Take the full size screenshot
@@ -156,21 +379,48 @@ def take_screenshot(driver: webdriver.Chrome,
         "scroll_max": driver.execute_script("return document.body.scrollHeight;"),
     }
 
+    if max_height is not None:
+        body['height'] = min(body['height'], max_height)
+        body['scroll_max'] = min(body['scroll_max'], max_height)
+
     body['nb_page'] = math.ceil(body['height'] / screen['height'])
     print(" > Body:", body)
 
+    if engine == 'cdp-fullpage':
+        screenshot = capture_full_page(driver, screen['pixel_ratio'], keep_native)
+
+        if screenshot is not None:
+            height = round(max_height * screen['pixel_ratio']) if keep_native and max_height else max_height
+            if height is not None and screenshot.height > height:
+                screenshot = screenshot.crop((0, 0, screenshot.width, height))
+
+            with span('save'):
+                filename = save_image(screenshot, get_screenshot_filename(resolution), encoder)
+            increment('screenshots')
+            print(f"Screenshot successfully saved to {filename}")
+
+            if label_classes is not None:
+                save_labels(driver, label_classes, [filename], sizes=[screenshot.size])
+            return 0
+
+        print("Falling back to stitch engine ...")
+
     # Take first page screenshot
     if body['nb_page'] == 1:
-        remove_cache_folder(cache_folder)
-        filename = get_screenshot_filename(resolution)
-        driver.save_screenshot(filename)
+        if debug:
+            remove_cache_folder(cache_folder)
+        with span('capture'):
+            png = driver.get_screenshot_as_png()
+        increment('frames')
+
+        with span('save'):
+            filename = save_image(png, get_screenshot_filename(resolution), encoder)
+        increment('screenshots')
         print(f"Screenshot successfully saved to {filename}")
-        return 0
-    else:
-        driver.save_screenshot(f"{cache_folder}/page_0.png")
 
-    # Take the full size screenshot
-    print(f"Taking partial screenshots ...")
+        if label_classes is not None:
+            save_labels(driver, label_classes, [filename], sizes=[Image.open(io.BytesIO(png)).size])
+        return 0
 
     partial = {
         "dead_zone": DEAD_ZONE_PX,
@@ -178,36 +428,234 @@ def take_screenshot(driver: webdriver.Chrome,
         "nb_screenshots": math.ceil((body['height'] - screen['height'] - DEAD_ZONE_PX) / CHUNK_SIZE_PX),
     }
 
-    print(" > Partial:", partial)
+    width, pixel_ratio, height = get_writer_geometry(screen, max_height, keep_native)
 
-    print(f"Number of screenshots needed: {partial['nb_screenshots']}")
+    if stream or tile_height:
+        filename = get_screenshot_filename(resolution)
+        writer = open_strip_writer(filename, width, pixel_ratio, tile_height, height)
+        try:
+            stitch_registered(driver, screen, parallax, writer, ready_timeout, scroll_step)
+        except BaseException:
+            # no temporary file, open file or partial tiles left behind
+            writer.abort()
+            raise
+
+        with span('save'):
+            paths = writer.close()
+        increment('screenshots')
+        for path in paths:
+            print(f"Screenshot successfully saved to {path}")
+
+        if label_classes is not None:
+            save_labels(driver, label_classes, paths, stitched=True)
+        return 0
 
-    screenshot_parts = []
+    if register:
+        writer = CanvasWriter(width, pixel_ratio, height)
+        try:
+            stitch_registered(driver, screen, parallax, writer, ready_timeout, scroll_step)
+        except BaseException:
+            writer.abort()
+            raise
+        with span('glue'):
+            screenshot = writer.close()
+    elif debug:
+        screenshot = stitch_on_disk(driver, cache_folder, screen, body, partial, parallax, ready_timeout)
+        remove_cache_folder(cache_folder)
+    else:
+        screenshot = stitch_in_memory(driver, screen, body, partial, parallax, ready_timeout)
 
-    scroll_diff = 0
+    # a single resampling of the whole page, no seam between chunks
+    if not register and not keep_native:
+        screenshot = resample_page(screenshot, screen)
+
+    with span('save'):
+        filename = save_image(screenshot, get_screenshot_filename(resolution), encoder)
+    increment('screenshots')
+    print(f"Screenshot successfully saved to {filename}")
+
+    if label_classes is not None:
+        save_labels(driver, label_classes, [filename], stitched=True, sizes=[screenshot.size])
+
+
+def save_labels(driver: webdriver.Chrome,
+                label_classes: dict[str, str],
+                paths: list[str],
+                stitched: bool = False,
+                sizes: list[tuple[int, int]] | None = None):
+    """Write the YOLO labels of the loaded page next to the screenshot, or to each of its tiles.
+
+    A viewport screenshot starts at the current scroll offset, a stitched one
+    (or its first tile) at the top of the document. Without sizes, the size
+    of each image is read from its file.
+    """
+
+    page = collect_boxes(driver, label_classes)
+    sizes = sizes or [Image.open(path).size for path in paths]
+    scale = sizes[0][0] / page['viewport_width']
+
+    page_height = None
+    origin_y = page['scroll_y']
+
+    if stitched:
+        page_height = sum(height for _, height in sizes) / scale
+        origin_y = 0
+
+    for path, (width, height) in zip(paths, sizes):
+        output = write_labels(path, to_yolo_lines(page, width, height, origin_y, page_height))
+        print(f"Labels successfully saved to {output}")
+        origin_y += height / scale
+
+
+def stitch_in_memory(driver: webdriver.Chrome,
+                     screen: dict,
+                     body: dict,
+                     partial: dict,
+                     parallax: bool,
+                     ready_timeout: float = READY_TIMEOUT_S) -> Image.Image:
+    """Scroll the page and paste every frame into the canvas as it is taken, in device pixels."""
+
+    first = grab_frame(driver)
+    screenshot = Image.new('RGB', (first.width, math.ceil(body['scroll_max'] * screen['pixel_ratio'])))
+    total_height = paste_frame(screenshot, first, 0)
+
+    # Take the full size screenshot
+    print(f"Taking partial screenshots ...")
+    print(" > Partial:", partial)
+    print(f"Number of screenshots needed: {partial['nb_screenshots']}")
 
-    # Take a screenshot of each chunk of the page
     for i in range(partial['nb_screenshots']):
-        scroll_offset = screen['height'] + (i * partial['chunk_size']) - partial['dead_zone']
+        scroll_diff = scroll_to_part(driver, i, screen, body, partial, parallax, ready_timeout)
+        frame = grab_frame(driver)
 
-        print(f" > Scroll offset: {scroll_offset}")
-        print(f" > Display from: {scroll_offset} to {scroll_offset + screen['height']}")
+        if i != (partial['nb_screenshots'] - 1):
+            frame = crop_chunk_image(frame, partial['chunk_size'], partial['dead_zone'], screen['pixel_ratio'])
+        else:
+            frame = crop_queue_image(frame, -scroll_diff, partial['dead_zone'], screen['pixel_ratio'])
 
-        if scroll_offset + screen['height'] > body['scroll_max']:
-            scroll_diff = body['scroll_max'] - (screen['height'] + scroll_offset)
-            scroll_offset = body['scroll_max']
+        total_height = paste_frame(screenshot, frame, get_part_top(i, screen, partial))
 
-        print(f"Taking screenshot {i + 1} of {partial['nb_screenshots']} ...")
-        driver.execute_script(f"window.scrollTo(0, {scroll_offset});")
+    # Final crop to ensure height is correct even on parallax websites
+    return screenshot.crop((0, 0, screenshot.width, min(total_height, screenshot.height)))
+
+
+def stitch_registered(driver: webdriver.Chrome,
+                      screen: dict,
+                      parallax: bool,
+                      writer: StripWriter,
+                      ready_timeout: float = READY_TIMEOUT_S,
+                      scroll_step: int | None = None):
+    """Scroll the page and write the rows each frame adds, measured by frame registration.
+
+    Fixed headers and footers are detected once and kept a single time, and
+    the page is scrolled until its bottom, even if it grows while scrolling
+    (lazy loading), or until the writer is full. Without scroll_step, every
+    step covers the whole visible area but REGISTRATION_OVERLAP_PX. Only the
+    first, previous and current frames are kept in memory.
+    """
+
+    pixel_ratio = screen['pixel_ratio']
+
+    with span('scroll'):
+        driver.execute_script("window.scrollTo(0, 0);")
+    first = grab_frame(driver)
+    width, height = first.size
+
+    frame = first
+    with span('register'):
+        hashes = get_row_hashes(frame)
+    nb_frames = 0
+    scroll_y = 0
+    top, bottom = 0, 0
+    step = scroll_step or screen['height'] // 2
+
+    print(f"Taking registered screenshots ...")
+
+    for i in range(MAX_FRAMES):
+        with span('scroll'):
+            driver.execute_script(f"window.scrollTo(0, {scroll_y + step});")
 
         if parallax:
-            time.sleep(1)
+            wait_for_page_ready(driver, driver.current_url, 'scroll', ready_timeout, baseline=1)
+
+        next_scroll_y = driver.execute_script("return window.scrollY;")
+
+        # bottom of the page reached
+        if next_scroll_y <= scroll_y:
+            break
+
+        next_frame = grab_frame(driver)
+        with span('register'):
+            next_hashes = get_row_hashes(next_frame)
+
+        # fixed regions are measured on the first scroll, when nothing is lazy loaded yet
+        if i == 0:
+            top, bottom = find_fixed_bands(hashes, next_hashes)
+            print(f" > Fixed regions: header {top}px, footer {bottom}px")
+
+            # first frame without the fixed footer, which is added once at the very bottom
+            with span('glue'):
+                writer.write(first.crop((0, 0, width, height - bottom)))
+            first = None
+
+        expected = round((next_scroll_y - scroll_y) * pixel_ratio)
+        with span('register'):
+            offset = find_vertical_offset(hashes, next_hashes, expected, top, bottom)
+        offset = min(offset, height - top - bottom)
+        print(f" > Frame {i + 1}: scrolled {expected}px, content moved {offset}px")
+
+        with span('glue'):
+            writer.write(next_frame.crop((0, height - bottom - offset, width, height - bottom)))
+        nb_frames += 1
+
+        frame, hashes, scroll_y = next_frame, next_hashes, next_scroll_y
+
+        if writer.full:
+            print(f" > Max height reached")
+            break
+
+        if scroll_step is None:
+            step = max(1, int((height - top - bottom) / pixel_ratio) - REGISTRATION_OVERLAP_PX)
+
+    with span('glue'):
+        if nb_frames == 0:
+            writer.write(first)
+        else:
+            writer.write(frame.crop((0, height - bottom, width, height)))
+
+    print(f" > Frames: {nb_frames + 1}")
+
+
+def stitch_on_disk(driver: webdriver.Chrome,
+                   cache_folder: str,
+                   screen: dict,
+                   body: dict,
+                   partial: dict,
+                   parallax: bool,
+                   ready_timeout: float = READY_TIMEOUT_S) -> Image.Image:
+    """Scroll the page, keeping every frame and chunk as a PNG in the cache folder."""
+
+    with span('capture'):
+        driver.save_screenshot(f"{cache_folder}/page_0.png")
+    increment('frames')
+
+    # Take the full size screenshot
+    print(f"Taking partial screenshots ...")
+    print(" > Partial:", partial)
+    print(f"Number of screenshots needed: {partial['nb_screenshots']}")
+
+    screenshot_parts = []
+
+    scroll_diff = 0
 
-        if scroll_diff != 0:
-            print(f" > Scroll diff: {scroll_diff}")
+    # Take a screenshot of each chunk of the page
+    for i in range(partial['nb_screenshots']):
+        scroll_diff = scroll_to_part(driver, i, screen, body, partial, parallax, ready_timeout)
 
         output = f"{cache_folder}/part_{i}.png"
-        driver.save_screenshot(output)
+        with span('capture'):
+            driver.save_screenshot(output)
+        increment('frames')
 
         if not os.path.exists(output):
             print(f"Screenshot {output} was not taken!")
@@ -241,59 +689,83 @@ def take_screenshot(driver: webdriver.Chrome,
     # Gluing screenshot
     print(f"Gluing screenshot ...")
 
-    screenshot_size = (
-        screen['width'],
-        body['scroll_max']
-    )
+    first = Image.open(f"{cache_folder}/page_0.png")
+    screenshot = Image.new('RGB', (first.width, math.ceil(body['scroll_max'] * screen['pixel_ratio'])))
+    total_height = paste_frame(screenshot, first, 0)
 
-    screenshot = Image.new('RGB', screenshot_size)
-    total_height = 0
+    for i in range(partial['nb_screenshots']):
+        total_height = paste_frame(screenshot, Image.open(screenshot_parts[i]), get_part_top(i, screen, partial))
 
-    for i in range(-1, partial['nb_screenshots']):
-        page_height = screen['height']
-        chunk_height = partial['chunk_size']
+    # Final crop to ensure height is correct even on parallax websites
+    return screenshot.crop((0, 0, screenshot.width, min(total_height, screenshot.height)))
 
-        if i == -1:
-            image = Image.open(f"{cache_folder}/page_0.png")
 
-            # resize image to aspect ratio 1:1
-            image = image.resize(
-                (
-                    int(screen['width']),
-                    int(screen['height'])
-                ),
-                Image.ADAPTIVE
-            )
+def scroll_to_part(driver: webdriver.Chrome,
+                   i: int,
+                   screen: dict,
+                   body: dict,
+                   partial: dict,
+                   parallax: bool,
+                   ready_timeout: float = READY_TIMEOUT_S) -> int:
+    """Scroll to the i-th chunk of the page and return the scroll diff of the last chunk."""
 
-            total_height += screen['height']
-            screenshot.paste(image, (0, 0))
-        else:
-            image = Image.open(screenshot_parts[i])
-
-            # get image original size
-            image_width, image_height = image.size
-            height = int(image_height / screen['pixel_ratio'])
-
-            # resize image to aspect ratio 1:1
-            image = image.resize(
-                (
-                    int(screen['width']),
-                    int(height)
-                ),
-                Image.ADAPTIVE
-            )
+    scroll_diff = 0
+    scroll_offset = screen['height'] + (i * partial['chunk_size']) - partial['dead_zone']
 
-            total_height += height
-            screenshot.paste(image, (0, page_height + (i * chunk_height)))
+    print(f" > Scroll offset: {scroll_offset}")
+    print(f" > Display from: {scroll_offset} to {scroll_offset + screen['height']}")
 
-    # Final crop to ensure height is correct even on parallax websites
-    screenshot = screenshot.crop((0, 0, screen['width'], total_height))
+    if scroll_offset + screen['height'] > body['scroll_max']:
+        scroll_diff = body['scroll_max'] - (screen['height'] + scroll_offset)
+        scroll_offset = body['scroll_max']
 
-    remove_cache_folder(cache_folder)
-    filename = get_screenshot_filename(resolution)
+    print(f"Taking screenshot {i + 1} of {partial['nb_screenshots']} ...")
+    with span('scroll'):
+        driver.execute_script(f"window.scrollTo(0, {scroll_offset});")
+
+    if parallax:
+        wait_for_page_ready(driver, driver.current_url, 'scroll', ready_timeout, baseline=1)
+
+    if scroll_diff != 0:
+        print(f" > Scroll diff: {scroll_diff}")
+
+    return scroll_diff
+
+
+@timed('capture')
+def grab_frame(driver: webdriver.Chrome) -> Image.Image:
+    """Take a screenshot of the viewport without writing it to disk."""
+    increment('frames')
+    return Image.open(io.BytesIO(driver.get_screenshot_as_png()))
+
+
+@timed('glue')
+def paste_frame(screenshot: Image.Image, image: Image.Image, top: int) -> int:
+    """Paste a frame (device pixels) at top and return its bottom."""
+
+    screenshot.paste(image, (0, top))
+    return top + image.height
+
+
+def get_part_top(i: int, screen: dict, partial: dict) -> int:
+    """Top of the i-th chunk in device pixels, rounded once from CSS pixels so that errors do not add up."""
+    return round((screen['height'] + i * partial['chunk_size']) * screen['pixel_ratio'])
+
+
+@timed('resample')
+def resample_page(screenshot: Image.Image, screen: dict) -> Image.Image:
+    """Bring the stitched page from device to CSS pixels."""
+    return to_css_pixels(screenshot, (screen['width'], round(screenshot.height / screen['pixel_ratio'])))
 
-    screenshot.save(filename)
-    print(f"Screenshot successfully saved to {filename}")
+
+def get_writer_geometry(screen: dict, max_height: int | None, keep_native: bool) -> tuple[int, float, int | None]:
+    """Width, pixel ratio and max height of the strip writers, in device pixels with keep_native."""
+
+    if not keep_native:
+        return screen['width'], screen['pixel_ratio'], max_height
+
+    ratio = screen['pixel_ratio']
+    return round(screen['width'] * ratio), 1, round(max_height * ratio) if max_height is not None else None
 
 
 def crop_chunk(image_path: str,
@@ -304,6 +776,19 @@ def crop_chunk(image_path: str,
     # Open the image
     original_image = Image.open(image_path)
 
+    # Crop the image
+    cropped_image = crop_chunk_image(original_image, chunk_size_px, dead_zone_px, pixel_ratio)
+
+    # Save the cropped image
+    with span('save'):
+        cropped_image.save(output_path, compress_level=DEBUG_COMPRESS_LEVEL)
+
+
+@timed('crop')
+def crop_chunk_image(original_image: Image.Image,
+                     chunk_size_px: int,
+                     dead_zone_px: int,
+                     pixel_ratio: int) -> Image.Image:
     # Get the dimensions of the original image
     width, height = original_image.size
 
@@ -318,11 +803,7 @@ def crop_chunk(image_path: str,
         dead_zone_screen + chunk_size_screen
     )
 
-    # Crop the image
-    cropped_image = original_image.crop(crop_box)
-
-    # Save the cropped image
-    cropped_image.save(output_path)
+    return original_image.crop(crop_box)
 
 
 def crop_queue(image_path: str,
@@ -333,6 +814,19 @@ def crop_queue(image_path: str,
     # Open the image
     original_image = Image.open(image_path)
 
+    # Crop the image
+    cropped_image = crop_queue_image(original_image, scroll_diff, dead_zone_px, pixel_ratio)
+
+    # Save the cropped image
+    with span('save'):
+        cropped_image.save(output_path, compress_level=DEBUG_COMPRESS_LEVEL)
+
+
+@timed('crop')
+def crop_queue_image(original_image: Image.Image,
+                     scroll_diff: int,
+                     dead_zone_px: int,
+                     pixel_ratio: int) -> Image.Image:
     # Get the dimensions of the original image
     width, height = original_image.size
 
@@ -354,11 +848,7 @@ def crop_queue(image_path: str,
             height
         )
 
-    # Crop the image
-    cropped_image = original_image.crop(crop_box)
-
-    # Save the cropped image
-    cropped_image.save(output_path)
+    return original_image.crop(crop_box)
 
 
 def get_pixel_ratio(driver):
@@ -1,12 +1,33 @@
+import io
 import os
 import time
+from typing import Callable
 
 import click
 import selenium
+from PIL import Image
 from selenium import webdriver
 from selenium.common import WebDriverException
 
 from src.models.Resolution import Resolution
+from src.services.capture_manifest import MAX_ATTEMPTS, CaptureManifest
+from src.services.capture_scheduler import DOMAIN_DELAY_S, DomainThrottle, estimate_plan, plan_captures, print_plan
+from src.services.chrome_driver import copy_profile, is_browser_alive
+from src.services.cookie_consent import (CONSENT_SNAPSHOT, apply_consent_snapshot, dismiss_consent,
+                                         export_consent_snapshot, get_local_storage, load_consent_rules,
+                                         read_consent_snapshot)
+from src.services.device_emulation import emulate_resolution
+from src.services.dom_labels import collect_boxes, load_label_classes, to_yolo_lines, write_class_map, write_labels
+from src.services.http_cache import CACHE_MODES, CachingProxy, use_proxy
+from src.services.image_encoder import (ENCODER_WORKERS, JPEG_QUALITY, OUTPUT_FORMATS, PNG_COMPRESS_LEVEL, ImageEncoder,
+                                        save_image)
+from src.services.metrics import (close_metrics, configure_metrics, increment, print_metrics_summary,
+                                  set_metrics_context, span, write_prometheus)
+from src.services.page_fingerprint import CHANGE_THRESHOLD, get_page_difference, get_page_fingerprint
+from src.services.page_readiness import READY_TIMEOUT_S, print_readiness_summary, wait_for_page_ready
+from src.services.resource_blocking import (DEFAULT_PROFILE, apply_blocking, enable_network_log, get_network_stats,
+                                            load_blocking_profile, print_network_stats, reset_network_stats)
+from src.services.worker_pool import WorkerPool
 
 DESKTOP_RESOLUTIONS = [
     {
@@ -31,16 +52,19 @@ MOBILE_RESOLUTIONS = [
         'name': 'iPhone_SE',
         'width': 375,
         'height': 667,
+        'is_touch': True,
     },
     {
         'name': 'iPhone_12',
         'width': 390,
         'height': 844,
+        'is_touch': True,
     },
     {
         'name': 'iPhone_14',
         'width': 490,
         'height': 932,
+        'is_touch': True,
     },
 ]
 
@@ -49,12 +73,70 @@ MOBILE_RESOLUTIONS = [
 @click.option('--output-folder', default='dataset', help='Output folder')
 @click.option('--fullscreen', default=False, is_flag=True, help='Take a fullscreen screenshot')
 @click.option('--mobile', default=False, is_flag=True, help='Take a screenshot as mobile device')
-@click.option('--skip-cookies', default=False, is_flag=True, help='Skip waiting for cookies')
-def main(output_folder: str, fullscreen: bool, mobile: bool, skip_cookies: bool):
+@click.option('--all-devices', default=False, is_flag=True, help='Take desktop and mobile screenshots from one page load')
+@click.option('--emulate', default=False, is_flag=True, help='Switch resolutions with device emulation on the live tab')
+@click.option('--skip-cookies', default=False, is_flag=True, help='Skip accepting cookies, reuse the last consent snapshot')
+@click.option('--consent-snapshot', 'snapshot_path', default=CONSENT_SNAPSHOT, help='Cookies and storage loaded by every browser')
+@click.option('--manual-cookies', default=False, is_flag=True, help='Accept cookies by hand, closing the window of each domain')
+@click.option('--workers', default=1, type=int, help='Number of parallel Chrome instances')
+@click.option('--max-per-domain', default=2, type=int, help='Max concurrent pages per domain (with --workers)')
+@click.option('--domain-delay', default=DOMAIN_DELAY_S, type=float, help='Min seconds between two page loads of a domain')
+@click.option('--dry-run', default=False, is_flag=True, help='Print the capture plan and its estimated cost, then exit')
+@click.option('--ready-timeout', default=READY_TIMEOUT_S, type=float, help='Max seconds to wait for a page to be ready')
+@click.option('--manifest', 'manifest_path', default='var/manifest.sqlite', help='Capture journal used to resume runs')
+@click.option('--max-attempts', default=MAX_ATTEMPTS, type=int, help='Max attempts for a failing screenshot')
+@click.option('--recrawl', default=False, is_flag=True, help='Check captured pages for changes, recapture the changed ones')
+@click.option('--change-threshold', default=CHANGE_THRESHOLD, type=click.FloatRange(0, 1),
+              help='Min fingerprint difference (0-1) of a page to recapture it')
+@click.option('--labels', default=False, is_flag=True, help='Write YOLO labels of the page elements next to each screenshot')
+@click.option('--blocking', default=DEFAULT_PROFILE, help='Profile of config/blocking.json: requests blocked (ads, trackers...)')
+@click.option('--format', 'output_format', default='png', type=click.Choice(list(OUTPUT_FORMATS)),
+              help='Screenshot format: png, lossless webp, jpeg or raw npy array for the detector')
+@click.option('--compress-level', default=PNG_COMPRESS_LEVEL, type=click.IntRange(0, 9), help='PNG zlib level')
+@click.option('--quality', default=JPEG_QUALITY, type=click.IntRange(1, 100), help='JPEG quality')
+@click.option('--encoder-workers', default=ENCODER_WORKERS, type=int, help='Threads encoding the screenshots')
+@click.option('--http-cache', default=None, type=click.Choice(CACHE_MODES),
+              help='Share responses between browsers and runs through a local caching proxy')
+@click.option('--proxy', default=None, help='Use a running cache_proxy.py (host:port) instead')
+@click.option('--metrics', 'metrics_path', default=None, help='Write the timing of every stage to this JSON lines file')
+@click.option('--prometheus', 'prometheus_path', default=None, help='Dump stage histograms and counters in Prometheus format')
+def main(output_folder: str,
+         fullscreen: bool,
+         mobile: bool,
+         all_devices: bool,
+         emulate: bool,
+         skip_cookies: bool,
+         snapshot_path: str,
+         manual_cookies: bool,
+         workers: int,
+         max_per_domain: int,
+         domain_delay: float,
+         dry_run: bool,
+         ready_timeout: float,
+         manifest_path: str,
+         max_attempts: int,
+         recrawl: bool,
+         change_threshold: float,
+         labels: bool,
+         blocking: str,
+         output_format: str,
+         compress_level: int,
+         quality: int,
+         encoder_workers: int,
+         http_cache: str | None,
+         proxy: str | None,
+         metrics_path: str | None,
+         prometheus_path: str | None):
     """Script to take a screenshot of a URL using Selenium with Chrome."""
 
-    if not skip_cookies:
-        accept_cookies()
+    if metrics_path or prometheus_path:
+        configure_metrics(metrics_path)
+
+    if not skip_cookies and not dry_run:
+        accept_cookies(snapshot_path, manual_cookies)
+
+    # every browser starts with the accepted consents, so banners never show up
+    snapshot = read_consent_snapshot(snapshot_path)
 
     # Create the output directory if it doesn't exist
     if not os.path.exists(output_folder):
@@ -64,13 +146,101 @@ def main(output_folder: str, fullscreen: bool, mobile: bool, skip_cookies: bool)
     if output_folder[-1] == '/':
         output_folder = output_folder[:-1]
 
+    # completed screenshots of previous runs are skipped, failed ones retried
+    manifest = CaptureManifest(manifest_path, max_attempts)
+    # desktop and mobile profiles can only share a page load with device emulation
+    if all_devices:
+        devices = ['desktop', 'mobile']
+        emulate = True
+        mobile = False
+    else:
+        devices = ['mobile'] if mobile else ['desktop']
+
+    jobs = list_jobs(output_folder, devices)
+
+    if dry_run:
+        pages = plan_captures(get_pending_jobs(jobs, manifest, recrawl), workers)
+        print_plan(pages, estimate_plan(pages, manifest.get_domain_durations(), workers, max_per_domain))
+        manifest.close()
+        return
+
+    block_patterns = load_blocking_profile(blocking)
+    throttle = DomainThrottle(domain_delay)
+
+    # screenshots are encoded off the browser threads, the manifest is updated once they are written
+    encoder = ImageEncoder(output_format, compress_level, quality, encoder_workers)
+
+    # every browser of the run goes through the same cache
+    cache_proxy = None
+    if http_cache is not None:
+        cache_proxy = CachingProxy(mode=http_cache).start()
+        proxy = cache_proxy.get_address()
+
+    label_classes = None
+    if labels:
+        label_classes = load_label_classes()
+        write_class_map(output_folder, label_classes)
+
+    try:
+        for attempt in range(max_attempts):
+            # retries only take the failed captures again
+            threshold = change_threshold if recrawl and attempt == 0 else None
+            pages = plan_captures(get_pending_jobs(jobs, manifest, threshold is not None), workers)
+
+            if workers > 1:
+                run_worker_pool(pages, fullscreen, mobile, workers, max_per_domain, ready_timeout, manifest, emulate,
+                                label_classes, snapshot, block_patterns, proxy, encoder, threshold, throttle)
+            else:
+                run_serial(pages, fullscreen, mobile, ready_timeout, manifest, emulate, label_classes, snapshot,
+                           block_patterns, proxy, encoder, threshold, throttle)
+
+            # failed writes are retried with the failed captures
+            encoder.wait()
+
+            if prometheus_path:
+                write_prometheus(prometheus_path)
+
+            delay = manifest.next_retry_delay()
+            if delay is None:
+                break
+
+            print(f"Retrying failed screenshots in {delay:.0f}s...")
+            time.sleep(delay)
+    finally:
+        encoder.close()
+
+        # last export, with the writes still pending when the loop ended or failed
+        if prometheus_path:
+            write_prometheus(prometheus_path)
+
+        print(" > Manifest:", manifest.summary())
+        manifest.close()
+
+        if cache_proxy is not None:
+            cache_proxy.print_summary()
+            cache_proxy.close()
+
+    print_readiness_summary()
+    print_metrics_summary()
+    close_metrics()
+
+
+def get_chrome_options(mobile: bool,
+                       user_data_dir: str = '.google-chrome',
+                       proxy: str | None = None) -> webdriver.ChromeOptions:
     # Load the user profile to avoid cookie popups
     # (you need to accept the cookies manually the first time)
     # (you can use config/categories/homepage to find all websites)
     options = webdriver.ChromeOptions()
-    options.add_argument('--user-data-dir=.google-chrome')
+    options.add_argument(f'--user-data-dir={user_data_dir}')
     options.add_argument('--profile-directory=Default')
 
+    # requests and bytes of each page load are read from the performance log
+    enable_network_log(options)
+
+    if proxy is not None:
+        use_proxy(options, proxy)
+
     # Set Chrome as headless to avoid resolution issues
     options.add_argument('--headless')  # Run Chrome in headless mode (without a graphical interface)
 
@@ -80,49 +250,183 @@ def main(output_folder: str, fullscreen: bool, mobile: bool, skip_cookies: bool)
             'Mozilla/5.0 (Linux; Android 10; Pixel 3) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Mobile Safari/537.36'
         )
 
+    return options
+
+
+def setup_driver(driver: webdriver.Chrome, snapshot: dict | None, block_patterns: list[str] | None):
+    """Load the consent snapshot and block the requests of the profile in a new browser."""
+
+    apply_consent_snapshot(driver, snapshot)
+
+    if block_patterns:
+        apply_blocking(driver, block_patterns)
+
+
+def list_jobs(output_folder: str, devices: list[str]) -> list[dict]:
+    """List every (url, resolution) pair of config/categories as a capture job."""
+
+    resolutions = {
+        'desktop': DESKTOP_RESOLUTIONS,
+        'mobile': MOBILE_RESOLUTIONS,
+    }
+
+    jobs = []
+    for category in os.listdir('config/categories'):
+        with open(os.path.join('config/categories', category), 'r') as f:
+            for line in f:
+                url = line.strip()
+
+                if not url:
+                    continue
+
+                # remove url query parameters
+                if '?' in url:
+                    url = url.split('?')[0]
+
+                for device in devices:
+                    for resolution in resolutions[device]:
+                        jobs.append({
+                            'url': url,
+                            'category': category,
+                            'output_folder': f"{output_folder}/{device}/{category}",
+                            'resolution': resolution,
+                        })
+
+    return jobs
+
+
+def get_pending_jobs(jobs: list[dict], manifest: CaptureManifest, recrawl: bool = False) -> list[dict]:
+    """Leave out the jobs completed by previous runs, and the failed ones waiting for their retry."""
+    return [job for job in jobs if manifest.should_capture(job['url'], job['resolution'], job['category'], recrawl)]
+
+
+def capture_page(driver: webdriver.Chrome,
+                 page: dict,
+                 fullscreen: bool,
+                 ready_timeout: float = READY_TIMEOUT_S,
+                 manifest: CaptureManifest | None = None,
+                 emulate: bool = False,
+                 label_classes: dict[str, str] | None = None,
+                 encoder: ImageEncoder | None = None,
+                 change_threshold: float | None = None,
+                 throttle: DomainThrottle | None = None):
+    """Load a page of the plan once and take all its screenshots."""
+
+    if throttle is not None:
+        throttle.wait(page['url'])
+
+    loaded = False
+    for output_folder, resolutions in page['outputs'].items():
+        loaded = take_screenshot(driver, page['url'], output_folder, resolutions,
+                                 fullscreen, ready_timeout, manifest, page['category'],
+                                 emulate, reload=not loaded, label_classes=label_classes,
+                                 encoder=encoder, change_threshold=change_threshold)
+
+
+def run_serial(pages: list[dict],
+               fullscreen: bool,
+               mobile: bool,
+               ready_timeout: float = READY_TIMEOUT_S,
+               manifest: CaptureManifest | None = None,
+               emulate: bool = False,
+               label_classes: dict[str, str] | None = None,
+               snapshot: dict | None = None,
+               block_patterns: list[str] | None = None,
+               proxy: str | None = None,
+               encoder: ImageEncoder | None = None,
+               change_threshold: float | None = None,
+               throttle: DomainThrottle | None = None):
+    """Take the screenshots of the planned pages with a single Chrome instance, restarting it if it crashes."""
+
     # Initialize the Chrome driver
     print("Initializing Chrome driver...")
-    driver = webdriver.Chrome(options=options)
+    driver = webdriver.Chrome(options=get_chrome_options(mobile, proxy=proxy))
+    setup_driver(driver, snapshot, block_patterns)
 
-    # read each file in the folder dataset/categories
-    # for each file, take a screenshot of the urls in the file
-    # save the screenshot in the folder dataset/{category_name}/
     try:
-        for category in os.listdir('config/categories'):
-            with open(os.path.join('config/categories', category), 'r') as f:
-                for line in f:
-                    url = line.strip()
-
-                    # remove url query parameters
-                    if '?' in url:
-                        url = url.split('?')[0]
-
-                    if mobile:
-                        if not os.path.exists(f"{output_folder}/mobile"):
-                            os.makedirs(f"{output_folder}/mobile")
-
-                        take_screenshot(driver, url, f"{output_folder}/mobile/{category}", MOBILE_RESOLUTIONS,
-                                        fullscreen)
-                    else:
-                        if not os.path.exists(f"{output_folder}/desktop"):
-                            os.makedirs(f"{output_folder}/desktop")
-
-                        take_screenshot(driver, url, f"{output_folder}/desktop/{category}", DESKTOP_RESOLUTIONS,
-                                        fullscreen)
-
-    except Exception as e:
-        print(f"An error occurred: {e}")
+        for page in pages:
+            try:
+                capture_page(driver, page, fullscreen, ready_timeout, manifest, emulate, label_classes, encoder,
+                             change_threshold, throttle)
+            except WebDriverException as e:
+                print(f"An error occurred: {e}")
+
+                if not is_browser_alive(driver):
+                    print("Reloading Chrome driver...")
+                    driver.quit()
+                    driver = webdriver.Chrome(options=get_chrome_options(mobile, proxy=proxy))
+                    setup_driver(driver, snapshot, block_patterns)
     finally:
         # Close the browser
         driver.quit()
 
 
+def run_worker_pool(pages: list[dict],
+                    fullscreen: bool,
+                    mobile: bool,
+                    workers: int,
+                    max_per_domain: int,
+                    ready_timeout: float = READY_TIMEOUT_S,
+                    manifest: CaptureManifest | None = None,
+                    emulate: bool = False,
+                    label_classes: dict[str, str] | None = None,
+                    snapshot: dict | None = None,
+                    block_patterns: list[str] | None = None,
+                    proxy: str | None = None,
+                    encoder: ImageEncoder | None = None,
+                    change_threshold: float | None = None,
+                    throttle: DomainThrottle | None = None):
+    """Take the screenshots of the planned pages with a pool of isolated Chrome instances, a page per job."""
+
+    def create_driver(worker_id: int) -> webdriver.Chrome:
+        # each worker gets its own copy of the profile, Chrome locks its user data dir
+        profile = copy_profile('.google-chrome', f"var/workers/worker-{worker_id}")
+        driver = webdriver.Chrome(options=get_chrome_options(mobile, profile, proxy))
+        setup_driver(driver, snapshot, block_patterns)
+        return driver
+
+    def capture(driver: webdriver.Chrome, page: dict):
+        capture_page(driver, page, fullscreen, ready_timeout, manifest, emulate, label_classes, encoder,
+                     change_threshold, throttle)
+
+    print(f"Dispatching {len(pages)} pages to {workers} workers...")
+
+    pool = WorkerPool(workers, create_driver, capture, max_per_domain=max_per_domain)
+    pool.run(pages)
+
+
 def take_screenshot(driver: webdriver.Chrome,
                     url: str,
                     output_folder: str,
                     resolution: list[Resolution],
-                    fullscreen: bool = False):
-    """Take a screenshot of the specified URL using the specified driver."""
+                    fullscreen: bool = False,
+                    ready_timeout: float = READY_TIMEOUT_S,
+                    manifest: CaptureManifest | None = None,
+                    category: str = '',
+                    emulate: bool = False,
+                    reload: bool = True,
+                    label_classes: dict[str, str] | None = None,
+                    encoder: ImageEncoder | None = None,
+                    change_threshold: float | None = None) -> bool:
+    """Take a screenshot of the specified URL using the specified driver.
+
+    With a manifest, resolutions already captured are skipped and every
+    failure is recorded instead of raised, unless the browser itself died.
+    Without reload, the page already loaded in the driver is captured again.
+    With label_classes, YOLO labels are written next to each screenshot.
+    With an encoder, screenshots are written in the background and marked
+    done in the manifest once on disk.
+    With a change_threshold, captured pages are loaded again and only
+    recaptured if their fingerprint changed past it since.
+    Returns whether the page is loaded in the driver.
+    """
+
+    if manifest is not None:
+        resolution = [r for r in resolution if manifest.should_capture(url, r, category, change_threshold is not None)]
+
+        if len(resolution) == 0:
+            print(f"Skipping URL {url}, already captured.")
+            return not reload
 
     # Create a slug from the URL to use as a filename
     url_slug = (url
@@ -130,99 +434,258 @@ def take_screenshot(driver: webdriver.Chrome,
                 .replace("http://", "")
                 .replace("/", "_"))
 
-    # Load the specified URL
-    try:
-        print(f"Loading URL {url}...")
-        driver.set_page_load_timeout(20)
-        driver.get(url)
-    except selenium.common.exceptions.TimeoutException:
-        print(f"TimeoutException for URL {url}...")
-        return
-
-    # Wait for the page to load
-    time.sleep(3)
+    network = None
+    if reload:
+        # Load the specified URL
+        try:
+            print(f"Loading URL {url}...")
+            driver.set_page_load_timeout(20)
+            reset_network_stats(driver)
+            set_metrics_context(url=url)
+            with span('load'):
+                driver.get(url)
+        except selenium.common.exceptions.TimeoutException as e:
+            print(f"TimeoutException for URL {url}...")
+            increment('load_timeouts')
+
+            if manifest is not None:
+                for r in resolution:
+                    manifest.mark_failed(url, r, category, e)
+            return False
+
+        # Wait for the page to load
+        wait_for_page_ready(driver, url, 'load', ready_timeout, baseline=3)
+
+        network = get_network_stats(driver)
+        print_network_stats(network)
+
+    # stored with the screenshots, compared with the page on the next crawl
+    fingerprint = None
+    if manifest is not None:
+        with span('fingerprint'):
+            fingerprint = get_page_fingerprint(driver)
+
+        if change_threshold is not None:
+            resolution = skip_unchanged(url, category, resolution, manifest, fingerprint, change_threshold, network)
 
     for resolution in resolution:
-        # Take the full size screenshot
-        print(f"Taking screenshot {resolution['width']}x{resolution['height']}...")
+        start = time.time()
+
+        if manifest is not None:
+            manifest.mark_running(url, resolution, category)
+
+        def on_saved(output: str, error: Exception | None, resolution=resolution, start=start):
+            if manifest is None:
+                return
+
+            if error is None:
+                manifest.mark_done(url, resolution, category, output, time.time() - start, network, fingerprint)
+            else:
+                manifest.mark_failed(url, resolution, category, error, time.time() - start)
+
+        try:
+            capture_resolution(driver, url, url_slug, output_folder, resolution,
+                               fullscreen, ready_timeout, emulate, label_classes, encoder, on_saved)
+        except Exception as e:
+            if manifest is None:
+                raise
+
+            manifest.mark_failed(url, resolution, category, e, time.time() - start)
+            increment('failures')
+
+            if isinstance(e, WebDriverException) and not is_browser_alive(driver):
+                raise
+
+            print(f"An error occurred: {e}")
+
+    return True
+
+
+def skip_unchanged(url: str,
+                   category: str,
+                   resolutions: list[Resolution],
+                   manifest: CaptureManifest,
+                   fingerprint: dict | None,
+                   change_threshold: float,
+                   network: dict | None = None) -> list[Resolution]:
+    """Return the resolutions to capture: the ones never captured, or whose page changed past the threshold.
+
+    The other ones keep their screenshot, only their metadata is refreshed.
+    """
+
+    changed = []
+    for resolution in resolutions:
+        entry = manifest.get_captured(url, resolution, category)
+        difference = get_page_difference(entry['fingerprint'] if entry is not None else None, fingerprint)
+
+        if difference > change_threshold:
+            changed.append(resolution)
+            continue
+
+        manifest.mark_unchanged(url, resolution, category, network)
+        increment('unchanged')
+        print(f"Skipping {resolution['name']} of {url}, unchanged ({difference:.0%} different).")
+
+    return changed
+
+
+def capture_resolution(driver: webdriver.Chrome,
+                       url: str,
+                       url_slug: str,
+                       output_folder: str,
+                       resolution: Resolution,
+                       fullscreen: bool = False,
+                       ready_timeout: float = READY_TIMEOUT_S,
+                       emulate: bool = False,
+                       label_classes: dict[str, str] | None = None,
+                       encoder: ImageEncoder | None = None,
+                       on_saved: Callable[[str, Exception | None], None] | None = None) -> str:
+    """Take the screenshot of the loaded page at the given resolution and return its path.
+
+    on_saved is called once the screenshot is written, right away without
+    an encoder.
+    """
+
+    # Take the full size screenshot
+    print(f"Taking screenshot {resolution['width']}x{resolution['height']}...")
+    set_metrics_context(url=url, resolution=resolution['name'])
+
+    if emulate:
+        # switch the device on the live tab, the page only needs to relayout
+        emulate_resolution(driver, resolution, resolution['height'] * 2)
 
         if fullscreen:
+            wait_for_page_ready(driver, url, 'emulate', ready_timeout, baseline=3)
             height = driver.execute_script('return document.documentElement.scrollHeight')
-            width = driver.execute_script('return document.documentElement.scrollWidth')
-            driver.set_window_size(width, height * 2)  # the trick
-        else:
-            driver.set_window_size(resolution['width'], resolution['height'] * 2)
+            emulate_resolution(driver, resolution, height)
 
-        time.sleep(3)
-        output = f"{output_folder}/{url_slug}-{resolution['width']}x{resolution['height']}-{resolution['name']}.png"
+        wait_for_page_ready(driver, url, 'emulate', ready_timeout, baseline=3)
+    elif fullscreen:
+        height = driver.execute_script('return document.documentElement.scrollHeight')
+        width = driver.execute_script('return document.documentElement.scrollWidth')
+        driver.set_window_size(width, height * 2)  # the trick
+        wait_for_page_ready(driver, url, 'resize', ready_timeout, baseline=3)
+    else:
+        driver.set_window_size(resolution['width'], resolution['height'] * 2)
+        wait_for_page_ready(driver, url, 'resize', ready_timeout, baseline=3)
 
-        # check if folder exists
-        if not os.path.exists(output_folder):
-            os.makedirs(output_folder)
+    output = f"{output_folder}/{url_slug}-{resolution['width']}x{resolution['height']}-{resolution['name']}.png"
 
-        # remove the file if it already exists
-        if os.path.exists(output):
-            os.remove(output)
+    # check if folder exists
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
 
-        driver.save_screenshot(output)
-        print(f"Screenshot successfully saved to {output}")
+    with span('capture'):
+        png = driver.get_screenshot_as_png()
+    increment('frames')
 
-        # check if file exists
-        if not os.path.exists(output):
-            print(f"Screenshot {output} does not exist!")
-            raise Exception(f"Screenshot {output} does not exist!")
+    # written to a temporary file first, so that a killed run never leaves a truncated screenshot
+    with span('save'):
+        output = save_image(png, output, encoder, on_saved)
+    increment('screenshots')
+    print(f"Screenshot successfully saved to {output}")
 
+    if label_classes is not None:
+        page = collect_boxes(driver, label_classes)
+        width, height = Image.open(io.BytesIO(png)).size
+        write_labels(output, to_yolo_lines(page, width, height, page['scroll_y']))
 
-def accept_cookies():
-    # Load the user profile to avoid cookie popups
-    # (you need to accept the cookies manually the first time)
-    # (you can use config/categories/homepage to find all websites)
-    options = webdriver.ChromeOptions()
-    options.add_argument('--user-data-dir=.google-chrome')
-    options.add_argument('--profile-directory=.google-profile')
+    # check if file exists
+    if encoder is None and not os.path.exists(output):
+        print(f"Screenshot {output} does not exist!")
+        raise Exception(f"Screenshot {output} does not exist!")
+
+    return output
 
-    # Initialize the Chrome driver
-    print("Initializing Chrome driver...")
-    driver = webdriver.Chrome(options=options)
 
-    print("Loading all domains of dataset...")
+def list_domains() -> dict[str, str]:
+    """Return a URL of each domain of config/categories."""
+
     domains = dict()
     for filename in os.listdir('config/categories'):
         with open(os.path.join('config/categories', filename), 'r') as f:
             for line in f:
                 url = line.strip()
-                domain = url.split('/')[2]
-                domains[domain] = url
+                if url:
+                    domains[url.split('/')[2]] = url
+
+    return domains
+
+
+def accept_cookies(snapshot_path: str = CONSENT_SNAPSHOT, manual: bool = False):
+    """Accept the cookies of every domain of the dataset, then save them as a consent snapshot.
+
+    Banners are dismissed automatically from the rules of config/consent.json.
+    With manual, each domain is opened until its window is closed by hand,
+    as a fallback for the banners the rules do not know.
+    """
+
+    options = webdriver.ChromeOptions()
+    options.add_argument('--user-data-dir=var/consent-profile')
+    if not manual:
+        options.add_argument('--headless')
+
+    # Initialize the Chrome driver
+    print("Initializing Chrome driver...")
+    driver = webdriver.Chrome(options=options)
+
+    rules = load_consent_rules()
+    domains = list_domains()
+    local_storage = dict()
+    missed = []
 
     print(f"Prepare accepting cookies for {len(domains)} domains...")
 
     for domain, url in domains.items():
         try:
             print(f"Accepting cookies for {domain}...")
+            driver.set_page_load_timeout(20)
             driver.get(url)
 
-            # Wait for browser to be closed manually (cookies accepted)
-            while is_browser_alive(driver):
-                time.sleep(0.5)
+            if manual:
+                # Wait for browser to be closed manually (cookies accepted)
+                while is_browser_alive(driver):
+                    time.sleep(0.5)
+
+                # cookies are saved in the profile, read back by the next browser
+                driver = restart_driver(driver, options)
+                continue
+
+            result = dismiss_consent(driver, rules, url)
+            if result is None:
+                missed.append(domain)
+                print(f" > No consent banner found for {domain}")
+                continue
+
+            # let the CMP store the consent before reading the storage
+            time.sleep(0.5)
+            origin, items = get_local_storage(driver)
+            local_storage[origin] = items
+            print(f" > Accepted with {result['method']} {result['match']!r}")
         except selenium.common.exceptions.WebDriverException:
-            print("Reloading Chrome driver...")
-            driver.quit()
-            driver = webdriver.Chrome(options=options)
+            missed.append(domain)
+            print(f" > Cannot load {domain}")
 
-        print(f"Accepted cookies for {domain}.")
+            if not is_browser_alive(driver):
+                driver = restart_driver(driver, options)
 
+    export_consent_snapshot(driver, local_storage, snapshot_path)
     driver.quit()
+
+    if missed:
+        print(f" > No consent accepted for {len(missed)} domains, add an override in config/consent.json:",
+              ', '.join(missed))
     print("\n", "All cookies accepted.", "\n")
 
 
-def is_browser_alive(driver) -> bool:
+def restart_driver(driver: webdriver.Chrome, options: webdriver.ChromeOptions) -> webdriver.Chrome:
+    print("Reloading Chrome driver...")
     try:
-        # Try to interact with an element on the page
-        driver.execute_script("return document.readyState")
-        _ = driver.window_handles
-        return True  # If successful, the browser is still open
+        driver.quit()
     except WebDriverException:
-        return False  # WebDriverException is raised if the browser is closed
+        pass
+
+    return webdriver.Chrome(options=options)
 
 
 if __name__ == '__main__':
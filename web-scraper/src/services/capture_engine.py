@@ -0,0 +1,68 @@
+import base64
+import io
+
+from PIL import Image
+from selenium import webdriver
+
+from src.services.metrics import increment, span
+
+CAPTURE_ENGINES = ['stitch', 'cdp-fullpage']
+
+# Chrome refuses (or silently truncates) surfaces taller than its max texture size
+MAX_TEXTURE_PX = 16384
+
+
+def get_content_size(driver: webdriver.Chrome) -> dict:
+    """Return the full size of the page content in CSS pixels."""
+
+    metrics = driver.execute_cdp_cmd('Page.getLayoutMetrics', {})
+
+    # cssContentSize is only available on recent Chrome versions
+    content = metrics.get('cssContentSize', metrics['contentSize'])
+
+    return {
+        "width": int(content['width']),
+        "height": int(content['height']),
+    }
+
+
+def fits_texture_limit(width: int, height: int, pixel_ratio: float) -> bool:
+    """Check that a capture of the given CSS size can be rendered in a single surface."""
+    return max(width, height) * pixel_ratio <= MAX_TEXTURE_PX
+
+
+def capture_full_page(driver: webdriver.Chrome, pixel_ratio: float = 1, keep_native: bool = False) -> Image.Image | None:
+    """Capture the whole page in a single DevTools call.
+
+    The image is returned in CSS pixels (like the stitcher does), or in device
+    pixels with keep_native, or None when the page is too tall for the browser
+    texture limit and the caller should fall back to stitching.
+    """
+
+    size = get_content_size(driver)
+    print(" > Content:", size)
+
+    if not fits_texture_limit(size['width'], size['height'], pixel_ratio):
+        print(f"Page is taller than the texture limit ({MAX_TEXTURE_PX}px)")
+        return None
+
+    with span('capture', engine='cdp-fullpage'):
+        result = driver.execute_cdp_cmd('Page.captureScreenshot', {
+            "format": "png",
+            "fromSurface": True,
+            "captureBeyondViewport": True,
+            "clip": {
+                "x": 0,
+                "y": 0,
+                "width": size['width'],
+                "height": size['height'],
+                # the browser renders straight at the output scale, nothing is resampled
+                "scale": 1 if keep_native else 1 / pixel_ratio,
+            },
+        })
+
+        image = Image.open(io.BytesIO(base64.b64decode(result['data'])))
+        image.load()
+
+    increment('frames')
+    return image
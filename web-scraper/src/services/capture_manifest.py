@@ -0,0 +1,207 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src.models.Resolution import Resolution
+
+MAX_ATTEMPTS = 3
+RETRY_BACKOFF_S = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    url TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    category TEXT NOT NULL,
+    status TEXT NOT NULL,
+    output TEXT,
+    size INTEGER,
+    duration REAL,
+    error TEXT,
+    requests INTEGER,
+    blocked_requests INTEGER,
+    transferred_bytes INTEGER,
+    fingerprint TEXT,
+    checked_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (url, resolution, category)
+)
+"""
+
+# Columns added after the first release, created on the manifests of older runs
+MIGRATIONS = {
+    'requests': "ALTER TABLE captures ADD COLUMN requests INTEGER",
+    'blocked_requests': "ALTER TABLE captures ADD COLUMN blocked_requests INTEGER",
+    'transferred_bytes': "ALTER TABLE captures ADD COLUMN transferred_bytes INTEGER",
+    'fingerprint': "ALTER TABLE captures ADD COLUMN fingerprint TEXT",
+    'checked_at': "ALTER TABLE captures ADD COLUMN checked_at REAL",
+}
+
+
+def get_resolution_key(resolution: Resolution) -> str:
+    return f"{resolution['width']}x{resolution['height']}-{resolution['name']}"
+
+
+class CaptureManifest:
+    """Persistent journal of every url x resolution x category capture.
+
+    Every status change is committed right away, so a run killed at any point
+    can be resumed: completed captures are skipped, failed ones are retried
+    with an exponential backoff until max_attempts is reached. Entries left
+    'running' by a killed run are simply taken again.
+    """
+
+    def __init__(self, path: str, max_attempts: int = MAX_ATTEMPTS, backoff: float = RETRY_BACKOFF_S):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lock = threading.Lock()
+
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+
+        columns = {row['name'] for row in self.db.execute("PRAGMA table_info(captures)")}
+        for column, migration in MIGRATIONS.items():
+            if column not in columns:
+                self.db.execute(migration)
+
+        self.db.commit()
+
+    def get(self, url: str, resolution: Resolution, category: str) -> sqlite3.Row | None:
+        with self.lock:
+            return self.db.execute(
+                "SELECT * FROM captures WHERE url = ? AND resolution = ? AND category = ?",
+                (url, get_resolution_key(resolution), category)
+            ).fetchone()
+
+    def should_capture(self, url: str, resolution: Resolution, category: str, recrawl: bool = False) -> bool:
+        """With recrawl, completed captures are taken again too, to be checked for changes."""
+
+        entry = self.get(url, resolution, category)
+
+        if entry is None:
+            return True
+
+        if entry['status'] == 'done':
+            # output removed since the last run
+            return recrawl or not os.path.exists(entry['output'])
+
+        if entry['status'] == 'failed':
+            return entry['attempts'] < self.max_attempts and entry['next_attempt_at'] <= time.time()
+
+        return True
+
+    def mark_running(self, url: str, resolution: Resolution, category: str):
+        self.update(url, resolution, category, status='running')
+
+    def mark_done(self,
+                  url: str,
+                  resolution: Resolution,
+                  category: str,
+                  output: str,
+                  duration: float,
+                  network: dict | None = None,
+                  fingerprint: dict | None = None):
+        network = network or dict()
+
+        self.update(url, resolution, category,
+                    status='done',
+                    output=output,
+                    size=os.path.getsize(output),
+                    duration=duration,
+                    error=None,
+                    requests=network.get('requests'),
+                    blocked_requests=network.get('blocked'),
+                    transferred_bytes=network.get('bytes'),
+                    fingerprint=json.dumps(fingerprint) if fingerprint is not None else None,
+                    checked_at=time.time())
+
+    def get_captured(self, url: str, resolution: Resolution, category: str) -> sqlite3.Row | None:
+        """Return the entry of a completed capture still on disk, with the fingerprint of its page."""
+
+        entry = self.get(url, resolution, category)
+
+        if entry is None or entry['status'] != 'done' or entry['fingerprint'] is None:
+            return None
+
+        return entry if os.path.exists(entry['output']) else None
+
+    def mark_unchanged(self, url: str, resolution: Resolution, category: str, network: dict | None = None):
+        """Keep the screenshot of a page that did not change, only refresh its metadata."""
+
+        network = network or dict()
+
+        self.update(url, resolution, category,
+                    status='done',
+                    requests=network.get('requests'),
+                    blocked_requests=network.get('blocked'),
+                    transferred_bytes=network.get('bytes'),
+                    checked_at=time.time())
+
+    def mark_failed(self, url: str, resolution: Resolution, category: str, error: Exception, duration: float = 0):
+        entry = self.get(url, resolution, category)
+        attempts = (entry['attempts'] if entry is not None else 0) + 1
+
+        self.update(url, resolution, category,
+                    status='failed',
+                    duration=duration,
+                    error=f"{type(error).__name__}: {error}",
+                    attempts=attempts,
+                    next_attempt_at=time.time() + self.backoff * 2 ** (attempts - 1))
+
+    def update(self, url: str, resolution: Resolution, category: str, **fields):
+        fields['updated_at'] = time.time()
+        columns = ', '.join(fields.keys())
+        updates = ', '.join(f"{column} = excluded.{column}" for column in fields.keys())
+
+        with self.lock:
+            self.db.execute(
+                f"INSERT INTO captures (url, resolution, category, {columns}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in fields)}) "
+                f"ON CONFLICT (url, resolution, category) DO UPDATE SET {updates}",
+                (url, get_resolution_key(resolution), category, *fields.values())
+            )
+            self.db.commit()
+
+    def next_retry_delay(self) -> float | None:
+        """Seconds until the next failed capture can be retried, None if there is nothing left to retry."""
+
+        with self.lock:
+            row = self.db.execute(
+                "SELECT MIN(next_attempt_at) FROM captures WHERE status = 'failed' AND attempts < ?",
+                (self.max_attempts,)
+            ).fetchone()
+
+        if row[0] is None:
+            return None
+
+        return max(0.0, row[0] - time.time())
+
+    def get_domain_durations(self) -> dict[str, float]:
+        """Mean duration of the completed captures of each domain, to estimate the next runs."""
+
+        with self.lock:
+            rows = self.db.execute("SELECT url, duration FROM captures WHERE status = 'done' AND duration IS NOT NULL").fetchall()
+
+        durations = dict()
+        for url, duration in rows:
+            durations.setdefault(url.split('/')[2], []).append(duration)
+
+        return {domain: sum(values) / len(values) for domain, values in durations.items()}
+
+    def summary(self) -> dict:
+        with self.lock:
+            rows = self.db.execute("SELECT status, COUNT(*) FROM captures GROUP BY status").fetchall()
+
+        return {status: count for status, count in rows}
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,246 @@
+import asyncio
+import io
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+import selenium
+from PIL import Image
+from selenium import webdriver
+from selenium.common import WebDriverException
+
+from src.services.capture_engine import capture_full_page
+from src.services.chrome_driver import is_browser_alive
+from src.services.page_readiness import READY_TIMEOUT_S, wait_for_page_ready
+
+QUEUE_SIZE = 4
+MAX_BATCH = 8
+MAX_LATENCY_MS = 50
+
+# Frames waiting to be saved before the detector waits for the writer
+MAX_PENDING_SAVES = 32
+
+# Latencies kept for the percentiles, the most recent ones
+STATS_WINDOW = 10000
+
+
+class CapturePipeline:
+    """Capture pages in browser workers and detect their elements in batches, all in memory.
+
+    Browser workers put decoded frames in a bounded queue: when detection
+    falls behind, the queue is full and the workers wait before loading the
+    next URL. The detector stage takes up to max_batch frames, waiting at
+    most max_latency_ms for a batch to fill. Selenium and the detector are
+    blocking, so each runs in its own threads. With save_folder, frames are
+    saved as PNG by a separate thread, once detected.
+    """
+
+    def __init__(self,
+                 create_driver: Callable[[int], webdriver.Chrome],
+                 detect: Callable[[list[Image.Image]], list],
+                 nb_browsers: int = 1,
+                 queue_size: int = QUEUE_SIZE,
+                 max_batch: int = MAX_BATCH,
+                 max_latency_ms: float = MAX_LATENCY_MS,
+                 fullscreen: bool = False,
+                 ready_timeout: float = READY_TIMEOUT_S,
+                 save_folder: str | None = None):
+        self.create_driver = create_driver
+        self.detect = detect
+        self.nb_browsers = nb_browsers
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.max_latency = max_latency_ms / 1000
+        self.fullscreen = fullscreen
+        self.ready_timeout = ready_timeout
+        self.save_folder = save_folder
+
+        self.browsers = ThreadPoolExecutor(max_workers=nb_browsers, thread_name_prefix='browser')
+        self.detector = ThreadPoolExecutor(max_workers=1, thread_name_prefix='detector')
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+
+        self.drivers: list[webdriver.Chrome | None] = [None] * nb_browsers
+        self.stats = {"captured": 0, "failed": 0, "detected": 0, "batches": 0, "queue_full": 0}
+        self.latencies: deque[float] = deque(maxlen=STATS_WINDOW)
+
+    async def run(self, urls: list[str], on_result: Callable[[dict], None]):
+        """Capture and detect every URL, calling on_result with each page result as it is ready."""
+
+        loop = asyncio.get_running_loop()
+        pending_urls = asyncio.Queue()
+        frames = asyncio.Queue(maxsize=self.queue_size)
+        saves = []
+
+        for url in urls:
+            pending_urls.put_nowait(url)
+
+        browsers = [
+            asyncio.create_task(self.browse(loop, browser_id, pending_urls, frames))
+            for browser_id in range(self.nb_browsers)
+        ]
+        detector = asyncio.create_task(self.run_detector(loop, frames, on_result, saves))
+        browsing = asyncio.gather(*browsers)
+
+        await asyncio.wait([browsing, detector], return_when=asyncio.FIRST_COMPLETED)
+
+        if detector.done():
+            # the detector only stops first on an error, the browsers would wait forever on the full queue
+            browsing.cancel()
+            await asyncio.gather(browsing, return_exceptions=True)
+            detector.result()
+
+        try:
+            await browsing
+        except BaseException:
+            detector.cancel()
+            raise
+
+        await frames.put(None)
+        await detector
+
+        if saves:
+            await asyncio.gather(*saves)
+
+    async def browse(self, loop, browser_id: int, urls: asyncio.Queue, frames: asyncio.Queue):
+        while not urls.empty():
+            url = urls.get_nowait()
+            started_at = time.perf_counter()
+
+            frame = await loop.run_in_executor(self.browsers, self.capture, browser_id, url)
+            if frame is None:
+                self.stats['failed'] += 1
+                continue
+
+            self.stats['captured'] += 1
+            if frames.full():
+                self.stats['queue_full'] += 1
+
+            # blocks this browser while the detector is behind
+            await frames.put({"url": url, "image": frame, "started_at": started_at, "captured_at": time.perf_counter()})
+
+    def capture(self, browser_id: int, url: str) -> Image.Image | None:
+        """Load the URL and return its screenshot, decoded from memory."""
+
+        try:
+            driver = self.drivers[browser_id]
+            if driver is None or not is_browser_alive(driver):
+                if driver is not None:
+                    try:
+                        driver.quit()
+                    except WebDriverException:
+                        pass
+
+                print(f"[browser-{browser_id}] Initializing Chrome driver...")
+                self.drivers[browser_id] = None
+                driver = self.drivers[browser_id] = self.create_driver(browser_id)
+
+            driver.set_page_load_timeout(20)
+            driver.get(url)
+            wait_for_page_ready(driver, url, 'load', self.ready_timeout, baseline=1)
+
+            if self.fullscreen:
+                pixel_ratio = driver.execute_script("return window.devicePixelRatio || 1;")
+                frame = capture_full_page(driver, pixel_ratio)
+                if frame is not None:
+                    return frame.convert('RGB')
+
+            return Image.open(io.BytesIO(driver.get_screenshot_as_png())).convert('RGB')
+        except (selenium.common.exceptions.TimeoutException, WebDriverException) as e:
+            print(f"[browser-{browser_id}] Cannot capture {url}: {e}")
+            return None
+
+    async def run_detector(self, loop, frames: asyncio.Queue, on_result: Callable[[dict], None], saves: list):
+        done = False
+
+        while not done:
+            batch = [await frames.get()]
+            if batch[0] is None:
+                break
+
+            deadline = loop.time() + self.max_latency
+            while len(batch) < self.max_batch:
+                try:
+                    item = await asyncio.wait_for(frames.get(), max(0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+
+                if item is None:
+                    done = True
+                    break
+                batch.append(item)
+
+            try:
+                detections = await loop.run_in_executor(self.detector, self.detect, [item['image'] for item in batch])
+            except Exception as e:
+                print(f"[detector] Cannot detect {', '.join(item['url'] for item in batch)}: {e}")
+                self.stats['failed'] += len(batch)
+                continue
+
+            detected_at = time.perf_counter()
+
+            self.stats['batches'] += 1
+            self.stats['detected'] += len(batch)
+
+            for item, detection in zip(batch, detections):
+                self.latencies.append(detected_at - item['started_at'])
+
+                try:
+                    on_result({
+                        "url": item['url'],
+                        "width": item['image'].width,
+                        "height": item['image'].height,
+                        "capture_ms": round((item['captured_at'] - item['started_at']) * 1000, 1),
+                        "latency_ms": round((detected_at - item['started_at']) * 1000, 1),
+                        "detections": detection,
+                    })
+                except Exception as e:
+                    print(f"[detector] Cannot report {item['url']}: {e}")
+                    self.stats['failed'] += 1
+                    continue
+
+                if self.save_folder is not None:
+                    saves.append(loop.run_in_executor(self.writer, self.save, item['url'], item['image']))
+
+            # saving never delays detection, unless the disk is so slow that frames pile up
+            saves[:] = [save for save in saves if not save.done()]
+            if len(saves) > MAX_PENDING_SAVES:
+                await saves[0]
+
+    def save(self, url: str, image: Image.Image):
+        if not os.path.exists(self.save_folder):
+            os.makedirs(self.save_folder)
+
+        url_slug = (url
+                    .replace("https://", "")
+                    .replace("http://", "")
+                    .replace("/", "_"))
+
+        image.save(os.path.join(self.save_folder, f"{url_slug}-{time.strftime('%Y%m%d-%H%M%S')}.png"))
+
+    def get_stats(self) -> dict:
+        """Counts since the pipeline was created (or reset), latency percentiles of the last STATS_WINDOW pages."""
+
+        latencies = np.array(self.latencies) * 1000
+
+        return {
+            **self.stats,
+            "mean_batch_size": self.stats['detected'] / self.stats['batches'] if self.stats['batches'] else 0.0,
+            "p50_ms": float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+            "p99_ms": float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+        }
+
+    def reset_stats(self):
+        self.stats = dict.fromkeys(self.stats, 0)
+        self.latencies.clear()
+
+    def close(self):
+        for driver in self.drivers:
+            if driver is not None:
+                driver.quit()
+
+        self.browsers.shutdown()
+        self.detector.shutdown()
+        self.writer.shutdown()
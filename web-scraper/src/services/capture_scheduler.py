@@ -0,0 +1,168 @@
+import itertools
+import threading
+import time
+
+from src.models.Resolution import Resolution
+from src.services.worker_pool import get_domain
+
+# Min seconds between two page loads of a same domain
+DOMAIN_DELAY_S = 1.0
+
+# Estimates of the domains without captures in the manifest yet
+ESTIMATED_LOAD_S = 5.0
+ESTIMATED_CAPTURE_S = 2.0
+
+
+def group_pages(jobs: list[dict]) -> list[dict]:
+    """Group the jobs of a same page, so that it is loaded once for all its resolutions."""
+
+    groups = dict()
+    for job in jobs:
+        key = (job['url'], job['category'])
+
+        if key not in groups:
+            groups[key] = {
+                'url': job['url'],
+                'category': job['category'],
+                'outputs': dict(),
+            }
+
+        outputs = groups[key]['outputs']
+        outputs.setdefault(job['output_folder'], []).append(job['resolution'])
+
+    return list(groups.values())
+
+
+def get_area(resolution: Resolution) -> int:
+    return resolution['width'] * resolution['height']
+
+
+def order_resolutions(pages: list[dict]):
+    """Order the resolutions of the pages small to large, then large to small on the next page, and so on.
+
+    Each page then starts at the window size the previous one ended with, so
+    there is no relayout between pages, and every resize within a page is a
+    step to the closest size.
+    """
+
+    for i, page in enumerate(pages):
+        captures = [(folder, resolution) for folder, resolutions in page['outputs'].items() for resolution in resolutions]
+        captures.sort(key=lambda capture: get_area(capture[1]), reverse=i % 2 == 1)
+
+        outputs = dict()
+        for folder, resolution in captures:
+            outputs.setdefault(folder, []).append(resolution)
+
+        page['outputs'] = outputs
+
+
+def group_domains(pages: list[dict]) -> dict[str, list[dict]]:
+    domains = dict()
+    for page in pages:
+        domains.setdefault(get_domain(page['url']), []).append(page)
+
+    return domains
+
+
+def plan_captures(jobs: list[dict], workers: int = 1) -> list[dict]:
+    """Turn the capture jobs into an ordered list of pages to load.
+
+    A single browser takes the pages of a domain one after the other, while
+    its connections and cache are warm. Several workers pull pages in turn
+    from every domain, largest first, so that they work on different domains
+    at the same time instead of queuing on the per-domain limit.
+    """
+
+    domains = group_domains(group_pages(jobs))
+
+    if workers > 1:
+        queues = sorted(domains.values(), key=len, reverse=True)
+        pages = [page for pages in itertools.zip_longest(*queues) for page in pages if page is not None]
+    else:
+        pages = [page for pages in domains.values() for page in pages]
+
+    order_resolutions(pages)
+    return pages
+
+
+def count_resizes(pages: list[dict]) -> int:
+    """Number of window size changes taking the pages in order."""
+
+    sizes = [
+        (resolution['width'], resolution['height'])
+        for page in pages
+        for resolutions in page['outputs'].values()
+        for resolution in resolutions
+    ]
+
+    return sum(1 for previous, size in zip(sizes, sizes[1:]) if previous != size)
+
+
+def estimate_plan(pages: list[dict],
+                  durations: dict[str, float],
+                  workers: int = 1,
+                  max_per_domain: int = 2) -> dict:
+    """Estimate the cost of the plan, from the mean capture duration of each domain in the manifest.
+
+    With several workers, the run lasts at least its total cost split between
+    the workers, and the cost of the largest domain split between the pages
+    it may load at the same time.
+    """
+
+    domain_costs = dict()
+    for domain, domain_pages in group_domains(pages).items():
+        captures = sum(len(resolutions) for page in domain_pages for resolutions in page['outputs'].values())
+        domain_costs[domain] = len(domain_pages) * ESTIMATED_LOAD_S + captures * durations.get(domain, ESTIMATED_CAPTURE_S)
+
+    cost = sum(domain_costs.values())
+    duration = cost
+    if workers > 1 and domain_costs:
+        duration = max(cost / workers, max(domain_costs.values()) / min(workers, max_per_domain))
+
+    return {
+        "pages": len(pages),
+        "captures": sum(len(resolutions) for page in pages for resolutions in page['outputs'].values()),
+        "domains": len(domain_costs),
+        "resizes": count_resizes(pages),
+        "cost_s": cost,
+        "duration_s": duration,
+        "domain_costs": domain_costs,
+    }
+
+
+def print_plan(pages: list[dict], estimate: dict):
+    for page in pages:
+        sizes = ', '.join(
+            f"{resolution['name']}" for resolutions in page['outputs'].values() for resolution in resolutions
+        )
+        print(f"{page['url']} [{page['category']}] {sizes}")
+
+    print(" > Domains:")
+    for domain, cost in sorted(estimate['domain_costs'].items(), key=lambda item: item[1], reverse=True):
+        print(f"   {domain}: {cost / 60:.1f} min")
+
+    print(f" > {estimate['pages']} pages, {estimate['captures']} screenshots, {estimate['domains']} domains, "
+          f"{estimate['resizes']} window resizes")
+    print(f" > Estimated {estimate['cost_s'] / 60:.1f} min of browser time, "
+          f"{estimate['duration_s'] / 60:.1f} min of run time")
+
+
+class DomainThrottle:
+    """Space the page loads of a same domain by at least delay seconds, across threads."""
+
+    def __init__(self, delay: float = DOMAIN_DELAY_S):
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.next_load: dict[str, float] = dict()
+
+    def wait(self, url: str):
+        domain = get_domain(url)
+
+        # book the slot, then sleep without holding the lock
+        with self.lock:
+            now = time.monotonic()
+            load_at = max(now, self.next_load.get(domain, 0))
+            self.next_load[domain] = load_at + self.delay
+
+        if load_at > now:
+            time.sleep(load_at - now)
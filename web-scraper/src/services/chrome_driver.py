@@ -0,0 +1,41 @@
+import os
+import shutil
+
+from selenium import webdriver
+from selenium.common import WebDriverException
+
+# Files that must not be shared between two running Chrome instances
+PROFILE_IGNORE = shutil.ignore_patterns(
+    'Singleton*',
+    'lockfile',
+    'Cache',
+    'Code Cache',
+    'GPUCache',
+    'ShaderCache',
+)
+
+
+def copy_profile(profile_dir: str, worker_folder: str) -> str:
+    """Copy the Chrome user data dir so that each worker gets its own isolated profile."""
+
+    destination = os.path.join(worker_folder, os.path.basename(os.path.normpath(profile_dir)))
+
+    if os.path.exists(destination):
+        shutil.rmtree(destination)
+
+    if os.path.exists(profile_dir):
+        shutil.copytree(profile_dir, destination, ignore=PROFILE_IGNORE)
+    else:
+        os.makedirs(destination)
+
+    return destination
+
+
+def is_browser_alive(driver: webdriver.Chrome) -> bool:
+    try:
+        # Try to interact with an element on the page
+        driver.execute_script("return document.readyState")
+        _ = driver.window_handles
+        return True  # If successful, the browser is still open
+    except WebDriverException:
+        return False  # WebDriverException is raised if the browser is closed
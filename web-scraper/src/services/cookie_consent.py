@@ -0,0 +1,214 @@
+import json
+import os
+import time
+
+from selenium import webdriver
+from selenium.common import WebDriverException
+from selenium.webdriver.common.by import By
+
+CONSENT_CONFIG = 'config/consent.json'
+CONSENT_SNAPSHOT = 'var/consent.json'
+
+# Time given to a consent banner to show up after the page load
+CONSENT_WAIT_MS = 5000
+POLL_INTERVAL_S = 0.25
+
+# Clicks the first visible accept button: known CMP selectors first (in the
+# document and in open shadow roots), then buttons whose text is an accept
+# label. Returns how the button was found, or null.
+CONSENT_SCRIPT = """
+const [selectors, texts] = arguments;
+
+function roots(root) {
+    const found = [root];
+    root.querySelectorAll('*').forEach((element) => {
+        if (element.shadowRoot) found.push(...roots(element.shadowRoot));
+    });
+    return found;
+}
+
+function isVisible(element) {
+    const rect = element.getBoundingClientRect();
+    const style = window.getComputedStyle(element);
+    return rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none';
+}
+
+function label(element) {
+    return (element.innerText || element.value || element.getAttribute('aria-label') || '')
+        .replace(/\\s+/g, ' ').trim().toLowerCase();
+}
+
+const allRoots = roots(document);
+
+for (const selector of selectors) {
+    for (const root of allRoots) {
+        const element = root.querySelector(selector);
+        if (element && isVisible(element)) {
+            element.click();
+            return {method: 'selector', match: selector};
+        }
+    }
+}
+
+const candidates = [];
+for (const root of allRoots) {
+    candidates.push(...root.querySelectorAll('button, a, [role=button], input[type=button], input[type=submit]'));
+}
+
+// the first label of the list wins, so "accept all" is preferred to "accept"
+for (const text of texts) {
+    const element = candidates.find((candidate) => label(candidate) === text && isVisible(candidate));
+    if (element) {
+        element.click();
+        return {method: 'text', match: text};
+    }
+}
+
+return null;
+"""
+
+# Copies the snapshot local storage of the page origin, before the page scripts run
+LOCAL_STORAGE_SCRIPT = """
+(() => {
+    const origins = %s;
+    const items = origins[location.origin];
+    if (!items) return;
+    try {
+        for (const [key, value] of Object.entries(items)) {
+            if (localStorage.getItem(key) === null) localStorage.setItem(key, value);
+        }
+    } catch (e) {}
+})();
+"""
+
+
+def load_consent_rules(path: str = CONSENT_CONFIG) -> dict:
+    """Return the CMP selectors, accept labels, consent frame hints and per-domain overrides.
+
+    frame_texts are labels too generic for a whole page ("ok"), only tried
+    inside consent frames. domains maps a host to its override: a selector
+    and a text tried first, a wait_ms, or skip to leave the banner alone.
+    """
+
+    with open(path, 'r') as f:
+        rules = json.load(f)
+
+    rules['texts'] = [text.lower() for text in rules.get('texts', [])]
+    rules['frame_texts'] = [text.lower() for text in rules.get('frame_texts', [])]
+    return rules
+
+
+def get_domain_rules(rules: dict, url: str) -> tuple[list[str], list[str], dict]:
+    """Return the selectors and labels to try on the URL, its domain override first."""
+
+    domain = url.split('/')[2]
+    override = rules.get('domains', {}).get(domain, {})
+
+    selectors = ([override['selector']] if 'selector' in override else []) + rules.get('selectors', [])
+    texts = ([override['text'].lower()] if 'text' in override else []) + rules.get('texts', [])
+
+    return selectors, texts, override
+
+
+def dismiss_consent(driver: webdriver.Chrome, rules: dict, url: str, wait_ms: int = CONSENT_WAIT_MS) -> dict | None:
+    """Click the accept button of the consent banner of the loaded page, if any shows up in time.
+
+    The page itself is searched first, then the iframes that look like
+    consent frames (Sourcepoint, Quantcast...), which scripts of the page
+    cannot reach. Returns how the banner was dismissed, or None.
+    """
+
+    selectors, texts, override = get_domain_rules(rules, url)
+    if override.get('skip', False):
+        return None
+
+    deadline = time.time() + override.get('wait_ms', wait_ms) / 1000
+
+    while True:
+        result = driver.execute_script(CONSENT_SCRIPT, selectors, texts)
+        if result is None:
+            result = dismiss_in_frames(driver, selectors, texts + rules.get('frame_texts', []),
+                                       rules.get('frames', []))
+
+        if result is not None or time.time() >= deadline:
+            return result
+
+        time.sleep(POLL_INTERVAL_S)
+
+
+def dismiss_in_frames(driver: webdriver.Chrome, selectors: list[str], texts: list[str], hints: list[str]) -> dict | None:
+    for frame in driver.find_elements(By.TAG_NAME, 'iframe'):
+        try:
+            name = ' '.join(filter(None, [frame.get_attribute('id'), frame.get_attribute('src'),
+                                          frame.get_attribute('title')])).lower()
+            if not any(hint in name for hint in hints):
+                continue
+
+            driver.switch_to.frame(frame)
+            result = driver.execute_script(CONSENT_SCRIPT, selectors, texts)
+        except WebDriverException:
+            result = None
+        finally:
+            driver.switch_to.default_content()
+
+        if result is not None:
+            return {**result, "frame": name}
+
+    return None
+
+
+def get_local_storage(driver: webdriver.Chrome) -> tuple[str, dict]:
+    """Return the origin of the loaded page and its local storage."""
+
+    return driver.execute_script(
+        "return [location.origin, Object.fromEntries(Object.entries(localStorage))];"
+    )
+
+
+def export_consent_snapshot(driver: webdriver.Chrome, local_storage: dict[str, dict], path: str = CONSENT_SNAPSHOT):
+    """Save the cookies of every domain and the local storage of each origin as a snapshot."""
+
+    snapshot = {
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "cookies": driver.execute_cdp_cmd('Network.getAllCookies', {})['cookies'],
+        "local_storage": local_storage,
+    }
+
+    if os.path.dirname(path) and not os.path.exists(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(f"{path}.tmp", path)
+
+    print(f"Consent snapshot saved to {path}: {len(snapshot['cookies'])} cookies, {len(local_storage)} origins")
+
+
+def read_consent_snapshot(path: str = CONSENT_SNAPSHOT) -> dict | None:
+    if not os.path.exists(path):
+        return None
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def apply_consent_snapshot(driver: webdriver.Chrome, snapshot: dict | None):
+    """Load the snapshot cookies and local storage in a fresh browser, before any page is opened."""
+
+    if snapshot is None:
+        return
+
+    # session cookies have no expiry, and partition keys are not accepted back
+    cookies = [
+        {key: value for key, value in cookie.items()
+         if key in ('name', 'value', 'domain', 'path', 'secure', 'httpOnly', 'sameSite', 'expires')
+         and not (key == 'expires' and value < 0)}
+        for cookie in snapshot['cookies']
+    ]
+
+    driver.execute_cdp_cmd('Network.setCookies', {"cookies": cookies})
+
+    if snapshot['local_storage']:
+        driver.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument', {
+            "source": LOCAL_STORAGE_SCRIPT % json.dumps(snapshot['local_storage']),
+        })
@@ -0,0 +1,35 @@
+from selenium import webdriver
+
+from src.models.Resolution import Resolution
+
+
+def emulate_resolution(driver: webdriver.Chrome, resolution: Resolution, height: int | None = None):
+    """Switch the viewport of the live tab to the given device, without reloading the page.
+
+    Width, height, pixel ratio and touch support are emulated through DevTools.
+    The user agent is left untouched, as changing it only has an effect on the
+    next page load.
+    """
+
+    width = resolution['width']
+    height = height or resolution['height']
+    is_touch = resolution.get('is_touch', False)
+
+    driver.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', {
+        "width": width,
+        "height": height,
+        "screenWidth": width,
+        "screenHeight": height,
+        "deviceScaleFactor": resolution.get('pixel_ratio', 1),
+        "mobile": is_touch,
+    })
+
+    driver.execute_cdp_cmd('Emulation.setTouchEmulationEnabled', {
+        "enabled": is_touch,
+        "maxTouchPoints": 5 if is_touch else 1,
+    })
+
+
+def clear_emulation(driver: webdriver.Chrome):
+    driver.execute_cdp_cmd('Emulation.clearDeviceMetricsOverride', {})
+    driver.execute_cdp_cmd('Emulation.setTouchEmulationEnabled', {"enabled": False})
@@ -0,0 +1,130 @@
+import json
+import os
+
+from selenium import webdriver
+
+LABELS_CONFIG = 'config/labels.json'
+
+# Boxes smaller than this (in image pixels) after clipping are dropped
+MIN_BOX_PX = 4
+
+# Collects the boxes of every class in a single round trip.
+# x/y are document coordinates, vy the position in the viewport for fixed elements.
+BOXES_SCRIPT = """
+const selectors = arguments[0];
+const boxes = [];
+
+selectors.forEach((selector, cls) => {
+    document.querySelectorAll(selector).forEach((element) => {
+        const rect = element.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) return;
+
+        const style = window.getComputedStyle(element);
+        if (style.visibility === 'hidden' || style.display === 'none' || parseFloat(style.opacity) === 0) return;
+
+        boxes.push({
+            cls: cls,
+            x: rect.left + window.scrollX,
+            y: rect.top + window.scrollY,
+            vy: rect.top,
+            width: rect.width,
+            height: rect.height,
+            fixed: style.position === 'fixed',
+        });
+    });
+});
+
+return {
+    boxes: boxes,
+    viewport_width: window.innerWidth,
+    viewport_height: window.innerHeight,
+    scroll_y: window.scrollY,
+};
+"""
+
+
+def load_label_classes(path: str = LABELS_CONFIG) -> dict[str, str]:
+    """Return the CSS selector of every label class, in class id order."""
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def collect_boxes(driver: webdriver.Chrome, classes: dict[str, str]) -> dict:
+    """Collect the bounding boxes of every label class on the loaded page."""
+    return driver.execute_script(BOXES_SCRIPT, list(classes.values()))
+
+
+def to_yolo_lines(page: dict,
+                  image_width: int,
+                  image_height: int,
+                  origin_y: float = 0,
+                  page_height: float | None = None) -> list[str]:
+    """Convert the boxes of the page to YOLO lines for an image of the given size.
+
+    origin_y is the document position (CSS pixels) of the top of the image:
+    the scroll offset for a viewport screenshot, the tile offset for tiles.
+    The scale to CSS pixels is taken from the image width, so both device
+    pixel and CSS pixel screenshots are handled.
+
+    page_height (CSS pixels) is given for stitched captures, where fixed
+    elements appear once: at the top of the page, or at its bottom for those
+    in the bottom half of the viewport.
+    """
+
+    scale = image_width / page['viewport_width']
+    lines = []
+
+    for box in page['boxes']:
+        y = box['y']
+
+        if page_height is not None and box['fixed']:
+            if box['vy'] > page['viewport_height'] / 2:
+                y = page_height - (page['viewport_height'] - box['vy'])
+            else:
+                y = box['vy']
+
+        left = max(0.0, box['x'] * scale)
+        right = min(float(image_width), (box['x'] + box['width']) * scale)
+        top = max(0.0, (y - origin_y) * scale)
+        bottom = min(float(image_height), (y - origin_y + box['height']) * scale)
+
+        if right - left < MIN_BOX_PX or bottom - top < MIN_BOX_PX:
+            continue
+
+        lines.append(
+            f"{box['cls']} "
+            f"{(left + right) / 2 / image_width:.6f} "
+            f"{(top + bottom) / 2 / image_height:.6f} "
+            f"{(right - left) / image_width:.6f} "
+            f"{(bottom - top) / image_height:.6f}"
+        )
+
+    return lines
+
+
+def write_labels(image_path: str, lines: list[str]) -> str:
+    """Write the YOLO label file next to the image (same name, .txt)."""
+
+    output = f"{os.path.splitext(image_path)[0]}.txt"
+    with open(output, 'w') as f:
+        f.write('\n'.join(lines))
+
+    return output
+
+
+def write_class_map(output_folder: str, classes: dict[str, str]):
+    """Write classes.txt and a data.yaml that element-detector can train on directly."""
+
+    if not os.path.exists(output_folder):
+        os.makedirs(output_folder)
+
+    with open(os.path.join(output_folder, 'classes.txt'), 'w') as f:
+        f.write('\n'.join(classes.keys()))
+
+    with open(os.path.join(output_folder, 'data.yaml'), 'w') as f:
+        f.write(f"path: {os.path.abspath(output_folder)}\n")
+        f.write("train: .\n")
+        f.write("val: .\n")
+        f.write("names:\n")
+        for i, name in enumerate(classes.keys()):
+            f.write(f"  {i}: {name}\n")
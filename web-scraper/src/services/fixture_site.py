@@ -0,0 +1,183 @@
+import io
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+# Delay of the lazy-loaded images and page parts, like a slow network
+LAZY_DELAY_S = 0.2
+
+PAGE_STYLE = """
+body { margin: 0; font-family: sans-serif; }
+section { padding: 24px; border-bottom: 1px solid #ccc; }
+h2 { margin: 0 0 12px 0; }
+button { padding: 8px 16px; margin: 4px; }
+.cards { display: flex; flex-wrap: wrap; gap: 12px; }
+.card { width: 220px; border: 1px solid #999; padding: 8px; }
+.card img { width: 220px; height: 140px; display: block; background: #eee; }
+header.sticky { position: fixed; top: 0; left: 0; right: 0; height: 64px; background: #223; color: #fff; z-index: 10; }
+footer.sticky { position: fixed; bottom: 0; left: 0; right: 0; height: 48px; background: #322; color: #fff; z-index: 10; }
+.parallax { height: 400px; background-attachment: fixed; background-size: cover; }
+"""
+
+LAZY_SCRIPT = """
+const observer = new IntersectionObserver((entries) => {
+    entries.forEach((entry) => {
+        if (!entry.isIntersecting) return;
+        entry.target.src = entry.target.dataset.src;
+        observer.unobserve(entry.target);
+    });
+});
+document.querySelectorAll('img[data-src]').forEach((img) => observer.observe(img));
+
+// more sections are appended when the bottom is reached, a few times
+let loaded = 0;
+window.addEventListener('scroll', () => {
+    if (loaded >= 3 || window.innerHeight + window.scrollY < document.body.scrollHeight - 10) return;
+    loaded += 1;
+    fetch('/fragment/' + loaded).then((response) => response.text()).then((html) => {
+        document.querySelector('main').insertAdjacentHTML('beforeend', html);
+        document.querySelectorAll('img[data-src]').forEach((img) => observer.observe(img));
+    });
+});
+"""
+
+PARALLAX_SCRIPT = """
+window.addEventListener('scroll', () => {
+    document.querySelectorAll('.layer').forEach((layer, i) => {
+        layer.style.transform = `translateY(${window.scrollY * (0.2 + i % 3 * 0.1)}px)`;
+    });
+});
+"""
+
+# Fixture pages: number of sections and what they are made of
+FIXTURE_PAGES = {
+    'short': {"sections": 1},
+    'tall': {"sections": 60},
+    'sticky': {"sections": 20, "sticky": True},
+    'parallax': {"sections": 20, "parallax": True},
+    'lazy': {"sections": 10, "lazy": True},
+}
+
+
+def render_section(seed: int, lazy: bool = False, parallax: bool = False) -> str:
+    """A deterministic section with a title, text, buttons, links and image cards."""
+
+    rng = random.Random(seed)
+    words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+    text = ' '.join(rng.choice(words) for _ in range(rng.randint(30, 80)))
+    color = f"#{rng.randint(0, 0xFFFFFF):06x}"
+
+    cards = ''.join(
+        f'<div class="card"><img {"data-src" if lazy else "src"}="/img/{seed * 10 + i}.png" alt="">'
+        f'<a href="#card-{seed}-{i}">Card {seed}.{i}</a></div>'
+        for i in range(rng.randint(2, 6))
+    )
+
+    layer = f'<div class="layer" style="height:40px;background:{color}"></div>' if parallax else ''
+    background = f' class="parallax" style="background-image:url(/img/{seed}.png)"' if parallax and seed % 3 == 0 else ''
+
+    return (
+        f'<section id="section-{seed}"{background} style="background-color:{color}22">{layer}'
+        f'<h2>Section {seed}</h2><p>{text}</p>'
+        f'<button>Action {seed}</button><a href="#section-{seed + 1}">Next</a>'
+        f'<form><input type="text" placeholder="Field {seed}"></form>'
+        f'<div class="cards">{cards}</div></section>'
+    )
+
+
+def render_page(name: str) -> str:
+    page = FIXTURE_PAGES[name]
+    lazy, parallax, sticky = page.get('lazy', False), page.get('parallax', False), page.get('sticky', False)
+
+    sections = ''.join(render_section(seed, lazy, parallax) for seed in range(page['sections']))
+    header = '<header class="sticky"><nav><a href="#">Home</a> <a href="#">Shop</a></nav></header>' if sticky else ''
+    footer = '<footer class="sticky"><button>Accept cookies</button></footer>' if sticky else ''
+    padding = ' style="padding-top:64px;padding-bottom:48px"' if sticky else ''
+
+    scripts = ''
+    if lazy:
+        scripts += f"<script>{LAZY_SCRIPT}</script>"
+    if parallax:
+        scripts += f"<script>{PARALLAX_SCRIPT}</script>"
+
+    return (
+        f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{name}</title>'
+        f'<meta name="viewport" content="width=device-width, initial-scale=1">'
+        f'<style>{PAGE_STYLE}</style></head>'
+        f'<body>{header}<main{padding}>{sections}</main>{footer}{scripts}</body></html>'
+    )
+
+
+def render_image(seed: int) -> bytes:
+    """A deterministic 440x280 PNG with a few shapes."""
+
+    rng = random.Random(seed)
+    image = Image.new('RGB', (440, 280), tuple(rng.randint(0, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+
+    for _ in range(6):
+        x, y = rng.randint(0, 400), rng.randint(0, 240)
+        draw.rectangle((x, y, x + rng.randint(20, 120), y + rng.randint(20, 80)),
+                       fill=tuple(rng.randint(0, 255) for _ in range(3)))
+
+    output = io.BytesIO()
+    image.save(output, 'PNG')
+    return output.getvalue()
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?')[0].strip('/')
+
+        if path in FIXTURE_PAGES:
+            return self.send(200, 'text/html', render_page(path).encode())
+
+        match = re.fullmatch(r'fragment/(\d+)', path)
+        if match:
+            time.sleep(LAZY_DELAY_S)
+            seed = 1000 + int(match.group(1)) * 10
+            html = ''.join(render_section(seed + i, lazy=True) for i in range(5))
+            return self.send(200, 'text/html', html.encode())
+
+        match = re.fullmatch(r'img/(\d+)\.png', path)
+        if match:
+            if 'lazy' in (self.headers.get('Referer') or ''):
+                time.sleep(LAZY_DELAY_S)
+            return self.send(200, 'image/png', render_image(int(match.group(1))))
+
+        self.send(404, 'text/plain', b'not found')
+
+    def send(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureSite:
+    """Serve the fixture pages on a local port, in a background thread."""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = ThreadingHTTPServer((host, port), FixtureHandler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def get_url(self, page: str) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/{page}"
+
+    def __enter__(self) -> 'FixtureSite':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
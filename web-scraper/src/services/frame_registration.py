@@ -0,0 +1,94 @@
+import numpy as np
+from PIL import Image
+
+# Minimum number of rows agreeing on an offset to trust the registration
+MIN_VOTES = 8
+
+# Fixed headers/footers taller than this part of the frame are not considered fixed
+MAX_FIXED_RATIO = 1 / 3
+
+ROW_HASH_SEED = 0x5EED
+
+
+def get_row_hashes(frame: Image.Image) -> np.ndarray:
+    """Hash every row of the frame into an uint64, so that rows can be compared in one vector op."""
+
+    pixels = np.asarray(frame.convert('RGB'), dtype=np.uint8)
+    height, width, _ = pixels.shape
+
+    rows = pixels.reshape(height, width * 3)
+
+    # pad rows to a multiple of 8 bytes to read them as uint64 words
+    padding = -rows.shape[1] % 8
+    if padding:
+        rows = np.pad(rows, ((0, 0), (0, padding)))
+
+    words = np.ascontiguousarray(rows).view(np.uint64)
+    weights = np.random.default_rng(ROW_HASH_SEED).integers(
+        1, np.iinfo(np.uint64).max, size=words.shape[1], dtype=np.uint64
+    ) | np.uint64(1)
+
+    # multiply-add with wrap-around, rows with the same pixels get the same hash
+    return (words * weights).sum(axis=1, dtype=np.uint64)
+
+
+def find_fixed_bands(previous: np.ndarray, current: np.ndarray) -> tuple[int, int]:
+    """Return the height of the top and bottom regions that did not move between two frames.
+
+    Those are sticky headers, cookie bars or bottom navigations, repeated on
+    every frame at the same place.
+    """
+
+    limit = int(len(previous) * MAX_FIXED_RATIO)
+    same = previous == current
+
+    top = limit if same[:limit].all() else int(np.argmin(same[:limit]))
+    bottom = limit if same[::-1][:limit].all() else int(np.argmin(same[::-1][:limit]))
+
+    return top, bottom
+
+
+def find_vertical_offset(previous: np.ndarray,
+                         current: np.ndarray,
+                         expected: int,
+                         top: int = 0,
+                         bottom: int = 0) -> int:
+    """Find how many rows the content moved up between two frames.
+
+    Every row that appears exactly once in both frames votes for the offset
+    between its two positions, and the most voted offset wins. Rows inside the
+    fixed bands are ignored. Falls back to the expected offset when the frames
+    do not have enough distinct rows (plain backgrounds).
+    """
+
+    height = len(previous)
+    previous = previous[top:height - bottom]
+    current = current[top:height - bottom]
+
+    previous_rows, previous_index = unique_rows(previous)
+    current_rows, current_index = unique_rows(current)
+
+    _, previous_match, current_match = np.intersect1d(
+        previous_rows, current_rows, assume_unique=True, return_indices=True
+    )
+
+    offsets = previous_index[previous_match] - current_index[current_match]
+    offsets = offsets[offsets > 0]
+
+    if len(offsets) < MIN_VOTES:
+        return expected
+
+    votes = np.bincount(offsets)
+    offset = int(votes.argmax())
+
+    if votes[offset] < MIN_VOTES:
+        return expected
+
+    return offset
+
+
+def unique_rows(hashes: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Return the hashes appearing only once in the frame, with their row index."""
+
+    rows, index, counts = np.unique(hashes, return_index=True, return_counts=True)
+    return rows[counts == 1], index[counts == 1]
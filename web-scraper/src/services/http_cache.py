@@ -0,0 +1,357 @@
+import hashlib
+import http.client
+import json
+import os
+import sqlite3
+import ssl
+import subprocess
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from selenium import webdriver
+
+CACHE_FOLDER = 'var/http-cache'
+
+# cache: serve stored responses, fetch and store the others
+# record: always fetch, store every response
+# replay: only serve stored responses, never touch the network
+CACHE_MODES = ['cache', 'record', 'replay']
+
+UPSTREAM_TIMEOUT_S = 30
+
+# Query parameters only used to bust caches, ignored in the request key
+IGNORED_PARAMS = {'_', 'cb', 'rnd', 'random', 'timestamp', 'ts'}
+
+# Statuses worth storing, the others are fetched again on the next load
+CACHEABLE_STATUSES = {200, 203, 204, 206, 300, 301, 302, 307, 308, 404, 410}
+
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization', 'proxy-connection',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'content-length',
+}
+
+# Conditional requests would get bodiless 304 answers from the origin
+CONDITIONAL_HEADERS = {'if-none-match', 'if-modified-since', 'if-match', 'if-unmodified-since', 'if-range'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    method TEXT NOT NULL,
+    url TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    reason TEXT NOT NULL,
+    headers TEXT NOT NULL,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    stored_at REAL NOT NULL
+)
+"""
+
+
+def get_request_key(method: str, url: str, body: bytes = b'') -> str:
+    """Identify a request by its method, its URL without cache busting parameters and its body."""
+
+    parts = urlsplit(url)
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if key not in IGNORED_PARAMS))
+    normalized = urlunsplit((parts.scheme, parts.netloc.lower(), parts.path or '/', query, ''))
+
+    key = f"{method} {normalized}"
+    if body:
+        key += f" {hashlib.sha256(body).hexdigest()}"
+
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class ResponseStore:
+    """HTTP responses on disk: bodies stored once by content hash, indexed by request in SQLite.
+
+    Safe to share between the threads of the proxy, and between runs.
+    """
+
+    def __init__(self, folder: str = CACHE_FOLDER):
+        self.folder = folder
+        self.lock = threading.Lock()
+
+        if not os.path.exists(os.path.join(folder, 'objects')):
+            os.makedirs(os.path.join(folder, 'objects'))
+
+        self.db = sqlite3.connect(os.path.join(folder, 'index.sqlite'), check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(SCHEMA)
+        self.db.commit()
+
+    def get_object_path(self, digest: str) -> str:
+        return os.path.join(self.folder, 'objects', digest[:2], digest)
+
+    def get(self, key: str) -> dict | None:
+        with self.lock:
+            row = self.db.execute("SELECT * FROM responses WHERE key = ?", (key,)).fetchone()
+
+        if row is None or not os.path.exists(self.get_object_path(row['body'])):
+            return None
+
+        with open(self.get_object_path(row['body']), 'rb') as f:
+            body = f.read()
+
+        return {
+            "status": row['status'],
+            "reason": row['reason'],
+            "headers": json.loads(row['headers']),
+            "body": body,
+            "stored_at": row['stored_at'],
+        }
+
+    def put(self, key: str, method: str, url: str, status: int, reason: str, headers: list, body: bytes):
+        digest = hashlib.sha256(body).hexdigest()
+        path = self.get_object_path(digest)
+
+        # the same asset served under several URLs is stored once
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.{threading.get_ident()}.tmp", 'wb') as f:
+                f.write(body)
+            os.replace(f"{path}.{threading.get_ident()}.tmp", path)
+
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, method, url, status, reason, json.dumps(headers), digest, len(body), time.time())
+            )
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def ensure_certificate(folder: str = CACHE_FOLDER) -> tuple[str, str]:
+    """Return the certificate and key the proxy presents for HTTPS sites, created with openssl if missing.
+
+    A single self-signed certificate is used for every host: browsers using
+    the proxy must be started with --ignore-certificate-errors.
+    """
+
+    cert, key = os.path.join(folder, 'proxy-cert.pem'), os.path.join(folder, 'proxy-key.pem')
+
+    if not os.path.exists(cert) or not os.path.exists(key):
+        os.makedirs(folder, exist_ok=True)
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '3650',
+            '-subj', '/CN=web-scraper http cache', '-keyout', key, '-out', cert,
+        ], check=True, capture_output=True)
+
+    return cert, key
+
+
+class CacheHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    # host:port of the HTTPS tunnel the requests come from, None for plain HTTP
+    tunnel = None
+
+    def do_CONNECT(self):
+        self.send_response(200, 'Connection Established')
+        self.end_headers()
+
+        # decrypt the tunnel, its requests are then handled like plain HTTP ones
+        self.tunnel = self.path
+        try:
+            self.connection = self.server.proxy.tls.wrap_socket(self.connection, server_side=True)
+        except (ssl.SSLError, OSError):
+            self.close_connection = True
+            return
+
+        self.rfile = self.connection.makefile('rb', self.rbufsize)
+        self.wfile = self.connection.makefile('wb')
+        self.close_connection = False
+
+    def do_GET(self):
+        self.server.proxy.handle(self)
+
+    do_HEAD = do_POST = do_PUT = do_DELETE = do_OPTIONS = do_PATCH = do_GET
+
+    def get_url(self) -> str:
+        if self.tunnel is None:
+            return self.path
+
+        host = self.tunnel[:-4] if self.tunnel.endswith(':443') else self.tunnel
+        return f"https://{host}{self.path}"
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def reply(self, status: int, reason: str, headers: list, body: bytes, cache_status: str):
+        self.send_response(status, reason)
+
+        for name, value in headers:
+            self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Cache', cache_status)
+        self.end_headers()
+
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class CachingProxy:
+    """HTTP(S) proxy recording every response to a ResponseStore and serving them on the next loads.
+
+    All the browsers of a run (and of several runs, with the standalone
+    cache_proxy.py) share one proxy. HTTPS tunnels are decrypted with the
+    certificate of ensure_certificate. In replay mode, a request that was
+    not recorded gets a 404 instead of reaching the network, so a recorded
+    capture can be replayed offline.
+    """
+
+    def __init__(self,
+                 folder: str = CACHE_FOLDER,
+                 mode: str = 'cache',
+                 host: str = '127.0.0.1',
+                 port: int = 0,
+                 max_age: float | None = None):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode}, available: {', '.join(CACHE_MODES)}")
+
+        self.mode = mode
+        self.max_age = max_age
+        self.store = ResponseStore(folder)
+
+        cert, key = ensure_certificate(folder)
+        self.tls = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.tls.load_cert_chain(cert, key)
+        self.tls.set_alpn_protocols(['http/1.1'])
+
+        self.upstream_tls = ssl.create_default_context()
+
+        self.server = ThreadingHTTPServer((host, port), CacheHandler)
+        self.server.daemon_threads = True
+        self.server.proxy = self
+        self.thread = threading.Thread(target=self.server.serve_forever, name='http-cache', daemon=True)
+
+        self.lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stored": 0, "served_bytes": 0, "fetched_bytes": 0}
+        self.missed_urls: list[str] = []
+
+    def get_address(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"{host}:{port}"
+
+    def handle(self, request: CacheHandler):
+        url = request.get_url()
+        body = request.read_body()
+        key = get_request_key(request.command, url, body)
+
+        if request.headers.get('Upgrade'):
+            # websockets are not proxied
+            return request.reply(502, 'Bad Gateway', [], b'', 'BYPASS')
+
+        if self.mode != 'record':
+            response = self.store.get(key)
+            if response is not None and (self.max_age is None or self.mode == 'replay'
+                                         or time.time() - response['stored_at'] < self.max_age):
+                self.count(hits=1, served_bytes=len(response['body']))
+                return request.reply(response['status'], response['reason'], response['headers'],
+                                     response['body'], 'HIT')
+
+        if self.mode == 'replay':
+            self.count(misses=1)
+            with self.lock:
+                self.missed_urls.append(url)
+            return request.reply(404, 'Not Recorded', [], b'', 'MISS')
+
+        try:
+            status, reason, headers, content = self.fetch(request.command, url, request.headers, body)
+        except (OSError, http.client.HTTPException) as e:
+            self.count(misses=1)
+            return request.reply(502, 'Bad Gateway', [], str(e).encode(), 'ERROR')
+
+        self.count(misses=1, fetched_bytes=len(content))
+
+        # in cache mode, only reads are stored; in record mode, everything is
+        if status in CACHEABLE_STATUSES and (request.command in ('GET', 'HEAD') or self.mode == 'record'):
+            self.store.put(key, request.command, url, status, reason, headers, content)
+            self.count(stored=1)
+
+        request.reply(status, reason, headers, content, 'MISS')
+
+    def fetch(self, method: str, url: str, request_headers, body: bytes) -> tuple[int, str, list, bytes]:
+        parts = urlsplit(url)
+
+        if parts.scheme == 'https':
+            connection = http.client.HTTPSConnection(parts.netloc, timeout=UPSTREAM_TIMEOUT_S,
+                                                     context=self.upstream_tls)
+        else:
+            connection = http.client.HTTPConnection(parts.netloc, timeout=UPSTREAM_TIMEOUT_S)
+
+        headers = {
+            name: value for name, value in request_headers.items()
+            if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() not in CONDITIONAL_HEADERS
+        }
+
+        try:
+            path = urlunsplit(('', '', parts.path or '/', parts.query, ''))
+            connection.request(method, path, body=body or None, headers=headers)
+            response = connection.getresponse()
+            content = response.read()
+
+            # the body is kept encoded (gzip, br...), its headers are kept as is
+            response_headers = [
+                (name, value) for name, value in response.getheaders()
+                if name.lower() not in HOP_BY_HOP_HEADERS and name.lower() != 'alt-svc'
+            ]
+
+            return response.status, response.reason, response_headers, content
+        finally:
+            connection.close()
+
+    def count(self, **values):
+        with self.lock:
+            for name, value in values.items():
+                self.stats[name] += value
+
+    def get_stats(self) -> dict:
+        with self.lock:
+            return {**self.stats, "missed_urls": list(self.missed_urls)}
+
+    def print_summary(self):
+        stats = self.get_stats()
+        total = stats['hits'] + stats['misses']
+
+        print(f"HTTP cache ({self.mode}): {stats['hits']}/{total} hits, "
+              f"{stats['served_bytes'] / 1024 / 1024:.1f} MB served from cache, "
+              f"{stats['fetched_bytes'] / 1024 / 1024:.1f} MB fetched, {stats['stored']} responses stored")
+
+        if self.mode == 'replay' and stats['missed_urls']:
+            print(f" > {len(stats['missed_urls'])} requests were not recorded, e.g. {stats['missed_urls'][0]}")
+
+    def start(self) -> 'CachingProxy':
+        self.thread.start()
+        print(f"HTTP cache ({self.mode}) listening on {self.get_address()}")
+        return self
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.store.close()
+
+    def __enter__(self) -> 'CachingProxy':
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def use_proxy(options: webdriver.ChromeOptions, address: str):
+    """Send every request of the browser through the caching proxy at host:port."""
+
+    options.add_argument(f'--proxy-server=http://{address}')
+    options.add_argument('--proxy-bypass-list=<-loopback>')
+    options.add_argument('--ignore-certificate-errors')
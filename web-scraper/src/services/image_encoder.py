@@ -0,0 +1,189 @@
+import io
+import os
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable
+
+import numpy as np
+from PIL import Image
+
+from src.services.metrics import span
+
+# Output formats and their file extension.
+# npy keeps the raw RGB array, memory-mapped by the element-detector page sources.
+OUTPUT_FORMATS = {
+    'png': '.png',
+    'webp': '.webp',
+    'jpeg': '.jpg',
+    'npy': '.npy',
+}
+
+# zlib level of the PNG files: 1 is several times faster than 9, for ~15% larger files
+PNG_COMPRESS_LEVEL = 6
+JPEG_QUALITY = 90
+
+ENCODER_WORKERS = 2
+
+# Images waiting to be encoded before the capture thread waits for the encoder
+MAX_PENDING = 4
+
+
+def get_output_path(path: str, output_format: str) -> str:
+    return os.path.splitext(path)[0] + OUTPUT_FORMATS[output_format]
+
+
+def encode_image(image: Image.Image | bytes,
+                 path: str,
+                 output_format: str = 'png',
+                 compress_level: int = PNG_COMPRESS_LEVEL,
+                 quality: int = JPEG_QUALITY) -> str:
+    """Write the image (or the PNG bytes of a browser screenshot) at path, in the output format.
+
+    The file is written under a temporary name then renamed, so a reader
+    never sees a partial image. Returns the path, with the format extension.
+    """
+
+    path = get_output_path(path, output_format)
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+
+    with span('encode', format=output_format):
+        try:
+            if isinstance(image, bytes) and output_format == 'png':
+                # already encoded by the browser
+                with open(tmp_path, 'wb') as f:
+                    f.write(image)
+            else:
+                if isinstance(image, bytes):
+                    image = Image.open(io.BytesIO(image))
+
+                if output_format == 'png':
+                    image.save(tmp_path, 'PNG', compress_level=compress_level)
+                elif output_format == 'webp':
+                    image.save(tmp_path, 'WEBP', lossless=True)
+                elif output_format == 'jpeg':
+                    image.convert('RGB').save(tmp_path, 'JPEG', quality=quality)
+                else:
+                    with open(tmp_path, 'wb') as f:
+                        np.save(f, np.asarray(image.convert('RGB')))
+
+            os.replace(tmp_path, path)
+        except BaseException:
+            # no partial file left behind
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    return path
+
+
+class ImageEncoder:
+    """Encode and write images in a pool, off the capture thread.
+
+    submit returns right away with the final path, unless max_pending images
+    are already waiting: the capture then waits for the encoder, which bounds
+    memory. Pillow releases the GIL while compressing, so threads are enough
+    in most cases; processes copy every image to the worker but scale on
+    any encoder.
+    """
+
+    def __init__(self,
+                 output_format: str = 'png',
+                 compress_level: int = PNG_COMPRESS_LEVEL,
+                 quality: int = JPEG_QUALITY,
+                 workers: int = ENCODER_WORKERS,
+                 max_pending: int = MAX_PENDING,
+                 processes: bool = False):
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format {output_format}, available: {', '.join(OUTPUT_FORMATS)}")
+
+        self.output_format = output_format
+        self.compress_level = compress_level
+        self.quality = quality
+
+        self.executor: Executor = (ProcessPoolExecutor(max_workers=workers) if processes
+                                   else ThreadPoolExecutor(max_workers=workers, thread_name_prefix='encoder'))
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+        self.lock = threading.Lock()
+        # notified each time a queued image is written and its callback has run
+        self.written = threading.Condition(self.lock)
+        self.pending: set[Future] = set()
+        self.errors: list[Exception] = []
+
+    def get_path(self, path: str) -> str:
+        return get_output_path(path, self.output_format)
+
+    def submit(self,
+               image: Image.Image | bytes,
+               path: str,
+               on_saved: Callable[[str, Exception | None], None] | None = None) -> str:
+        """Queue the image to be written at path, and return the final path.
+
+        on_saved is called from the encoder with the path and None once the
+        file is written, or with the error if it could not be.
+        """
+
+        path = self.get_path(path)
+
+        with span('encode_wait'):
+            self.slots.acquire()
+
+        try:
+            future = self.executor.submit(encode_image, image, path, self.output_format, self.compress_level,
+                                          self.quality)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        with self.lock:
+            self.pending.add(future)
+
+        def done(future: Future):
+            self.slots.release()
+
+            try:
+                error = future.exception()
+                if error is not None:
+                    print(f"Cannot write {path}: {error}")
+                    with self.lock:
+                        self.errors.append(error)
+
+                if on_saved is not None:
+                    on_saved(path, error)
+            finally:
+                # only pending until its callback ran, so wait returns with the manifest up to date
+                with self.lock:
+                    self.pending.discard(future)
+                    self.written.notify_all()
+
+        future.add_done_callback(done)
+        return path
+
+    def wait(self):
+        """Wait for every queued image to be written and its on_saved callback to have run."""
+
+        with self.lock:
+            self.written.wait_for(lambda: not self.pending)
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+
+        if self.errors:
+            print(f" > {len(self.errors)} images could not be written")
+
+
+def save_image(image: Image.Image | bytes,
+               path: str,
+               encoder: ImageEncoder | None = None,
+               on_saved: Callable[[str, Exception | None], None] | None = None) -> str:
+    """Write the image through the encoder, or right away as PNG without one. Returns the final path."""
+
+    if encoder is not None:
+        return encoder.submit(image, path, on_saved)
+
+    path = encode_image(image, path)
+    if on_saved is not None:
+        on_saved(path, None)
+
+    return path
@@ -0,0 +1,215 @@
+import functools
+import json
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+ENABLED = False
+
+# Events of the run, one JSON object per line
+EVENTS_FILE = None
+
+# Labels of the page being captured (url, resolution...), per thread
+CONTEXT = threading.local()
+
+METRICS_LOCK = threading.Lock()
+COUNTERS: dict[str, float] = dict()
+HISTOGRAMS: dict[str, dict] = dict()
+
+
+class Span:
+    """Time a stage, then add it to its histogram and emit it as an event."""
+
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name: str, labels: dict):
+        self.name = name
+        self.labels = labels
+        self.start = 0.0
+
+    def __enter__(self) -> 'Span':
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        duration = time.perf_counter() - self.start
+        record_duration(self.name, duration)
+
+        if EVENTS_FILE is not None:
+            emit({
+                "span": self.name,
+                "duration_ms": round(duration * 1000, 3),
+                **getattr(CONTEXT, 'labels', {}),
+                **self.labels,
+                **({"error": error_type.__name__} if error_type else {}),
+            })
+
+
+class NullSpan:
+    """What span() returns when metrics are disabled: nothing is measured."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def configure_metrics(events_path: str | None = None, enabled: bool = True):
+    """Enable the metrics, and write the span events to events_path (JSON lines) if given."""
+
+    global ENABLED, EVENTS_FILE
+
+    ENABLED = enabled
+    if enabled and events_path is not None:
+        folder = os.path.dirname(events_path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        EVENTS_FILE = open(events_path, 'a', buffering=1)
+
+
+def close_metrics():
+    global ENABLED, EVENTS_FILE
+
+    if EVENTS_FILE is not None:
+        EVENTS_FILE.close()
+
+    ENABLED = False
+    EVENTS_FILE = None
+
+
+def set_metrics_context(**labels):
+    """Attach labels (url, resolution...) to every event of the current thread."""
+    if ENABLED:
+        CONTEXT.labels = labels
+
+
+def span(name: str, **labels) -> Span | NullSpan:
+    """Measure the stage run in the with block (load, wait, scroll, capture, crop, glue, save...)."""
+
+    if not ENABLED:
+        return NULL_SPAN
+
+    return Span(name, labels)
+
+
+def timed(name: str):
+    """Decorator measuring every call of the function as a span."""
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return function(*args, **kwargs)
+
+            with Span(name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def increment(name: str, value: float = 1):
+    """Add to a counter (frames, pages, bytes written...)."""
+
+    if not ENABLED:
+        return
+
+    with METRICS_LOCK:
+        COUNTERS[name] = COUNTERS.get(name, 0) + value
+
+
+def record_duration(name: str, duration: float):
+    with METRICS_LOCK:
+        histogram = HISTOGRAMS.get(name)
+        if histogram is None:
+            histogram = HISTOGRAMS[name] = {"buckets": [0] * len(HISTOGRAM_BUCKETS), "sum": 0.0, "count": 0}
+
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if duration <= bound:
+                histogram['buckets'][i] += 1
+                break
+
+        histogram['sum'] += duration
+        histogram['count'] += 1
+
+
+def emit(event: dict):
+    event['time'] = round(time.time(), 3)
+    event['thread'] = threading.current_thread().name
+    line = json.dumps(event) + '\n'
+
+    with METRICS_LOCK:
+        if EVENTS_FILE is not None:
+            EVENTS_FILE.write(line)
+
+
+def get_prometheus_text() -> str:
+    """Counters and stage histograms in the Prometheus text exposition format."""
+
+    lines = []
+
+    with METRICS_LOCK:
+        for name, value in sorted(COUNTERS.items()):
+            lines.append(f"# TYPE capture_{name}_total counter")
+            lines.append(f"capture_{name}_total {value}")
+
+        if HISTOGRAMS:
+            lines.append("# TYPE capture_stage_seconds histogram")
+
+        for name, histogram in sorted(HISTOGRAMS.items()):
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BUCKETS, histogram['buckets']):
+                cumulative += count
+                lines.append(f'capture_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+
+            lines.append(f'capture_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'capture_stage_seconds_sum{{stage="{name}"}} {histogram["sum"]:.6f}')
+            lines.append(f'capture_stage_seconds_count{{stage="{name}"}} {histogram["count"]}')
+
+    return '\n'.join(lines) + '\n'
+
+
+def write_prometheus(path: str):
+    """Dump the metrics for the node exporter textfile collector (written atomically)."""
+
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+
+    with open(f"{path}.tmp", 'w') as f:
+        f.write(get_prometheus_text())
+
+    os.replace(f"{path}.tmp", path)
+
+
+def print_metrics_summary():
+    """Print the time spent in each stage of the run."""
+
+    with METRICS_LOCK:
+        histograms = {name: dict(histogram) for name, histogram in HISTOGRAMS.items()}
+        counters = dict(COUNTERS)
+
+    if not histograms and not counters:
+        return
+
+    total = sum(histogram['sum'] for histogram in histograms.values())
+
+    print("Time per stage:")
+    for name, histogram in sorted(histograms.items(), key=lambda item: -item[1]['sum']):
+        share = histogram['sum'] / total * 100 if total else 0
+        print(f" > {name:<10} {histogram['sum']:8.2f}s {share:5.1f}% "
+              f"({histogram['count']} calls, {histogram['sum'] / histogram['count'] * 1000:.0f} ms avg)")
+
+    for name, value in sorted(counters.items()):
+        print(f" > {name}: {value:g}")
@@ -0,0 +1,119 @@
+import hashlib
+import io
+import json
+
+import numpy as np
+from PIL import Image
+from selenium import webdriver
+
+from src.models.Resolution import Resolution
+from src.services.device_emulation import clear_emulation, emulate_resolution
+
+# Max part of the fingerprint bits that may differ for a page to count as unchanged
+CHANGE_THRESHOLD = 0.1
+
+# dHash of the viewport, THUMBNAIL_SIZE x THUMBNAIL_SIZE bits
+THUMBNAIL_SIZE = 16
+
+# Words and tags hashed together, so that a moved block changes the hash too
+SHINGLE_SIZE = 3
+
+# Every crawl fingerprints the page at this viewport, whatever the window size,
+# so that the thumbnails of two crawls are always comparable
+FINGERPRINT_RESOLUTION = Resolution(name='fingerprint', width=1280, height=800)
+
+# Long pages are fingerprinted on their beginning only
+MAX_TEXT_LENGTH = 200_000
+
+# Visible text and element structure of the page, in a single round trip.
+# Element ids and classes are left out: many sites generate them on every load.
+FINGERPRINT_SCRIPT = """
+const body = document.body;
+if (!body) return null;
+
+const tags = [];
+for (const element of body.getElementsByTagName('*')) {
+    tags.push(element.tagName + (element.children.length ? '>' : ''));
+}
+
+return {
+    text: body.innerText.slice(0, arguments[0]),
+    tags: tags,
+    viewport: [window.innerWidth, window.innerHeight],
+};
+"""
+
+
+def get_simhash(tokens: list[str]) -> str:
+    """64 bits SimHash of the shingles of tokens: close token lists get close hashes."""
+
+    shingles = [' '.join(tokens[i:i + SHINGLE_SIZE]) for i in range(max(1, len(tokens) - SHINGLE_SIZE + 1))]
+    digests = b''.join(hashlib.blake2b(shingle.encode(), digest_size=8).digest() for shingle in shingles)
+
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(-1, 8), axis=1)
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 - len(shingles)
+
+    return np.packbits(votes > 0).tobytes().hex()
+
+
+def get_thumbnail_hash(png: bytes) -> str:
+    """dHash of the viewport screenshot."""
+
+    with Image.open(io.BytesIO(png)) as image:
+        thumbnail = image.convert('L').resize((THUMBNAIL_SIZE + 1, THUMBNAIL_SIZE), Image.BOX)
+
+    pixels = np.asarray(thumbnail, dtype=np.int16)
+    return np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes().hex()
+
+
+def get_page_fingerprint(driver: webdriver.Chrome) -> dict | None:
+    """Fingerprint the loaded page: SimHash of its text and DOM structure, dHash of its viewport.
+
+    Much cheaper than a capture: one script, one viewport screenshot, taken
+    at FINGERPRINT_RESOLUTION. The emulation is cleared afterwards, captures
+    set their own window size or emulation.
+    Returns None when the page has no body.
+    """
+
+    emulate_resolution(driver, FINGERPRINT_RESOLUTION)
+    try:
+        page = driver.execute_script(FINGERPRINT_SCRIPT, MAX_TEXT_LENGTH)
+        if page is None:
+            return None
+
+        return {
+            "text": get_simhash(page['text'].split()),
+            "dom": get_simhash(page['tags']),
+            "thumbnail": get_thumbnail_hash(driver.get_screenshot_as_png()),
+            "viewport": page['viewport'],
+        }
+    finally:
+        clear_emulation(driver)
+
+
+def get_hash_distance(a: str, b: str) -> float:
+    """Part of the bits that differ between two hex hashes."""
+
+    xor = np.frombuffer(bytes.fromhex(a), dtype=np.uint8) ^ np.frombuffer(bytes.fromhex(b), dtype=np.uint8)
+    return int(np.unpackbits(xor).sum()) / (len(xor) * 8)
+
+
+def get_page_difference(previous: str | dict | None, current: dict | None) -> float:
+    """Difference between two fingerprints, from 0 (same page) to 1.
+
+    The largest difference of the text, DOM and viewport hashes. Viewport
+    thumbnails taken at another window size are not comparable and left out.
+    previous may be the JSON stored in the manifest.
+    """
+
+    if previous is None or current is None:
+        return 1.0
+
+    if isinstance(previous, str):
+        previous = json.loads(previous)
+
+    keys = ['text', 'dom']
+    if previous['viewport'] == current['viewport']:
+        keys.append('thumbnail')
+
+    return max(get_hash_distance(previous[key], current[key]) for key in keys)
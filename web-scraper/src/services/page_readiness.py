@@ -0,0 +1,185 @@
+import threading
+
+from selenium import webdriver
+from selenium.common import TimeoutException
+
+from src.services.metrics import span
+
+READY_TIMEOUT_S = 10
+NETWORK_IDLE_MS = 500
+STABLE_FRAMES = 5
+
+# Chrome's default resource timing buffer, entries past it are dropped
+RESOURCE_BUFFER_SIZE = 250
+
+# Resolves once the document is complete, no resource finished loading for
+# idleMs, every image in the viewport is decoded, fonts are loaded and the
+# layout did not move for stableFrames animation frames (or on timeout).
+READINESS_SCRIPT = """
+const [timeoutMs, idleMs, stableFrames, defaultBufferSize, done] = arguments;
+const start = performance.now();
+
+// a full timing buffer misses the latest responses: only trust the ones observed from now on
+const entries = performance.getEntriesByType('resource');
+let lastEnd = entries.length >= defaultBufferSize
+    ? start
+    : entries.reduce((end, entry) => Math.max(end, entry.responseEnd), 0);
+
+try { performance.setResourceTimingBufferSize(100000); } catch (e) {}
+
+// observers get every entry, even once the buffer is full
+let resources = null;
+try {
+    resources = new PerformanceObserver((list) => {
+        list.getEntries().forEach((entry) => { lastEnd = Math.max(lastEnd, entry.responseEnd); });
+    });
+    resources.observe({type: 'resource'});
+} catch (e) {}
+
+let shifts = 0;
+let observer = null;
+try {
+    observer = new PerformanceObserver((list) => { shifts += list.getEntries().length; });
+    observer.observe({type: 'layout-shift', buffered: true});
+} catch (e) {}
+
+let lastShifts = -1;
+let lastHeight = -1;
+let stable = 0;
+let finished = false;
+
+function lastResponseEnd() {
+    if (resources) return lastEnd;
+
+    const entries = performance.getEntriesByType('resource');
+    return entries.reduce((end, entry) => Math.max(end, entry.responseEnd), lastEnd);
+}
+
+function imagesDecoded() {
+    return Array.from(document.images).every((img) => {
+        const rect = img.getBoundingClientRect();
+        const visible = rect.bottom > 0 && rect.top < window.innerHeight && rect.width > 0;
+        return !visible || (img.complete && (img.naturalWidth > 0 || !img.currentSrc));
+    });
+}
+
+function finish(timedOut) {
+    if (finished) return;
+    finished = true;
+    if (observer) observer.disconnect();
+    if (resources) resources.disconnect();
+    done({
+        waited_ms: performance.now() - start,
+        timed_out: timedOut,
+        ready_state: document.readyState,
+        network_idle: performance.now() - lastResponseEnd() >= idleMs,
+        images_decoded: imagesDecoded(),
+        fonts_loaded: !document.fonts || document.fonts.status === 'loaded',
+        stable_frames: stable,
+    });
+}
+
+function tick() {
+    if (finished) return;
+
+    const now = performance.now();
+    if (now - start >= timeoutMs) {
+        return finish(true);
+    }
+
+    const height = document.documentElement.scrollHeight;
+    stable = (shifts === lastShifts && height === lastHeight) ? stable + 1 : 0;
+    lastShifts = shifts;
+    lastHeight = height;
+
+    const ready = document.readyState === 'complete'
+        && now - lastResponseEnd() >= idleMs
+        && imagesDecoded()
+        && (!document.fonts || document.fonts.status === 'loaded')
+        && stable >= stableFrames;
+
+    if (ready) {
+        return finish(false);
+    }
+
+    requestAnimationFrame(tick);
+}
+
+// requestAnimationFrame is not fired on hidden pages, the timer is a safety net
+setTimeout(() => finish(true), timeoutMs + 100);
+requestAnimationFrame(tick);
+"""
+
+# Totals of the waits of the run, to compare against the fixed sleeps they replace
+READINESS_TOTALS = {
+    "waits": 0,
+    "waited": 0.0,
+    "baseline": 0.0,
+    "timed_out": 0,
+}
+READINESS_LOCK = threading.Lock()
+
+
+def wait_for_page_ready(driver: webdriver.Chrome,
+                        url: str,
+                        stage: str = 'load',
+                        timeout: float = READY_TIMEOUT_S,
+                        baseline: float = 0,
+                        network_idle_ms: int = NETWORK_IDLE_MS,
+                        stable_frames: int = STABLE_FRAMES) -> dict:
+    """Wait until the page is rendered and stable, at most timeout seconds.
+
+    baseline is the fixed sleep this wait replaces, it is only recorded to
+    measure the time saved.
+    """
+
+    driver.set_script_timeout(timeout + 5)
+
+    try:
+        with span('wait', stage=stage):
+            report = driver.execute_async_script(
+                READINESS_SCRIPT,
+                int(timeout * 1000),
+                network_idle_ms,
+                stable_frames,
+                RESOURCE_BUFFER_SIZE,
+            )
+    except TimeoutException:
+        report = {"waited_ms": timeout * 1000, "timed_out": True}
+
+    report['url'] = url
+    report['stage'] = stage
+    report['waited'] = report['waited_ms'] / 1000
+    report['baseline'] = baseline
+
+    with READINESS_LOCK:
+        READINESS_TOTALS['waits'] += 1
+        READINESS_TOTALS['waited'] += report['waited']
+        READINESS_TOTALS['baseline'] += baseline
+        READINESS_TOTALS['timed_out'] += int(bool(report['timed_out']))
+
+    status = "timed out" if report['timed_out'] else "ready"
+    print(f" > Page {status} after {report['waited']:.2f}s ({stage})")
+
+    return report
+
+
+def print_readiness_summary():
+    """Print the time spent waiting for pages against the fixed sleeps it replaces."""
+
+    with READINESS_LOCK:
+        totals = dict(READINESS_TOTALS)
+
+    if totals['waits'] == 0:
+        return
+
+    print(f"Readiness: {totals['waits']} waits, {totals['waited']:.1f}s waited, "
+          f"{totals['baseline']:.1f}s with fixed sleeps ({totals['baseline'] - totals['waited']:+.1f}s saved), "
+          f"{totals['timed_out']} timed out.")
+
+
+def reset_readiness_summary():
+    """Start the totals again, e.g. between two runs of a long-lived process."""
+
+    with READINESS_LOCK:
+        READINESS_TOTALS.update(waits=0, waited=0.0, baseline=0.0, timed_out=0)
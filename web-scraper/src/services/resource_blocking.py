@@ -0,0 +1,120 @@
+import json
+
+from selenium import webdriver
+from selenium.common import WebDriverException
+
+from src.services.metrics import increment
+
+BLOCKING_CONFIG = 'config/blocking.json'
+DEFAULT_PROFILE = 'none'
+
+# Network.setBlockedURLs only matches URLs, so resource types are blocked by extension
+TYPE_PATTERNS = {
+    'media': ['*.mp4', '*.mp4?*', '*.webm', '*.webm?*', '*.m3u8*', '*.mpd', '*.mpd?*', '*.ogv*', '*.mov', '*.mov?*'],
+    'font': ['*.woff', '*.woff?*', '*.woff2', '*.woff2?*', '*.ttf', '*.ttf?*', '*.otf', '*.otf?*'],
+    'script': ['*.js', '*.js?*'],
+}
+
+
+def load_blocking_profile(name: str, path: str = BLOCKING_CONFIG) -> list[str]:
+    """Return the URL patterns blocked by a profile of config/blocking.json, with the profiles it extends.
+
+    A profile blocks third-party domains (and their subdomains), URL patterns
+    ('*' wildcards) and resource types (see TYPE_PATTERNS). Patterns match
+    first-party URLs too: they name the files of known ad and tracker
+    scripts, never generic paths like /ads/ that sites use for their content.
+    """
+
+    with open(path, 'r') as f:
+        profiles = json.load(f)
+
+    patterns = []
+    for profile in get_profile_chain(profiles, name):
+        for domain in profile.get('domains', []):
+            suffix = '*' if '/' in domain else '/*'
+            patterns += [f"*://{domain}{suffix}", f"*.{domain}{suffix}"]
+
+        patterns += profile.get('patterns', [])
+
+        for resource_type in profile.get('types', []):
+            patterns += TYPE_PATTERNS[resource_type]
+
+    return list(dict.fromkeys(patterns))
+
+
+def get_profile_chain(profiles: dict, name: str) -> list[dict]:
+    if name not in profiles:
+        raise ValueError(f"Unknown blocking profile {name}, available: {', '.join(profiles)}")
+
+    chain = []
+    for parent in profiles[name].get('extends', []):
+        chain += get_profile_chain(profiles, parent)
+
+    return chain + [profiles[name]]
+
+
+def enable_network_log(options: webdriver.ChromeOptions):
+    """Record the network events of the browser, read back by get_network_stats."""
+    options.set_capability('goog:loggingPrefs', {'performance': 'ALL'})
+
+
+def apply_blocking(driver: webdriver.Chrome, patterns: list[str]):
+    """Block the requests matching the patterns in the tab, for every following page load."""
+
+    driver.execute_cdp_cmd('Network.enable', {})
+    driver.execute_cdp_cmd('Network.setBlockedURLs', {"urls": patterns})
+
+
+def reset_network_stats(driver: webdriver.Chrome):
+    """Drop the network events recorded so far, before loading a page."""
+
+    try:
+        driver.get_log('performance')
+    except (WebDriverException, ValueError):
+        pass
+
+
+def get_network_stats(driver: webdriver.Chrome) -> dict | None:
+    """Count the requests and bytes loaded and blocked since the last call.
+
+    Needs enable_network_log on the browser options, returns None otherwise.
+    Blocked requests are never sent, so their size is unknown: only the
+    bytes actually transferred are counted.
+    """
+
+    try:
+        entries = driver.get_log('performance')
+    except (WebDriverException, ValueError):
+        return None
+
+    stats = {"requests": 0, "blocked": 0, "failed": 0, "bytes": 0, "blocked_types": dict()}
+
+    for entry in entries:
+        message = json.loads(entry['message'])['message']
+        method, params = message.get('method'), message.get('params', {})
+
+        if method == 'Network.requestWillBeSent':
+            stats['requests'] += 1
+        elif method == 'Network.loadingFinished':
+            stats['bytes'] += int(params.get('encodedDataLength', 0))
+        elif method == 'Network.loadingFailed' and params.get('blockedReason') == 'inspector':
+            resource_type = params.get('type', 'Other')
+            stats['blocked'] += 1
+            stats['blocked_types'][resource_type] = stats['blocked_types'].get(resource_type, 0) + 1
+        elif method == 'Network.loadingFailed':
+            stats['failed'] += 1
+
+    increment('requests', stats['requests'])
+    increment('blocked_requests', stats['blocked'])
+    increment('transferred_bytes', stats['bytes'])
+
+    return stats
+
+
+def print_network_stats(stats: dict | None):
+    if stats is None:
+        return
+
+    types = ', '.join(f"{count} {resource_type}" for resource_type, count in sorted(stats['blocked_types'].items()))
+    print(f" > Network: {stats['requests']} requests, {stats['bytes'] / 1024:.0f} KB, "
+          f"{stats['blocked']} blocked{f' ({types})' if types else ''}")
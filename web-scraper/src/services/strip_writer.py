@@ -0,0 +1,267 @@
+import os
+import struct
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+from PIL import Image
+
+from src.services.resampling import to_css_pixels
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# Compressed data is written in IDAT chunks of this size
+IDAT_CHUNK_SIZE = 1 << 16
+
+
+class StripWriter(ABC):
+    """Receive the stitched page top to bottom, one horizontal strip at a time.
+
+    Strips are in device pixels and converted to CSS pixels (width x rows /
+    pixel_ratio). Rows past max_height (CSS pixels) are dropped and full is
+    set, so that the stitcher can stop scrolling. A strip shorter than a CSS
+    pixel is kept and written with the next one.
+    close returns the page, abort drops it when the stitcher fails.
+    """
+
+    def __init__(self, width: int, pixel_ratio: float = 1, max_height: int | None = None):
+        self.width = width
+        self.pixel_ratio = pixel_ratio
+        self.max_height = max_height
+
+        self.height = 0
+        self.device_rows = 0
+        self.full = False
+
+        # device rows not written yet, less than a CSS pixel
+        self.pending: Image.Image | None = None
+
+    def write(self, strip: Image.Image):
+        if self.full or strip.height == 0:
+            return
+
+        strip = self.to_css_pixels(strip)
+        if strip is None:
+            return
+
+        if self.max_height is not None and self.height + strip.height >= self.max_height:
+            strip = strip.crop((0, 0, self.width, self.max_height - self.height))
+            self.full = True
+
+        if strip.height > 0:
+            self.write_rows(strip.convert('RGB'))
+            self.height += strip.height
+
+    def to_css_pixels(self, strip: Image.Image) -> Image.Image | None:
+        # rounding the running total, not each strip, so that no row is lost between strips
+        self.device_rows += strip.height
+        height = round(self.device_rows / self.pixel_ratio) - self.height
+
+        if self.pending is not None:
+            merged = Image.new('RGB', (strip.width, self.pending.height + strip.height))
+            merged.paste(self.pending, (0, 0))
+            merged.paste(strip, (0, self.pending.height))
+            strip, self.pending = merged, None
+
+        if height <= 0:
+            self.pending = strip
+            return None
+
+        if strip.size == (self.width, height):
+            return strip
+
+        return to_css_pixels(strip, (self.width, height))
+
+    @abstractmethod
+    def write_rows(self, strip: Image.Image):
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    def abort(self):
+        """Drop the page written so far, when the stitcher fails mid-page."""
+
+
+class CanvasWriter(StripWriter):
+    """Keep the strips in memory and resample the page once when closed."""
+
+    def __init__(self, width: int, pixel_ratio: float = 1, max_height: int | None = None):
+        super().__init__(width, pixel_ratio, max_height)
+        self.strips: list[Image.Image] = []
+        self.image: Image.Image | None = None
+
+    def write(self, strip: Image.Image):
+        if self.full or strip.height == 0:
+            return
+
+        if self.max_height is not None:
+            remaining = round(self.max_height * self.pixel_ratio) - self.device_rows
+
+            if strip.height >= remaining:
+                strip = strip.crop((0, 0, strip.width, remaining))
+                self.full = True
+
+        self.write_rows(strip)
+        self.device_rows += strip.height
+
+    def write_rows(self, strip: Image.Image):
+        # device pixels, resampled once when closed
+        self.strips.append(strip)
+
+    def close(self) -> Image.Image:
+        canvas = Image.new('RGB', (self.strips[0].width, self.device_rows))
+        total_height = 0
+
+        for strip in self.strips:
+            canvas.paste(strip, (0, total_height))
+            total_height += strip.height
+
+        self.strips = []
+
+        # back to CSS pixels, like the other stitchers
+        if self.pixel_ratio != 1:
+            canvas = to_css_pixels(canvas, (self.width, round(total_height / self.pixel_ratio)))
+
+        self.height = canvas.height
+        self.image = canvas
+        return canvas
+
+    def abort(self):
+        self.strips = []
+
+
+class PngStreamWriter(StripWriter):
+    """Encode the strips into a PNG file as they arrive, without keeping the page in memory.
+
+    Rows use the PNG 'Up' filter, computed with NumPy. The image height is
+    only known at the end, so the header is written again when closing.
+    The file is written next to its destination and renamed once complete.
+    """
+
+    def __init__(self,
+                 path: str,
+                 width: int,
+                 pixel_ratio: float = 1,
+                 max_height: int | None = None,
+                 compress_level: int = 6):
+        super().__init__(width, pixel_ratio, max_height)
+        self.path = path
+        self.paths = [path]
+
+        self.file = open(f"{path}.tmp", 'wb')
+        self.file.write(PNG_SIGNATURE)
+        self.write_chunk(b'IHDR', self.get_header())
+
+        self.compressor = zlib.compressobj(compress_level)
+        self.buffer = bytearray()
+        self.previous_row = np.zeros(width * 3, dtype=np.uint8)
+
+    def get_header(self) -> bytes:
+        # 8 bits per channel, truecolor, no interlace
+        return struct.pack('>IIBBBBB', self.width, self.height, 8, 2, 0, 0, 0)
+
+    def write_chunk(self, chunk_type: bytes, data: bytes):
+        self.file.write(struct.pack('>I', len(data)))
+        self.file.write(chunk_type)
+        self.file.write(data)
+        self.file.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+    def write_rows(self, strip: Image.Image):
+        rows = np.asarray(strip, dtype=np.uint8).reshape(strip.height, self.width * 3)
+
+        # 'Up' filter: difference with the row above, modulo 256
+        above = np.vstack([self.previous_row[np.newaxis], rows[:-1]])
+        filtered = np.empty((strip.height, self.width * 3 + 1), dtype=np.uint8)
+        filtered[:, 0] = 2
+        filtered[:, 1:] = rows - above
+
+        self.previous_row = rows[-1].copy()
+        self.buffer += self.compressor.compress(filtered.tobytes())
+
+        while len(self.buffer) >= IDAT_CHUNK_SIZE:
+            self.write_chunk(b'IDAT', bytes(self.buffer[:IDAT_CHUNK_SIZE]))
+            del self.buffer[:IDAT_CHUNK_SIZE]
+
+    def close(self) -> list[str]:
+        self.buffer += self.compressor.flush()
+        self.write_chunk(b'IDAT', bytes(self.buffer))
+        self.write_chunk(b'IEND', b'')
+
+        self.file.seek(len(PNG_SIGNATURE))
+        self.write_chunk(b'IHDR', self.get_header())
+        self.file.close()
+
+        os.replace(f"{self.path}.tmp", self.path)
+        return self.paths
+
+    def abort(self):
+        self.file.close()
+        os.remove(f"{self.path}.tmp")
+
+
+class TileWriter(StripWriter):
+    """Cut the page into fixed-height tiles, each saved as soon as it is complete.
+
+    Tiles of screenshot.png are named screenshot-000.png, screenshot-001.png...
+    """
+
+    def __init__(self,
+                 path: str,
+                 width: int,
+                 tile_height: int,
+                 pixel_ratio: float = 1,
+                 max_height: int | None = None):
+        super().__init__(width, pixel_ratio, max_height)
+        self.root, self.extension = os.path.splitext(path)
+        self.tile_height = tile_height
+        self.paths: list[str] = []
+
+        self.tile = Image.new('RGB', (width, tile_height))
+        self.tile_rows = 0
+
+    def write_rows(self, strip: Image.Image):
+        offset = 0
+
+        while offset < strip.height:
+            rows = min(strip.height - offset, self.tile_height - self.tile_rows)
+            self.tile.paste(strip.crop((0, offset, self.width, offset + rows)), (0, self.tile_rows))
+
+            offset += rows
+            self.tile_rows += rows
+
+            if self.tile_rows == self.tile_height:
+                self.save_tile()
+
+    def save_tile(self):
+        path = f"{self.root}-{len(self.paths):03d}{self.extension}"
+        self.tile.crop((0, 0, self.width, self.tile_rows)).save(path)
+        self.paths.append(path)
+        self.tile_rows = 0
+
+    def close(self) -> list[str]:
+        if self.tile_rows > 0:
+            self.save_tile()
+
+        return self.paths
+
+    def abort(self):
+        # the first tiles of the page are useless without the others
+        for path in self.paths:
+            os.remove(path)
+
+        self.paths = []
+
+
+def open_strip_writer(path: str,
+                      width: int,
+                      pixel_ratio: float = 1,
+                      tile_height: int | None = None,
+                      max_height: int | None = None) -> StripWriter:
+    """Stream the page to a single PNG, or to fixed-height tiles when tile_height is set."""
+
+    if tile_height:
+        return TileWriter(path, width, tile_height, pixel_ratio, max_height)
+
+    return PngStreamWriter(path, width, pixel_ratio, max_height)
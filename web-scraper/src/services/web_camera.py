@@ -1,19 +1,41 @@
+import io
 import os
-import time
+
+from PIL import Image
 
 import selenium
 from selenium import webdriver
 from selenium.common import WebDriverException
 
 from src.models.Resolution import Resolution
+from src.services.capture_engine import capture_full_page
+from src.services.dom_labels import collect_boxes, to_yolo_lines, write_labels
+from src.services.image_encoder import ImageEncoder, save_image
+from src.services.metrics import increment, set_metrics_context, span
+from src.services.page_readiness import READY_TIMEOUT_S, wait_for_page_ready
+from src.services.resource_blocking import apply_blocking, get_network_stats, print_network_stats, reset_network_stats
 
 
 def take_screenshots(driver: webdriver.Chrome,
                     url: str,
                     output_folder: str,
                     resolution: list[Resolution],
-                    fullscreen: bool = False):
-    """Take a screenshot of the specified URL using the specified driver."""
+                    fullscreen: bool = False,
+                    engine: str = 'stitch',
+                    ready_timeout: float = READY_TIMEOUT_S,
+                    label_classes: dict[str, str] | None = None,
+                    block_patterns: list[str] | None = None,
+                    encoder: ImageEncoder | None = None) -> dict | None:
+    """Take a screenshot of the specified URL using the specified driver.
+
+    In fullscreen mode, the cdp-fullpage engine captures the whole page in one
+    DevTools call instead of growing the window to the page height.
+    With label_classes, YOLO labels are written next to each screenshot.
+    With block_patterns (see load_blocking_profile), matching requests are
+    blocked. With an encoder, screenshots are encoded in its format in the
+    background. Returns the network stats of the page load, when the browser
+    records its performance log.
+    """
 
     # Create a slug from the URL to use as a filename
     url_slug = (url
@@ -21,30 +43,40 @@ def take_screenshots(driver: webdriver.Chrome,
                 .replace("http://", "")
                 .replace("/", "_"))
 
+    if block_patterns:
+        apply_blocking(driver, block_patterns)
+
     # Load the specified URL
     try:
         print(f"Loading URL {url}...")
         driver.set_page_load_timeout(20)
-        driver.get(url)
+        reset_network_stats(driver)
+        set_metrics_context(url=url)
+        with span('load'):
+            driver.get(url)
     except selenium.common.exceptions.TimeoutException:
         print(f"TimeoutException for URL {url}...")
         return
 
     # Wait for the page to load
-    time.sleep(3)
+    wait_for_page_ready(driver, url, 'load', ready_timeout, baseline=3)
+
+    network = get_network_stats(driver)
+    print_network_stats(network)
 
     for resolution in resolution:
         # Take the full size screenshot
         print(f"Taking screenshot {resolution['width']}x{resolution['height']}...")
+        set_metrics_context(url=url, resolution=resolution['name'])
 
-        if fullscreen:
-            height = driver.execute_script('return document.documentElement.scrollHeight')
-            width = driver.execute_script('return document.documentElement.scrollWidth')
-            driver.set_window_size(width, height * 2)  # the trick
+        if fullscreen and engine == 'cdp-fullpage':
+            driver.set_window_size(resolution['width'], resolution['height'])
+        elif fullscreen:
+            grow_window_to_page(driver)
         else:
             driver.set_window_size(resolution['width'], resolution['height'])
 
-        time.sleep(3)
+        wait_for_page_ready(driver, url, 'resize', ready_timeout, baseline=3)
         output = f"{output_folder}/{url_slug}-{resolution['width']}x{resolution['height']}-{resolution['name']}.png"
 
         # check if folder exists
@@ -52,13 +84,49 @@ def take_screenshots(driver: webdriver.Chrome,
             os.makedirs(output_folder)
 
         # remove the file if it already exists
+        if encoder is not None:
+            output = encoder.get_path(output)
         if os.path.exists(output):
             os.remove(output)
 
-        driver.save_screenshot(output)
+        screenshot = None
+        if fullscreen and engine == 'cdp-fullpage':
+            screenshot = capture_full_page(driver, driver.execute_script("return window.devicePixelRatio || 1;"))
+
+            if screenshot is None:
+                print("Falling back to window resize ...")
+                grow_window_to_page(driver)
+                wait_for_page_ready(driver, url, 'resize', ready_timeout, baseline=3)
+
+        png = None
+        if screenshot is None:
+            with span('capture'):
+                png = driver.get_screenshot_as_png()
+            increment('frames')
+
+            screenshot = Image.open(io.BytesIO(png))
+
+        with span('save'):
+            # a browser screenshot is already encoded as PNG
+            output = save_image(png if png is not None else screenshot, output, encoder)
+        increment('screenshots')
         print(f"Screenshot successfully saved to {output}")
 
         # check if file exists
-        if not os.path.exists(output):
+        if encoder is None and not os.path.exists(output):
             print(f"Screenshot {output} does not exist!")
             raise Exception(f"Screenshot {output} does not exist!")
+
+        if label_classes is not None:
+            page = collect_boxes(driver, label_classes)
+            width, height = screenshot.size
+            write_labels(output, to_yolo_lines(page, width, height, page['scroll_y']))
+
+    return network
+
+
+def grow_window_to_page(driver: webdriver.Chrome):
+    """Resize the window so the whole page fits in a single viewport screenshot."""
+    height = driver.execute_script('return document.documentElement.scrollHeight')
+    width = driver.execute_script('return document.documentElement.scrollWidth')
+    driver.set_window_size(width, height * 2)  # the trick
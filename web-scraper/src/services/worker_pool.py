@@ -0,0 +1,154 @@
+import queue
+import threading
+import time
+from typing import Callable
+
+from selenium import webdriver
+from selenium.common import WebDriverException
+
+from src.services.chrome_driver import is_browser_alive
+
+
+def get_domain(url: str) -> str:
+    return url.split('/')[2]
+
+
+class WorkerPool:
+    """Run capture jobs on several isolated Chrome instances pulling from a shared queue.
+
+    Each job is a dict with at least an 'url' key. At most max_per_domain jobs
+    of the same domain run at the same time, and a worker whose driver crashed
+    restarts it and puts its job back in the queue.
+    """
+
+    def __init__(self,
+                 nb_workers: int,
+                 create_driver: Callable[[int], webdriver.Chrome],
+                 capture: Callable[[webdriver.Chrome, dict], None],
+                 max_per_domain: int = 2,
+                 max_attempts: int = 3):
+        self.nb_workers = nb_workers
+        self.create_driver = create_driver
+        self.capture = capture
+        self.max_per_domain = max_per_domain
+        self.max_attempts = max_attempts
+
+        self.jobs = queue.Queue()
+        self.domains: dict[str, threading.BoundedSemaphore] = dict()
+        self.lock = threading.Lock()
+
+        self.done: list[dict] = []
+        self.failed: list[dict] = []
+
+    def run(self, jobs: list[dict]):
+        for job in jobs:
+            self.jobs.put(job)
+
+        workers = [
+            threading.Thread(target=self.work, args=(worker_id,), name=f"worker-{worker_id}")
+            for worker_id in range(self.nb_workers)
+        ]
+
+        for worker in workers:
+            worker.start()
+
+        # Wait for the queue to be drained, unless every worker died
+        while self.jobs.unfinished_tasks and any(worker.is_alive() for worker in workers):
+            time.sleep(0.5)
+
+        # Wake up idle workers so they can exit
+        for _ in workers:
+            self.jobs.put(None)
+
+        for worker in workers:
+            worker.join()
+
+        # Jobs left behind when no worker could start Chrome anymore
+        while not self.jobs.empty():
+            job = self.jobs.get()
+            if job is not None:
+                self.fail(job, Exception("No Chrome driver available"))
+
+        print(f"Worker pool finished: {len(self.done)} done, {len(self.failed)} failed.")
+
+    def work(self, worker_id: int):
+        print(f"[worker-{worker_id}] Initializing Chrome driver...")
+        try:
+            driver = self.create_driver(worker_id)
+        except WebDriverException as e:
+            print(f"[worker-{worker_id}] Unable to start Chrome: {e}")
+            return
+
+        try:
+            while True:
+                job = self.jobs.get()
+
+                if job is None:
+                    self.jobs.task_done()
+                    return
+
+                domain = self.get_domain_slot(get_domain(job['url']))
+
+                # Domain already at its concurrency limit, try another job first
+                if not domain.acquire(blocking=False):
+                    self.jobs.put(job)
+                    self.jobs.task_done()
+                    time.sleep(0.1)
+                    continue
+
+                try:
+                    self.capture(driver, job)
+                    self.record(self.done, job)
+                except WebDriverException as e:
+                    if is_browser_alive(driver):
+                        self.fail(job, e)
+                    else:
+                        print(f"[worker-{worker_id}] Driver crashed, restarting Chrome...")
+                        self.retry(job, e)
+                        driver = self.restart_driver(driver, worker_id)
+
+                        if driver is None:
+                            return
+                except Exception as e:
+                    self.fail(job, e)
+                finally:
+                    domain.release()
+                    self.jobs.task_done()
+        finally:
+            if driver is not None:
+                driver.quit()
+
+    def get_domain_slot(self, domain: str) -> threading.BoundedSemaphore:
+        with self.lock:
+            if domain not in self.domains:
+                self.domains[domain] = threading.BoundedSemaphore(self.max_per_domain)
+            return self.domains[domain]
+
+    def restart_driver(self, driver: webdriver.Chrome, worker_id: int) -> webdriver.Chrome | None:
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+        try:
+            return self.create_driver(worker_id)
+        except WebDriverException as e:
+            print(f"[worker-{worker_id}] Unable to restart Chrome: {e}")
+            return None
+
+    def retry(self, job: dict, error: Exception):
+        job['attempts'] = job.get('attempts', 0) + 1
+
+        if job['attempts'] < self.max_attempts:
+            self.jobs.put(job)
+        else:
+            self.fail(job, error)
+
+    def fail(self, job: dict, error: Exception):
+        print(f"An error occurred for {job['url']}: {error}")
+        job['error'] = str(error)
+        self.record(self.failed, job)
+
+    def record(self, results: list[dict], job: dict):
+        with self.lock:
+            results.append(job)